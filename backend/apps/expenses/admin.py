@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Expense, ExpenseSplit, Settlement
+from .models import Expense, ExpenseApproval, ExpenseSplit, FxRate, IdempotencyRecord, Settlement, PairBalance, Payment, UserBalanceSnapshot
 
 @admin.register(Expense)
 class ExpenseAdmin(admin.ModelAdmin):
@@ -24,6 +24,14 @@ class ExpenseSplitAdmin(admin.ModelAdmin):
     search_fields = ('expense__title', 'user__email', 'user__first_name', 'user__last_name')
     ordering = ('-expense__expense_date',)
 
+@admin.register(ExpenseApproval)
+class ExpenseApprovalAdmin(admin.ModelAdmin):
+    list_display = ('expense', 'user', 'status', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('expense__title', 'user__email')
+    readonly_fields = ('updated_at',)
+    raw_id_fields = ('expense', 'user')
+
 @admin.register(Settlement)
 class SettlementAdmin(admin.ModelAdmin):
     list_display = ('from_user', 'to_user', 'amount', 'currency', 'status', 'group', 'created_at')
@@ -38,3 +46,44 @@ class SettlementAdmin(admin.ModelAdmin):
         ('Details', {'fields': ('group', 'status', 'notes')}),
         ('Timestamps', {'fields': ('created_at', 'confirmed_at')}),
     )
+
+@admin.register(PairBalance)
+class PairBalanceAdmin(admin.ModelAdmin):
+    list_display = ('group', 'debtor', 'creditor', 'currency', 'amount', 'updated_at')
+    list_filter = ('currency',)
+    search_fields = ('group__name', 'debtor__email', 'creditor__email')
+    readonly_fields = ('updated_at',)
+    ordering = ('group', 'debtor', 'creditor')
+
+
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('transaction_id', 'payer', 'receiver', 'amount', 'payment_method', 'status', 'created_at')
+    list_filter = ('status', 'payment_method', 'settlement_type', 'created_at')
+    search_fields = ('transaction_id', 'payer__email', 'receiver__email')
+    readonly_fields = ('created_at', 'started_at', 'completed_at', 'result')
+    ordering = ('-created_at',)
+
+
+@admin.register(UserBalanceSnapshot)
+class UserBalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('user', 'currency', 'owed_to_others', 'owed_by_others', 'net', 'updated_at')
+    list_filter = ('currency',)
+    search_fields = ('user__email',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(IdempotencyRecord)
+class IdempotencyRecordAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'status_code', 'created_at')
+    search_fields = ('key', 'user__email')
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
+
+
+@admin.register(FxRate)
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ('date', 'base', 'quote', 'rate')
+    list_filter = ('base', 'quote')
+    date_hierarchy = 'date'
+    ordering = ('-date', 'base', 'quote')
@@ -0,0 +1,101 @@
+"""
+Balances between users, computed straight from approved expense splits.
+
+Every split is a debt of its user to the expense's payer. The splits are
+read in one `values_list` of (payer_id, user_id, amount in cents), with the
+cents computed by the database, and netted in integer cents; Decimals are
+only built at the end, one per result. Integer sums are exact, so every
+path here agrees with a Decimal sum of the same splits to the cent.
+
+A single user's balances need one pass over that user's rows, which plain
+Python does faster than it could copy them into arrays. The full
+member x member matrix of a group is vectorized when NumPy is installed:
+user ids are mapped to dense indices and the cents accumulated with
+`np.bincount`, which is exact while the cents add up to less than 2**53,
+and with `np.add.at` on int64 beyond that.
+
+The settlement summaries only need one user's row, so they use
+counterparty_balances; net_matrix is used by the benchmark_balances command
+(and is there for offline group analytics), not by any request path.
+"""
+import itertools
+from collections import defaultdict
+
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+
+from .money import from_cents
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+
+# Largest integer float64 (bincount's accumulator) still holds exactly
+EXACT_FLOAT_LIMIT = 2 ** 53
+
+
+def ledger_rows(splits):
+    """(payer_id, user_id, cents) for every split in the queryset"""
+    return list(splits.annotate(
+        cents=Cast(Round(F('amount') * 100), BigIntegerField())
+    ).values_list('expense__paid_by_id', 'user_id', 'cents'))
+
+
+def counterparty_balances(rows, user_id):
+    """
+    What the user owes each counterparty, net of what they owe the user.
+
+    Positive = the user owes them, negative = they owe the user. Settled
+    counterparties are left out. Rows not involving the user are ignored.
+    """
+    net = defaultdict(int)
+    for payer_id, debtor_id, cents in rows:
+        if debtor_id == user_id and payer_id != user_id:
+            net[payer_id] += cents
+        elif payer_id == user_id and debtor_id != user_id:
+            net[debtor_id] -= cents
+    return {other_id: from_cents(cents) for other_id, cents in net.items() if cents}
+
+
+def python_net_matrix(rows):
+    member_ids = sorted({user_id for payer_id, debtor_id, _ in rows for user_id in (payer_id, debtor_id)})
+    index = {user_id: i for i, user_id in enumerate(member_ids)}
+    matrix = [[0] * len(member_ids) for _ in member_ids]
+    for payer_id, debtor_id, cents in rows:
+        if payer_id != debtor_id:
+            matrix[index[debtor_id]][index[payer_id]] += cents
+    return member_ids, matrix
+
+
+def numpy_net_matrix(rows):
+    ledger = np.fromiter(
+        itertools.chain.from_iterable(rows), dtype=np.int64, count=3 * len(rows)
+    ).reshape(-1, 3)
+    payers, debtors, cents = ledger.T
+    member_ids, index = np.unique(np.concatenate([payers, debtors]), return_inverse=True)
+    size = len(member_ids)
+    # A payer's own share is no debt
+    cents = np.where(payers == debtors, 0, cents)
+    cells = index[len(rows):] * size + index[:len(rows)]
+
+    if np.abs(cents).sum() < EXACT_FLOAT_LIMIT:
+        matrix = np.bincount(cells, weights=cents, minlength=size * size).astype(np.int64)
+    else:
+        matrix = np.zeros(size * size, dtype=np.int64)
+        np.add.at(matrix, cells, cents)
+    return member_ids.tolist(), matrix.reshape(size, size)
+
+
+def net_matrix(rows):
+    """
+    (member ids, matrix) where matrix[i][j] is what member i owes member j
+    in cents, before netting against matrix[j][i].
+
+    The matrix is members x members, so build it for analytics on a group,
+    not for a single user's view (use counterparty_balances).
+    """
+    if np is not None:
+        return numpy_net_matrix(rows)
+    return python_net_matrix(rows)
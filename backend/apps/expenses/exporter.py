@@ -0,0 +1,138 @@
+"""
+Streaming export of a group's expenses and splits as CSV or NDJSON.
+
+Expenses are read with values() and .iterator(), a chunk at a time, and the
+splits of each chunk are fetched with one query. Only one chunk is held in
+memory however big the group is, and the first rows go out as soon as the
+first chunk has been read instead of after the whole group.
+
+The CSV columns include those the bulk import reads (`splits` as
+`user_id:amount;...`), so an export can be fed back into /api/expenses/bulk/.
+"""
+import csv
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+from .models import Expense, ExpenseSplit
+
+
+CHUNK_SIZE = 500
+
+EXPENSE_FIELDS = (
+    'id', 'title', 'description', 'amount', 'currency', 'group_id', 'paid_by_id',
+    'paid_by__email', 'split_type', 'expense_date', 'created_at', 'is_approved',
+)
+
+CSV_COLUMNS = (
+    'id', 'title', 'description', 'amount', 'currency', 'group_id', 'paid_by_id',
+    'paid_by_email', 'split_type', 'expense_date', 'created_at', 'is_approved',
+    'splits',
+)
+
+
+class CSVRenderer(BaseRenderer):
+    """Selects the CSV export (`?format=csv`); other responses become a one-row CSV"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, dict):
+            return b''
+        writer = csv.writer(Echo())
+        return (writer.writerow(data.keys()) + writer.writerow(data.values())).encode()
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Selects the NDJSON export (`?format=ndjson`); other responses become one JSON line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=DjangoJSONEncoder) + '\n').encode()
+
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+    
+    def write(self, value):
+        return value
+
+
+def iter_expense_chunks(group_id, chunk_size=CHUNK_SIZE):
+    """Yield lists of (expense dict, [split tuples]) for a group, oldest first"""
+    # (group, created_at) is indexed, so rows stream without sorting the group first
+    expenses = Expense.objects.filter(group_id=group_id).order_by('created_at', 'id').values(
+        *EXPENSE_FIELDS
+    ).iterator(chunk_size=chunk_size)
+    
+    chunk = []
+    for expense in expenses:
+        chunk.append(expense)
+        if len(chunk) >= chunk_size:
+            yield with_splits(chunk)
+            chunk = []
+    if chunk:
+        yield with_splits(chunk)
+
+
+def with_splits(expenses):
+    """Attach the splits of a chunk of expenses, read with a single query"""
+    splits = defaultdict(list)
+    split_rows = ExpenseSplit.objects.filter(
+        expense_id__in=[expense['id'] for expense in expenses]
+    ).order_by('expense_id', 'id').values_list('expense_id', 'user_id', 'amount', 'percentage')
+    for expense_id, user_id, amount, percentage in split_rows:
+        splits[expense_id].append((user_id, amount, percentage))
+    return [(expense, splits[expense['id']]) for expense in expenses]
+
+
+def stream_csv(group_id):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    
+    for chunk in iter_expense_chunks(group_id):
+        yield ''.join(
+            writer.writerow([
+                expense['id'],
+                expense['title'],
+                expense['description'],
+                expense['amount'],
+                expense['currency'],
+                expense['group_id'],
+                expense['paid_by_id'],
+                expense['paid_by__email'],
+                expense['split_type'],
+                expense['expense_date'].isoformat(),
+                expense['created_at'].isoformat(),
+                expense['is_approved'],
+                ';'.join(f"{user_id}:{amount}" for user_id, amount, _ in splits),
+            ])
+            for expense, splits in chunk
+        )
+
+
+def stream_ndjson(group_id):
+    encoder = DjangoJSONEncoder()
+    for chunk in iter_expense_chunks(group_id):
+        lines = []
+        for expense, splits in chunk:
+            expense['paid_by_email'] = expense.pop('paid_by__email')
+            expense['splits'] = [
+                {'user_id': user_id, 'amount': amount, 'percentage': percentage}
+                for user_id, amount, percentage in splits
+            ]
+            lines.append(encoder.encode(expense) + '\n')
+        yield ''.join(lines)
+
+
+STREAMS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
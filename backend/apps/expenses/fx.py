@@ -0,0 +1,91 @@
+"""
+Exchange rates for converting balances into one currency.
+
+Rates live in the FxRate table (load them with `python manage.py
+load_fx_rates`). The rate used for a date is the latest one stored on or
+before it. A pair with no stored rate is taken as the inverse of the
+opposite pair, or else crossed through FX_PIVOT_CURRENCY.
+
+Lookups go through an in-process LRU cache keyed by the rates version and
+(date, base, quote). The version is the time of the latest load
+(max(FxRate.updated_at), one indexed query per conversion), so every
+process stops using cached answers as soon as rates are reloaded, and the
+debt ETags change with it. Converting a summary costs at most one query per
+pair the first time and none after that. Callers aggregate per currency
+first and convert each total once; nothing here is ever called per split.
+"""
+import functools
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import FxRate
+from .money import Money
+
+
+FX_RATE_CACHE_SIZE = getattr(settings, 'FX_RATE_CACHE_SIZE', 4096)
+FX_PIVOT_CURRENCY = getattr(settings, 'FX_PIVOT_CURRENCY', 'USD')
+
+
+class RateNotFound(LookupError):
+    pass
+
+
+def is_currency_code(value):
+    return isinstance(value, str) and len(value) == 3 and value.isalpha() and value.isupper()
+
+
+def rates_version():
+    """When rates were last loaded (None if there are none)"""
+    return FxRate.objects.aggregate(version=Max('updated_at'))['version']
+
+
+@functools.lru_cache(maxsize=FX_RATE_CACHE_SIZE)
+def stored_rate(version, on_date, base, quote):
+    """The latest stored base -> quote rate on or before `on_date`, or None"""
+    return FxRate.objects.filter(
+        base=base, quote=quote, date__lte=on_date
+    ).order_by('-date').values_list('rate', flat=True).first()
+
+
+def direct_rate(version, on_date, base, quote):
+    if base == quote:
+        return Decimal(1)
+    rate = stored_rate(version, on_date, base, quote)
+    if rate is not None:
+        return rate
+    inverse = stored_rate(version, on_date, quote, base)
+    if inverse:
+        return 1 / inverse
+    return None
+
+
+def get_rate(version, on_date, base, quote):
+    """
+    How many units of `quote` one unit of `base` was worth on `on_date`,
+    as of the rates `version`
+    """
+    rate = direct_rate(version, on_date, base, quote)
+    if rate is None and FX_PIVOT_CURRENCY not in (base, quote):
+        to_pivot = direct_rate(version, on_date, base, FX_PIVOT_CURRENCY)
+        from_pivot = direct_rate(version, on_date, FX_PIVOT_CURRENCY, quote)
+        if to_pivot is not None and from_pivot is not None:
+            rate = to_pivot * from_pivot
+    if rate is None:
+        raise RateNotFound(f"No {base}/{quote} exchange rate on or before {on_date}")
+    return rate
+
+
+def rates_to(version, currencies, quote, on_date):
+    """{currency: rate into `quote`} for each distinct currency"""
+    return {currency: get_rate(version, on_date, currency, quote) for currency in set(currencies)}
+
+
+def convert(amount, rate):
+    """`amount` times `rate`, rounded half-up to the cent"""
+    return Money.of(amount * rate).to_decimal()
+
+
+def clear_cache():
+    stored_rate.cache_clear()
@@ -0,0 +1,99 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client that may retry a write sends a unique `Idempotency-Key` header.
+The first request with a key reserves it and runs the view; its response is
+stored, and every retry with the same key gets that response back without
+the view running again. Keys are scoped per user and expire after
+IDEMPOTENCY_KEY_TTL; `python manage.py purge_idempotency_records` sweeps
+expired rows for everyone.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    """Hash of what the request asks for, so a key reused for another request is caught"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    raw = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def replay(record, fingerprint):
+    if record is not None and record.fingerprint != fingerprint:
+        return Response({
+            'error': f'This {IDEMPOTENCY_KEY_HEADER} was already used for a different request'
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if record is None or record.status_code is None:
+        return Response({
+            'error': f'A request with this {IDEMPOTENCY_KEY_HEADER} is still being processed'
+        }, status=status.HTTP_409_CONFLICT)
+    
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Run the view at most once per (user, Idempotency-Key).
+
+    Requests without the header run as usual. With it, the view runs in the
+    same transaction as the key's record; server errors roll both back, so
+    the client can retry them for real.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({
+                'error': f'{IDEMPOTENCY_KEY_HEADER} must be at most {MAX_KEY_LENGTH} characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        user = request.user
+        fingerprint = request_fingerprint(request)
+        IdempotencyRecord.purge_expired(IDEMPOTENCY_KEY_TTL, user=user)
+        
+        # The key is reserved, the view runs and the outcome is stored in one
+        # transaction: a crash at any point leaves no key behind, and a
+        # retry never finds a write that committed without its record
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyRecord.objects.create(user=user, key=key, fingerprint=fingerprint)
+            except IntegrityError:
+                # An earlier request holds the key (a concurrent one makes this
+                # insert wait until it has committed or rolled back)
+                return replay(IdempotencyRecord.objects.filter(user=user, key=key).first(), fingerprint)
+            
+            response = view(request, *args, **kwargs)
+            
+            if response.status_code >= 500 or not hasattr(response, 'data'):
+                # Not stored, so the client can retry it for real
+                transaction.set_rollback(True)
+                return response
+            
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['status_code', 'response_body'])
+        return response
+    
+    return wrapper
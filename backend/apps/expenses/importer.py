@@ -0,0 +1,314 @@
+"""
+Bulk expense import from NDJSON or CSV.
+
+The request body is read line by line and rows are handled in chunks: each
+chunk is validated with the ExpenseCreateSerializer rules, then written with
+one bulk_create for its expenses and one for its splits. Group memberships
+and known user ids are cached for the whole import, so validating a row does
+not touch the database. Invalid rows are reported back with their row number
+and never stop the rest of the file.
+"""
+import csv
+import json
+import logging
+
+from django.db import DataError, IntegrityError, transaction
+from rest_framework import serializers
+
+from .models import Expense, ExpenseApproval, ExpenseSplit
+from .money import Money
+from .serializers import ExpenseCreateSerializer
+from .signals import bump_after_commit
+from apps.sync.models import ChangeLog
+from apps.sync.signals import record_after_commit
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+# Database errors a row can cause, with the message the client sees instead
+# of the driver's text (which names tables, columns and constraints)
+SAVE_ERRORS = (
+    (IntegrityError, "This row conflicts with existing data"),
+    (DataError, "A value in this row is out of range or too long"),
+)
+
+CONTENT_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/json-lines': 'ndjson',
+    'text/csv': 'csv',
+}
+
+
+class ImportRowError(Exception):
+    """A row that could not be parsed"""
+
+
+class ExpenseImportRowSerializer(ExpenseCreateSerializer):
+    """ExpenseCreateSerializer rules, with lookups served from the import's caches"""
+    
+    class Meta(ExpenseCreateSerializer.Meta):
+        # Receipts are file uploads and cannot be part of an import row
+        fields = tuple(
+            field for field in ExpenseCreateSerializer.Meta.fields if field != 'receipt_image'
+        )
+    
+    def validate_group_id(self, value):
+        if value is None:
+            return None
+        
+        members = self.context['importer'].group_members(value)
+        if members is None:
+            raise serializers.ValidationError("Group does not exist")
+        if self.context['request'].user.id not in members:
+            raise serializers.ValidationError("You are not a member of this group")
+        return value
+    
+    def validate(self, attrs):
+        # Split amounts (derived for percentage splits) follow the single-create rules
+        attrs = super().validate(attrs)
+        
+        user_ids = [split['user_id'] for split in attrs.get('splits', [])]
+        if len(set(user_ids)) != len(user_ids):
+            raise serializers.ValidationError({'splits': "A user appears in more than one split"})
+        
+        group_id = attrs.get('group_id')
+        if group_id is not None and user_ids:
+            members = self.context['importer'].group_members(group_id)
+            outsiders = sorted(set(user_ids) - members)
+            if outsiders:
+                raise serializers.ValidationError(
+                    {'splits': f"Users {outsiders} are not members of this group"}
+                )
+        return attrs
+
+
+def parse_ndjson(stream):
+    """Yield (row_number, data) for each non-blank line of an NDJSON stream"""
+    for row_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except (ValueError, UnicodeDecodeError) as e:
+            yield row_number, ImportRowError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(data, dict):
+            yield row_number, ImportRowError("Each line must be a JSON object")
+            continue
+        yield row_number, data
+
+
+def parse_csv_splits(value):
+    """
+    Parse the CSV `splits` column: either a JSON list of split objects or
+    `user_id:amount` pairs separated by semicolons (e.g. `2:10.00;3:5.50`).
+    """
+    value = value.strip()
+    if value.startswith('['):
+        return json.loads(value)
+    
+    splits = []
+    for pair in value.split(';'):
+        if not pair.strip():
+            continue
+        user_id, _, amount = pair.partition(':')
+        splits.append({'user_id': user_id.strip(), 'amount': amount.strip()})
+    return splits
+
+
+def parse_csv(stream):
+    """Yield (row_number, data) for each record of a CSV stream with a header row"""
+    lines = (line.decode('utf-8-sig') for line in stream)
+    reader = csv.DictReader(lines)
+    for row_number, record in enumerate(reader, start=1):
+        # Empty cells mean "not given" so optional fields fall back to their defaults
+        data = {
+            key.strip(): value for key, value in record.items()
+            if key and value not in (None, '')
+        }
+        if 'splits' in data:
+            try:
+                data['splits'] = parse_csv_splits(data['splits'])
+            except ValueError as e:
+                yield row_number, ImportRowError(f"Invalid splits: {e}")
+                continue
+        yield row_number, data
+
+
+PARSERS = {
+    'ndjson': parse_ndjson,
+    'csv': parse_csv,
+}
+
+
+class ExpenseImporter:
+    """Validate and insert expense rows for one user, one chunk at a time"""
+    
+    def __init__(self, request, chunk_size=CHUNK_SIZE):
+        self.request = request
+        self.user = request.user
+        self.chunk_size = chunk_size
+        self.members_by_group = {}
+        self.known_user_ids = {self.user.id}
+        self.created = 0
+        self.errors = []
+        # One serializer validates every row, so its fields are built only once
+        self.row_serializer = ExpenseImportRowSerializer(
+            context={'request': request, 'importer': self}
+        )
+    
+    def group_members(self, group_id):
+        """Active member ids of a group (None if it does not exist), cached per import"""
+        if group_id not in self.members_by_group:
+            from apps.groups.models import Group, GroupMembership
+            if Group.objects.filter(id=group_id).exists():
+                self.members_by_group[group_id] = set(GroupMembership.objects.filter(
+                    group_id=group_id, is_active=True
+                ).values_list('user_id', flat=True))
+            else:
+                self.members_by_group[group_id] = None
+        return self.members_by_group[group_id]
+    
+    def run(self, rows):
+        """Import (row_number, data) pairs; returns the import summary"""
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        
+        return {
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+    
+    def import_chunk(self, chunk):
+        valid_rows = []
+        for row_number, data in chunk:
+            if isinstance(data, ImportRowError):
+                self.add_error(row_number, {'non_field_errors': [str(data)]})
+                continue
+            
+            try:
+                valid_rows.append((row_number, self.row_serializer.run_validation(data)))
+            except serializers.ValidationError as e:
+                self.add_error(row_number, serializers.as_serializer_error(e))
+        
+        valid_rows = self.check_personal_split_users(valid_rows)
+        if not valid_rows:
+            return
+        
+        try:
+            self.insert(valid_rows)
+        except Exception:
+            # Nothing from this chunk was written; retry its rows one at a
+            # time so only the rows that fail are reported
+            for row in valid_rows:
+                self.insert_row(row)
+            return
+        self.created += len(valid_rows)
+    
+    def insert_row(self, row):
+        row_number, data = row
+        try:
+            self.insert([row])
+        except Exception as e:
+            for error_class, message in SAVE_ERRORS:
+                if isinstance(e, error_class):
+                    break
+            else:
+                logger.exception("Bulk import could not save row %s for user %s", row_number, self.user.id)
+                message = "Could not save row"
+            self.add_error(row_number, {'non_field_errors': [message]})
+            return
+        self.created += 1
+    
+    def check_personal_split_users(self, valid_rows):
+        """Drop personal-expense rows whose splits name unknown users (one query per chunk)"""
+        wanted = {
+            split['user_id']
+            for _, data in valid_rows if data.get('group_id') is None
+            for split in data.get('splits', [])
+        } - self.known_user_ids
+        if wanted:
+            from apps.users.models import CustomUser
+            self.known_user_ids.update(
+                CustomUser.objects.filter(id__in=wanted).values_list('id', flat=True)
+            )
+        
+        checked = []
+        for row_number, data in valid_rows:
+            unknown = sorted({
+                split['user_id'] for split in data.get('splits', [])
+            } - self.known_user_ids)
+            if data.get('group_id') is None and unknown:
+                self.add_error(row_number, {'splits': [f"Users {unknown} do not exist"]})
+                continue
+            checked.append((row_number, data))
+        return checked
+    
+    @transaction.atomic
+    def insert(self, valid_rows):
+        expenses = []
+        approvals = []
+        splits_per_expense = []
+        for _, data in valid_rows:
+            data = dict(data)
+            splits_data = data.pop('splits', [])
+            group_id = data.pop('group_id', None)
+            
+            if not splits_data and group_id and data.get('split_type') == 'equal':
+                members = sorted(self.members_by_group[group_id])
+                shares = Money.of(data['amount']).split_evenly(len(members))
+                splits_data = [
+                    {'user_id': user_id, 'amount': share.to_decimal()}
+                    for user_id, share in zip(members, shares)
+                ]
+            
+            expense = Expense(paid_by=self.user, group_id=group_id, **data)
+            approvals.extend(expense.build_initial_approvals(
+                [split_data['user_id'] for split_data in splits_data]
+            ))
+            expenses.append(expense)
+            splits_per_expense.append(splits_data)
+        
+        # An expense approved at creation only involves its payer, so unlike
+        # single creates there is never a balance to apply here
+        Expense.objects.bulk_create(expenses)
+        ExpenseSplit.objects.bulk_create([
+            ExpenseSplit(expense=expense, **split_data)
+            for expense, splits_data in zip(expenses, splits_per_expense)
+            for split_data in splits_data
+        ])
+        ExpenseApproval.objects.bulk_create(approvals)
+        
+        # bulk_create sends no signals, so bump the change counters and feed
+        # the sync log here
+        audience = {self.user.id}
+        group_ids = set()
+        for expense, splits_data in zip(expenses, splits_per_expense):
+            audience.update(split_data['user_id'] for split_data in splits_data)
+            if expense.group_id:
+                audience |= self.members_by_group[expense.group_id]
+                group_ids.add(expense.group_id)
+        bump_after_commit(audience, group_ids)
+        record_after_commit(
+            entry
+            for expense, splits_data in zip(expenses, splits_per_expense)
+            for entry in ChangeLog.entries_for(
+                'expense', expense.id, 'upsert', expense.group_id,
+                () if expense.group_id else [self.user.id] + [split['user_id'] for split in splits_data]
+            )
+        )
+    
+    def add_error(self, row_number, errors):
+        self.errors.append({'row': row_number, 'errors': errors})
@@ -0,0 +1,292 @@
+import json
+import logging
+import random
+import re
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.expenses.models import Expense, ExpenseSplit
+from apps.groups.models import Group, GroupMembership
+from apps.users.models import CustomUser
+
+
+SCENARIOS = {
+    'debts': lambda rng, user_id, group_ids: ('get', '/api/expenses/debts/', None),
+    'group_settlement_summary': lambda rng, user_id, group_ids: (
+        'get', f'/api/groups/{rng.choice(group_ids)}/settlements/summary/', None
+    ),
+    'dashboard': lambda rng, user_id, group_ids: ('get', '/api/auth/dashboard/', None),
+    'group_expenses': lambda rng, user_id, group_ids: (
+        'get', f'/api/expenses/groups/{rng.choice(group_ids)}/?page_size=50', None
+    ),
+    'expense_create': lambda rng, user_id, group_ids: ('post', '/api/expenses/', {
+        'title': 'Benchmark expense',
+        'amount': f'{rng.randint(100, 20000) / 100:.2f}',
+        'group_id': rng.choice(group_ids),
+        'split_type': 'equal',
+        'expense_date': timezone.now().isoformat(),
+    }),
+}
+
+QUERY_COUNT = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the API in-process against the current database (seed it with seed_synthetic) '
+        'and write latency and query statistics per scenario as JSON. expense_create writes rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+            help='Scenarios to run'
+        )
+        parser.add_argument('--prefix', default='synthetic', help='Email prefix of the seeded users to act as')
+        parser.add_argument('--users', type=int, default=20, help='Number of seeded users to sample')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per scenario')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed requests per scenario')
+        parser.add_argument(
+            '--duration', type=float,
+            help='Run each scenario for this many seconds instead of --repeat requests'
+        )
+        parser.add_argument('--concurrency', type=int, default=1, help='Client threads per scenario')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Baseline JSON file from an earlier run to compare against')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Relative p95 slowdown that counts as a regression (0.2 = 20%%)'
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Exit with an error when --compare finds a regression'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        actors = self.sample_actors(options['prefix'], options['users'], rng)
+        if options['concurrency'] > 1 and connection.vendor == 'sqlite':
+            self.stderr.write('SQLite serializes writes; concurrent numbers will mostly measure locking')
+
+        # Dataset size before expense_create adds to it
+        meta = self.meta(options)
+
+        # The per-request log lines would drown the report
+        request_logger = logging.getLogger('backend_project.instrumentation')
+        level = request_logger.level
+        request_logger.setLevel(logging.WARNING)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                results = {
+                    name: self.run_scenario(name, actors, rng, options)
+                    for name in options['scenarios']
+                }
+        finally:
+            request_logger.setLevel(level)
+
+        report = {'meta': meta, 'results': results}
+        self.print_results(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = self.compare(baseline['results'], results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+
+    def sample_actors(self, prefix, count, rng):
+        """(user id, Authorization header, group ids) for seeded users that belong to at least one group"""
+        group_ids = {}
+        for user_id, group_id in GroupMembership.objects.filter(
+            user__email__startswith=f'{prefix}+', is_active=True
+        ).values_list('user_id', 'group_id').order_by('user_id', 'group_id'):
+            group_ids.setdefault(user_id, []).append(group_id)
+        if not group_ids:
+            raise CommandError(f'No users with prefix "{prefix}" in a group; run seed_synthetic first')
+
+        actors = []
+        for user in CustomUser.objects.filter(id__in=rng.sample(sorted(group_ids), min(count, len(group_ids)))):
+            token = AccessToken.for_user(user)
+            actors.append((user.id, f'Bearer {token}', group_ids[user.id]))
+        return actors
+
+    def run_scenario(self, name, actors, rng, options):
+        build_request = SCENARIOS[name]
+        plans = [
+            (authorization, *build_request(random.Random(rng.random()), user_id, group_ids))
+            for user_id, authorization, group_ids in actors
+        ]
+
+        def send(client, plan, samples):
+            authorization, method, path, data = plan
+            if options['cold']:
+                cache.clear()
+            body = {'data': data, 'content_type': 'application/json'} if data is not None else {}
+            start = time.perf_counter()
+            response = getattr(client, method)(path, HTTP_AUTHORIZATION=authorization, **body)
+            elapsed = time.perf_counter() - start
+            if samples is None:
+                return
+            timing = QUERY_COUNT.search(response.get('Server-Timing', ''))
+            samples.append((
+                elapsed * 1000,
+                int(timing.group(2)) if timing else None,
+                float(timing.group(1)) if timing else None,
+                response.status_code >= 400,
+            ))
+
+        client = Client()
+        for index in range(options['warmup']):
+            send(client, plans[index % len(plans)], None)
+
+        samples = []
+        remaining = [options['repeat']]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['duration'] if options['duration'] else None
+
+        def worker(worker_rng):
+            worker_client = Client()
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                else:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                send(worker_client, worker_rng.choice(plans), samples)
+
+        start = time.perf_counter()
+        if options['concurrency'] == 1:
+            worker(random.Random(rng.random()))
+        else:
+            threads = [
+                threading.Thread(target=self.in_thread, args=(worker, random.Random(rng.random())))
+                for _ in range(options['concurrency'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        wall = time.perf_counter() - start
+
+        return self.summarize(samples, wall)
+
+    @staticmethod
+    def in_thread(worker, worker_rng):
+        try:
+            worker(worker_rng)
+        finally:
+            # Each thread opened its own connections
+            connections.close_all()
+
+    @staticmethod
+    def summarize(samples, wall):
+        latencies = sorted(sample[0] for sample in samples)
+        queries = [sample[1] for sample in samples if sample[1] is not None]
+        db_times = [sample[2] for sample in samples if sample[2] is not None]
+
+        def rounded(value):
+            return round(value, 2) if value is not None else None
+
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[3]),
+            'rps': rounded(len(samples) / wall if wall else None),
+            'mean_ms': rounded(sum(latencies) / len(latencies) if latencies else None),
+            'p50_ms': rounded(percentile(latencies, 50)),
+            'p95_ms': rounded(percentile(latencies, 95)),
+            'p99_ms': rounded(percentile(latencies, 99)),
+            'max_ms': rounded(latencies[-1] if latencies else None),
+            'queries_mean': rounded(sum(queries) / len(queries) if queries else None),
+            'queries_max': max(queries) if queries else None,
+            'db_ms_mean': rounded(sum(db_times) / len(db_times) if db_times else None),
+        }
+
+    @staticmethod
+    def meta(options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        return {
+            'commit': commit,
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': {
+                'users': CustomUser.objects.count(),
+                'groups': Group.objects.count(),
+                'expenses': Expense.objects.count(),
+                'splits': ExpenseSplit.objects.count(),
+            },
+            'options': {
+                name: options[name]
+                for name in ('scenarios', 'users', 'warmup', 'repeat', 'duration', 'concurrency', 'cold', 'seed')
+            },
+        }
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"{'scenario':<26}{'reqs':>6}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'max ms':>10}{'queries':>9}"
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<26}{result['requests']:>6}{result['errors']:>6}{result['rps'] or 0:>9.1f}"
+                f"{result['p50_ms'] or 0:>10.2f}{result['p95_ms'] or 0:>10.2f}"
+                f"{result['p99_ms'] or 0:>10.2f}{result['max_ms'] or 0:>10.2f}{result['queries_mean'] or 0:>9.1f}"
+            )
+
+    def compare(self, baseline, results, threshold):
+        """
+        Print the change against a baseline run. A regression is a p95 more
+        than `threshold` slower, or more queries per request.
+        """
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if not before or not before.get('p95_ms') or result['p95_ms'] is None:
+                continue
+            change = result['p95_ms'] / before['p95_ms'] - 1
+            more_queries = (
+                before.get('queries_mean') is not None and result['queries_mean'] is not None
+                and result['queries_mean'] > before['queries_mean'] + 0.5
+            )
+            line = (
+                f"{name:<26}p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms ({change:+.0%}), "
+                f"queries {before.get('queries_mean')} -> {result['queries_mean']}"
+            )
+            if change > threshold or more_queries:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(f'{line}  REGRESSION'))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,89 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.expenses import balances
+from apps.expenses.models import ExpenseSplit
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the balance kernels (pure Python and, if installed, NumPy) on synthetic split ledgers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--splits', type=int, nargs='+', default=[1000, 100000, 1000000],
+            help='Ledger sizes (number of splits) to benchmark'
+        )
+        parser.add_argument('--members', type=int, default=1000, help='Distinct users in the ledger')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per ledger size')
+        parser.add_argument(
+            '--group', type=int,
+            help='Also time reading and netting the approved splits of this group from the database'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        kernels = {'python': balances.python_net_matrix}
+        if balances.np is not None:
+            kernels['numpy'] = balances.numpy_net_matrix
+        else:
+            self.stdout.write('NumPy is not installed; timing the pure Python kernels only')
+
+        for size in options['splits']:
+            rows = self.random_rows(rng, size, options['members'])
+
+            timings = self.measure(lambda: balances.counterparty_balances(rows, 1), options['repeat'])
+            self.report(size, 'one user', 'python', timings)
+
+            matrices = {}
+            for name, kernel in kernels.items():
+                timings = self.measure(lambda: kernel(rows), options['repeat'])
+                self.report(size, 'matrix', name, timings)
+                member_ids, matrix = kernel(rows)
+                matrices[name] = (member_ids, [list(map(int, row)) for row in matrix])
+
+            # Every kernel must agree to the cent
+            assert len({repr(matrix) for matrix in matrices.values()}) == 1
+
+        if options['group']:
+            start = time.perf_counter()
+            rows = balances.ledger_rows(ExpenseSplit.objects.filter(
+                expense__group_id=options['group'], expense__is_approved=True
+            ))
+            read = time.perf_counter() - start
+            member_ids, _ = balances.net_matrix(rows)
+            self.stdout.write(
+                f"group={options['group']} splits={len(rows)} members={len(member_ids)} "
+                f"read={read * 1000:.1f}ms net={(time.perf_counter() - start - read) * 1000:.1f}ms"
+            )
+
+    @staticmethod
+    def measure(run, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def report(self, size, what, kernel, timings):
+        self.stdout.write(
+            f"splits={size:<9} {what:<9} kernel={kernel:<7} "
+            f"best={min(timings) * 1000:.1f}ms mean={sum(timings) / len(timings) * 1000:.1f}ms"
+        )
+
+    @staticmethod
+    def random_rows(rng, size, members):
+        """(payer_id, user_id, cents) rows; user 1 is in about a tenth of them"""
+        rows = []
+        for _ in range(size):
+            payer_id, user_id = rng.randint(1, members), rng.randint(1, members)
+            if rng.random() < 0.1:
+                if rng.random() < 0.5:
+                    payer_id = 1
+                else:
+                    user_id = 1
+            rows.append((payer_id, user_id, rng.randint(1, 50000)))
+        return rows
@@ -0,0 +1,51 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from apps.expenses.simplify import simplify_debts
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the group debt simplification engine on synthetic groups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10, 100, 1000],
+            help='Group sizes (number of members) to benchmark'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per group size')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        for size in options['sizes']:
+            positions = self.random_positions(rng, size)
+
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                transfers = simplify_debts(positions)
+                timings.append(time.perf_counter() - start)
+
+            # Every position must be settled exactly by the transfers
+            settled = dict(positions)
+            for from_user_id, to_user_id, amount in transfers:
+                settled[from_user_id] += amount
+                settled[to_user_id] -= amount
+            assert all(amount == 0 for amount in settled.values())
+
+            self.stdout.write(
+                f"members={size:<6} transfers={len(transfers):<6} "
+                f"best={min(timings) * 1000:.3f}ms "
+                f"mean={sum(timings) / len(timings) * 1000:.3f}ms"
+            )
+
+    @staticmethod
+    def random_positions(rng, size):
+        """Random net positions (in cents) that sum to zero"""
+        cents = [rng.randint(-50000, 50000) for _ in range(size - 1)]
+        cents.append(-sum(cents))
+        return {user_id: Decimal(amount) / 100 for user_id, amount in enumerate(cents, start=1)}
@@ -0,0 +1,43 @@
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.expenses import fx
+from apps.expenses.models import FxRate
+
+
+class Command(BaseCommand):
+    help = (
+        'Load exchange rates from a CSV file with the columns date,base,quote,rate '
+        '(e.g. 2026-10-16,USD,INR,88.12). Rates already stored for a date and pair are replaced.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to load')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with open(options['path'], newline='') as rates_file:
+            rates = [self.parse_row(line_number, row) for line_number, row in enumerate(csv.DictReader(rates_file), 2)]
+
+        with transaction.atomic():
+            FxRate.objects.bulk_create(
+                rates, batch_size=options['batch_size'],
+                update_conflicts=True, unique_fields=['base', 'quote', 'date'], update_fields=['rate', 'updated_at']
+            )
+        fx.clear_cache()
+        self.stdout.write(f'Loaded {len(rates)} exchange rate(s)')
+
+    @staticmethod
+    def parse_row(line_number, row):
+        try:
+            base, quote = row['base'].strip().upper(), row['quote'].strip().upper()
+            rate = FxRate(date=date.fromisoformat(row['date'].strip()), base=base, quote=quote, rate=Decimal(row['rate']))
+        except (KeyError, AttributeError, ValueError, InvalidOperation):
+            raise CommandError(f'Line {line_number}: expected date,base,quote,rate, got {row}')
+        if not fx.is_currency_code(base) or not fx.is_currency_code(quote) or base == quote or not rate.rate > 0:
+            raise CommandError(f'Line {line_number}: invalid rate {base}/{quote} {rate.rate}')
+        return rate
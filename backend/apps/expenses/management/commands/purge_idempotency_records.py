@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.expenses.idempotency import IDEMPOTENCY_KEY_TTL
+from apps.expenses.models import IdempotencyRecord
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses older than their TTL. Run periodically (e.g. hourly).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl-hours', type=float, default=None,
+            help='Override the retention period (default: IDEMPOTENCY_KEY_TTL)'
+        )
+
+    def handle(self, *args, **options):
+        ttl = IDEMPOTENCY_KEY_TTL
+        if options['ttl_hours'] is not None:
+            ttl = timedelta(hours=options['ttl_hours'])
+        deleted = IdempotencyRecord.purge_expired(ttl)
+        self.stdout.write(f'Deleted {deleted} expired idempotency record(s)')
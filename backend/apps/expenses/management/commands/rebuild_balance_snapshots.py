@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.expenses.models import UserBalanceSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Recompute user balance snapshots from approved splits and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report drift, do not rewrite the snapshots'
+        )
+
+    def handle(self, *args, **options):
+        zero = Decimal('0')
+        expected = UserBalanceSnapshot.aggregate_balances()
+        stored = {
+            (snapshot.user_id, snapshot.currency): snapshot
+            for snapshot in UserBalanceSnapshot.objects.all()
+        }
+
+        drifted = 0
+        for key in sorted(set(expected) | set(stored)):
+            owed_to_others, owed_by_others = expected.get(key, (zero, zero))
+            snapshot = stored.get(key)
+            actual = (
+                (snapshot.owed_to_others, snapshot.owed_by_others, snapshot.net)
+                if snapshot else (zero, zero, zero)
+            )
+            wanted = (owed_to_others, owed_by_others, owed_by_others - owed_to_others)
+            if actual != wanted:
+                drifted += 1
+                user_id, currency = key
+                self.stdout.write(
+                    f"user={user_id} currency={currency} "
+                    f"stored(to={actual[0]}, by={actual[1]}, net={actual[2]}) "
+                    f"expected(to={wanted[0]}, by={wanted[1]}, net={wanted[2]})"
+                )
+
+        self.stdout.write(f"{drifted} of {len(set(expected) | set(stored))} snapshot(s) drifted")
+        if options['dry_run']:
+            return
+
+        with transaction.atomic():
+            UserBalanceSnapshot.objects.all().delete()
+            UserBalanceSnapshot.objects.bulk_create([
+                UserBalanceSnapshot(
+                    user_id=user_id,
+                    currency=currency,
+                    owed_to_others=owed_to_others,
+                    owed_by_others=owed_by_others,
+                    net=owed_by_others - owed_to_others,
+                )
+                for (user_id, currency), (owed_to_others, owed_by_others) in expected.items()
+            ])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(expected)} snapshot(s)"))
@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.expenses.payments import run_pending_payments
+
+
+class Command(BaseCommand):
+    help = 'Execute queued payments. Run several processes to scale throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help='Payments claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=300, help='Requeue payments stuck in processing for this many seconds')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        self.stdout.write('Payment worker started')
+
+        while True:
+            processed = run_pending_payments(options['batch_size'], stale_after)
+            if processed:
+                self.stdout.write(f'Processed {processed} payment(s)')
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,206 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.expenses.models import Expense, ExpenseApproval, ExpenseSplit, PairBalance
+from apps.groups.models import Group, GroupMembership
+from apps.users.models import CustomUser
+
+
+# Roughly 1k, 100k and 1M splits
+SCALES = {
+    '1k': {'users': 60, 'groups': 12, 'expenses': 80},
+    '100k': {'users': 3000, 'groups': 500, 'expenses': 9000},
+    '1m': {'users': 25000, 'groups': 4000, 'expenses': 90000},
+}
+
+SPLIT_TYPE_WEIGHTS = {'equal': 60, 'exact': 25, 'percentage': 15}
+MAX_GROUP_SIZE = 40
+PASSWORD = 'synthetic-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic users, groups and expenses (equal, exact and percentage '
+        'splits) with bulk inserts, for benchmarks and load tests. Deterministic per --seed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='1k', help='Preset dataset size (by split count)')
+        parser.add_argument('--users', type=int, help='Override the number of users')
+        parser.add_argument('--groups', type=int, help='Override the number of groups')
+        parser.add_argument('--expenses', type=int, help='Override the number of expenses')
+        parser.add_argument('--personal-share', type=float, default=0.1, help='Share of expenses outside any group')
+        parser.add_argument('--approved-share', type=float, default=0.8, help='Share of expenses everyone has accepted')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Expenses per bulk insert')
+        parser.add_argument('--prefix', default='synthetic', help='Email prefix marking the generated users')
+        parser.add_argument('--flush', action='store_true', help='Delete data from an earlier run with the same prefix first')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] or default for name, default in SCALES[options['scale']].items()}
+        if sizes['users'] < 2 or sizes['groups'] < 1:
+            raise CommandError('Need at least 2 users and 1 group')
+
+        prefix = options['prefix']
+        existing = CustomUser.objects.filter(email__startswith=f'{prefix}+')
+        if existing.exists():
+            if not options['flush']:
+                raise CommandError(f'Synthetic users with prefix "{prefix}" exist; pass --flush to replace them')
+            self.stdout.write('Deleting the previous synthetic dataset...')
+            self.flush(existing)
+
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        start = time.perf_counter()
+
+        with transaction.atomic():
+            users = self.create_users(prefix, sizes['users'])
+            members_by_group = self.create_groups(users, sizes['groups'])
+            counts = self.create_expenses(
+                users, members_by_group, sizes['expenses'], options['personal_share'],
+                options['approved_share'], options['batch_size']
+            )
+
+        # Derived tables, rebuilt the same way as in production
+        PairBalance.rebuild(list(members_by_group))
+        call_command('rebuild_balance_snapshots', stdout=StringIO())
+
+        self.stdout.write(self.style.SUCCESS(
+            f"users={len(users)} groups={len(members_by_group)} "
+            f"memberships={sum(len(members) for members in members_by_group.values())} "
+            f"expenses={counts['expenses']} splits={counts['splits']} "
+            f"in {time.perf_counter() - start:.1f}s (password: {PASSWORD})"
+        ))
+
+    def flush(self, users):
+        # The change log and version bumps for the deleted rows are written on
+        # commit and still point at the users and groups, so those go last
+        with transaction.atomic():
+            groups = Group.objects.filter(created_by__in=users)
+            Expense.objects.filter(Q(paid_by__in=users) | Q(group__in=groups)).delete()
+            GroupMembership.objects.filter(Q(user__in=users) | Q(group__in=groups)).delete()
+        users.delete()
+
+    def create_users(self, prefix, count):
+        password = make_password(PASSWORD)
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                email=f'{prefix}+{i}@example.com',
+                username=f'{prefix}_{i}',
+                first_name=f'User{i}',
+                last_name='Synthetic',
+                password=password,
+                two_factor_enabled=False,
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        return [user.id for user in users]
+
+    def create_groups(self, user_ids, count):
+        """Groups with long-tailed sizes, filled mostly by a core of very active users"""
+        groups = Group.objects.bulk_create([
+            Group(name=f'Synthetic group {i}', created_by_id=self.rng.choice(user_ids))
+            for i in range(count)
+        ], batch_size=1000)
+
+        # Zipf-like activity: low-ranked users belong to many more groups
+        activity = [1 / (rank + 1) ** 0.8 for rank in range(len(user_ids))]
+        members_by_group = {}
+        memberships = []
+        for group in groups:
+            size = min(MAX_GROUP_SIZE, len(user_ids), max(2, int(self.rng.paretovariate(1.3) * 2)))
+            members = {group.created_by_id}
+            while len(members) < size:
+                members.update(self.rng.choices(user_ids, weights=activity, k=size - len(members)))
+            members_by_group[group.id] = sorted(members)
+            memberships.extend(
+                GroupMembership(group_id=group.id, user_id=user_id, is_admin=user_id == group.created_by_id)
+                for user_id in members_by_group[group.id]
+            )
+        GroupMembership.objects.bulk_create(memberships, batch_size=5000)
+        return members_by_group
+
+    def create_expenses(self, user_ids, members_by_group, count, personal_share, approved_share, batch_size):
+        group_ids = list(members_by_group)
+        # Bigger groups spend more often
+        group_weights = [len(members_by_group[group_id]) for group_id in group_ids]
+        counts = {'expenses': 0, 'splits': 0}
+
+        for batch_start in range(0, count, batch_size):
+            expenses = []
+            shares_per_expense = []
+            for _ in range(min(batch_size, count - batch_start)):
+                if self.rng.random() < personal_share:
+                    group_id = None
+                    participants = self.rng.sample(user_ids, self.rng.randint(2, min(4, len(user_ids))))
+                else:
+                    group_id = self.rng.choices(group_ids, weights=group_weights)[0]
+                    participants = members_by_group[group_id]
+                paid_by_id = self.rng.choice(participants)
+                split_type = self.rng.choices(list(SPLIT_TYPE_WEIGHTS), weights=SPLIT_TYPE_WEIGHTS.values())[0]
+                if split_type != 'equal' and len(participants) > 2:
+                    participants = self.rng.sample(participants, self.rng.randint(2, len(participants)))
+
+                cents = max(100, min(500000, int(self.rng.lognormvariate(7.5, 1.0))))
+                expenses.append(Expense(
+                    title=f'Synthetic expense {batch_start + len(expenses)}',
+                    amount=Decimal(cents) / 100,
+                    paid_by_id=paid_by_id,
+                    group_id=group_id,
+                    split_type=split_type,
+                    expense_date=self.now - timedelta(minutes=self.rng.randint(0, 525600)),
+                    is_approved=self.rng.random() < approved_share,
+                ))
+                shares_per_expense.append(self.split_shares(split_type, cents, participants))
+
+            Expense.objects.bulk_create(expenses)
+            splits = []
+            approvals = []
+            for expense, shares in zip(expenses, shares_per_expense):
+                for user_id, split_cents, percentage in shares:
+                    splits.append(ExpenseSplit(
+                        expense=expense, user_id=user_id, amount=Decimal(split_cents) / 100, percentage=percentage
+                    ))
+                involved = {user_id for user_id, _, _ in shares} | {expense.paid_by_id}
+                for user_id in involved:
+                    accepted = expense.is_approved or user_id == expense.paid_by_id or self.rng.random() < 0.5
+                    approvals.append(ExpenseApproval(
+                        expense=expense, user_id=user_id, status='accepted' if accepted else 'pending'
+                    ))
+            ExpenseSplit.objects.bulk_create(splits, batch_size=5000)
+            ExpenseApproval.objects.bulk_create(approvals, batch_size=5000)
+
+            counts['expenses'] += len(expenses)
+            counts['splits'] += len(splits)
+            self.stdout.write(f"  {counts['expenses']}/{count} expenses, {counts['splits']} splits")
+
+        return counts
+
+    def split_shares(self, split_type, cents, participants):
+        """(user_id, cents, percentage) per participant, summing exactly to `cents`"""
+        if split_type == 'equal':
+            weights = [1] * len(participants)
+        else:
+            weights = [self.rng.randint(1, 10) for _ in participants]
+
+        shares = [cents * weight // sum(weights) for weight in weights]
+        # Whole cents left over by rounding go to the first participants
+        for index in range(cents - sum(shares)):
+            shares[index % len(shares)] += 1
+
+        percentages = [None] * len(participants)
+        if split_type == 'percentage':
+            percentages = [
+                (Decimal(weight * 100) / sum(weights)).quantize(Decimal('0.01')) for weight in weights
+            ]
+        return list(zip(participants, shares, percentages))
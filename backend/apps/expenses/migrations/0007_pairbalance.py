@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:54
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_pair_balances(apps, schema_editor):
+    Expense = apps.get_model('expenses', 'Expense')
+    ExpenseSplit = apps.get_model('expenses', 'ExpenseSplit')
+    Settlement = apps.get_model('expenses', 'Settlement')
+    PairBalance = apps.get_model('expenses', 'PairBalance')
+
+    balances = {}
+    splits = ExpenseSplit.objects.filter(
+        expense__group__isnull=False, expense__is_approved=True
+    ).values_list('expense__group_id', 'user_id', 'expense__paid_by_id', 'amount')
+    for group_id, debtor_id, creditor_id, amount in splits:
+        if debtor_id != creditor_id:
+            key = (group_id, debtor_id, creditor_id)
+            balances[key] = balances.get(key, Decimal('0')) + amount
+
+    settlements = Settlement.objects.filter(status='confirmed').values_list(
+        'group_id', 'from_user_id', 'to_user_id', 'amount'
+    )
+    for group_id, debtor_id, creditor_id, amount in settlements:
+        if debtor_id != creditor_id:
+            key = (group_id, debtor_id, creditor_id)
+            balances[key] = balances.get(key, Decimal('0')) - amount
+
+    PairBalance.objects.bulk_create([
+        PairBalance(group_id=group_id, debtor_id=debtor_id, creditor_id=creditor_id, amount=amount)
+        for (group_id, debtor_id, creditor_id), amount in balances.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0006_expense_is_approved_expense_verification_status'),
+        ('groups', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PairBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('creditor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pair_credits', to=settings.AUTH_USER_MODEL)),
+                ('debtor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pair_debts', to=settings.AUTH_USER_MODEL)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pair_balances', to='groups.group')),
+            ],
+            options={
+                'db_table': 'pair_balances',
+                'unique_together': {('group', 'debtor', 'creditor')},
+            },
+        ),
+        migrations.RunPython(backfill_pair_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:00
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_balance_snapshots(apps, schema_editor):
+    ExpenseSplit = apps.get_model('expenses', 'ExpenseSplit')
+    UserBalanceSnapshot = apps.get_model('expenses', 'UserBalanceSnapshot')
+
+    totals = {}
+    splits = ExpenseSplit.objects.filter(expense__is_approved=True).exclude(
+        user_id=models.F('expense__paid_by_id')
+    ).values_list('user_id', 'expense__paid_by_id', 'expense__currency', 'amount')
+    for debtor_id, creditor_id, currency, amount in splits:
+        debtor = totals.setdefault((debtor_id, currency), [Decimal('0'), Decimal('0')])
+        creditor = totals.setdefault((creditor_id, currency), [Decimal('0'), Decimal('0')])
+        debtor[0] += amount
+        creditor[1] += amount
+
+    UserBalanceSnapshot.objects.bulk_create([
+        UserBalanceSnapshot(
+            user_id=user_id,
+            currency=currency,
+            owed_to_others=owed_to_others,
+            owed_by_others=owed_by_others,
+            net=owed_by_others - owed_to_others,
+        )
+        for (user_id, currency), (owed_to_others, owed_by_others) in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0009_payment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(default='USD', max_length=3)),
+                ('owed_to_others', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12)),
+                ('owed_by_others', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12)),
+                ('net', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'user_balance_snapshots',
+                'unique_together': {('user', 'currency')},
+            },
+        ),
+        migrations.RunPython(backfill_balance_snapshots, migrations.RunPython.noop),
+    ]
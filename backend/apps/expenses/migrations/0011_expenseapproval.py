@@ -0,0 +1,98 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:22
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+STATUSES = {'accepted', 'pending', 'rejected'}
+
+
+def expense_batches(Expense, *fields):
+    last_id = 0
+    while True:
+        batch = list(Expense.objects.filter(id__gt=last_id).order_by('id').values_list('id', *fields)[:BATCH_SIZE])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        yield batch
+
+
+def copy_verification_status(apps, schema_editor):
+    """One approval row per involved user, taken from the JSON map (default pending)"""
+    Expense = apps.get_model('expenses', 'Expense')
+    ExpenseSplit = apps.get_model('expenses', 'ExpenseSplit')
+    ExpenseApproval = apps.get_model('expenses', 'ExpenseApproval')
+
+    for batch in expense_batches(Expense, 'paid_by_id', 'verification_status'):
+        involved = defaultdict(set)
+        for expense_id, paid_by_id, _ in batch:
+            involved[expense_id].add(paid_by_id)
+        splits = ExpenseSplit.objects.filter(
+            expense_id__in=involved
+        ).values_list('expense_id', 'user_id')
+        for expense_id, user_id in splits:
+            involved[expense_id].add(user_id)
+
+        approvals = []
+        for expense_id, _, verification_status in batch:
+            verification_status = verification_status or {}
+            for user_id in involved[expense_id]:
+                status = verification_status.get(str(user_id), 'pending')
+                approvals.append(ExpenseApproval(
+                    expense_id=expense_id,
+                    user_id=user_id,
+                    status=status if status in STATUSES else 'pending',
+                ))
+        ExpenseApproval.objects.bulk_create(approvals)
+
+
+def restore_verification_status(apps, schema_editor):
+    Expense = apps.get_model('expenses', 'Expense')
+    ExpenseApproval = apps.get_model('expenses', 'ExpenseApproval')
+
+    for batch in expense_batches(Expense):
+        statuses = defaultdict(dict)
+        approvals = ExpenseApproval.objects.filter(
+            expense_id__in=[expense_id for expense_id, in batch]
+        ).values_list('expense_id', 'user_id', 'status')
+        for expense_id, user_id, status in approvals:
+            statuses[expense_id][str(user_id)] = status
+        Expense.objects.bulk_update([
+            Expense(id=expense_id, verification_status=statuses[expense_id])
+            for expense_id, in batch
+        ], ['verification_status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0010_userbalancesnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseApproval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('accepted', 'Accepted'), ('pending', 'Pending'), ('rejected', 'Rejected')], default='pending', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='approvals', to='expenses.expense')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_approvals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'expense_approvals',
+                'indexes': [models.Index(fields=['user', 'status'], name='expense_approvals_user_idx')],
+                'unique_together': {('expense', 'user')},
+            },
+        ),
+        migrations.RunPython(copy_verification_status, restore_verification_status),
+        migrations.RemoveField(
+            model_name='expense',
+            name='verification_status',
+        ),
+    ]
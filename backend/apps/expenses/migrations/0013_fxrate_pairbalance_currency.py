@@ -0,0 +1,75 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:54
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def split_pair_balances_by_currency(apps, schema_editor):
+    """Existing rows added every currency together; rebuild them per currency"""
+    ExpenseSplit = apps.get_model('expenses', 'ExpenseSplit')
+    Settlement = apps.get_model('expenses', 'Settlement')
+    PairBalance = apps.get_model('expenses', 'PairBalance')
+
+    balances = {}
+    splits = ExpenseSplit.objects.filter(
+        expense__group__isnull=False, expense__is_approved=True
+    ).values_list('expense__group_id', 'user_id', 'expense__paid_by_id', 'expense__currency', 'amount')
+    for group_id, debtor_id, creditor_id, currency, amount in splits:
+        if debtor_id != creditor_id:
+            key = (group_id, debtor_id, creditor_id, currency)
+            balances[key] = balances.get(key, Decimal('0')) + amount
+
+    settlements = Settlement.objects.filter(status='confirmed').values_list(
+        'group_id', 'from_user_id', 'to_user_id', 'currency', 'amount'
+    )
+    for group_id, debtor_id, creditor_id, currency, amount in settlements:
+        if debtor_id != creditor_id:
+            key = (group_id, debtor_id, creditor_id, currency)
+            balances[key] = balances.get(key, Decimal('0')) - amount
+
+    PairBalance.objects.all().delete()
+    PairBalance.objects.bulk_create([
+        PairBalance(group_id=group_id, debtor_id=debtor_id, creditor_id=creditor_id, currency=currency, amount=amount)
+        for (group_id, debtor_id, creditor_id, currency), amount in balances.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0012_idempotencyrecord'),
+        ('groups', '0003_group_data_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='pairbalance',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='pairbalance',
+            name='currency',
+            field=models.CharField(default='USD', max_length=3),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pairbalance',
+            unique_together={('group', 'debtor', 'creditor', 'currency')},
+        ),
+        migrations.RunPython(split_pair_balances_by_currency, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('base', models.CharField(max_length=3)),
+                ('quote', models.CharField(max_length=3)),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+            ],
+            options={
+                'db_table': 'fx_rates',
+                'unique_together': {('base', 'quote', 'date')},
+            },
+        ),
+    ]
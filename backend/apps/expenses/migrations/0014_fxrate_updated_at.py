@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0013_fxrate_pairbalance_currency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fxrate',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
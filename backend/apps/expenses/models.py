@@ -1,6 +1,37 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from collections import defaultdict
 from decimal import Decimal
+from .money import Money
+
+
+class ExpenseQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Expenses from the user's groups, the user's personal expenses and any
+        expense the user has a split in.
+
+        Built as a UNION of three index-backed id lookups instead of an OR
+        across a join, which needed DISTINCT and a sort of the whole table.
+        """
+        from apps.groups.models import GroupMembership
+        user_groups = GroupMembership.objects.filter(
+            user=user, is_active=True
+        ).values('group_id')
+        
+        visible_ids = Expense.objects.filter(
+            group_id__in=user_groups
+        ).values('id').order_by().union(
+            Expense.objects.filter(group__isnull=True, paid_by=user).values('id').order_by(),
+            ExpenseSplit.objects.filter(user=user).values('expense_id').order_by(),
+        )
+        return self.filter(id__in=visible_ids)
+    
+    def with_details(self):
+        """Load everything ExpenseSerializer touches in a fixed number of queries"""
+        return self.select_related('paid_by', 'group').prefetch_related('expense_splits__user', 'approvals')
 
 
 class Expense(models.Model):
@@ -40,90 +71,155 @@ class Expense(models.Model):
     # Receipt/image URL
     receipt_image = models.URLField(blank=True, null=True)
     
-    # Expense verification fields
-    verification_status = models.JSONField(default=dict, blank=True)  # {"user_id": "accepted|pending|rejected"}
+    # Expense verification (per-user statuses live in ExpenseApproval)
     is_approved = models.BooleanField(default=False)  # True when all members have accepted
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     expense_date = models.DateTimeField()
     
+    objects = ExpenseQuerySet.as_manager()
+    
     class Meta:
         db_table = 'expenses'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['group', 'created_at'], name='expenses_group_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - ${self.amount} by {self.paid_by.full_name}"
     
     def get_involved_users(self):
         """Get all users involved in this expense (payer + splitters)"""
-        splitter_ids = set(self.expense_splits.values_list('user_id', flat=True))
-        splitter_ids.add(self.paid_by.id)
+        # Reuse prefetched splits when the caller loaded them (list views)
+        if 'expense_splits' in getattr(self, '_prefetched_objects_cache', {}):
+            splitter_ids = {split.user_id for split in self.expense_splits.all()}
+        else:
+            splitter_ids = set(self.expense_splits.values_list('user_id', flat=True))
+        splitter_ids.add(self.paid_by_id)
         return list(splitter_ids)
     
+    @property
+    def verification_status(self):
+        """Verification status per user, as {"user_id": "accepted|pending|rejected"}"""
+        return {str(approval.user_id): approval.status for approval in self.approvals.all()}
+    
     def update_verification_status(self, user_id, status):
         """Update verification status for a user"""
-        valid_statuses = ['accepted', 'pending', 'rejected']
+        valid_statuses = [choice for choice, _ in ExpenseApproval.STATUS_CHOICES]
         if status not in valid_statuses:
             raise ValueError(f"Status must be one of: {valid_statuses}")
         
-        self.verification_status[str(user_id)] = status
-        self.check_and_update_approval_status()
-        self.save()
+        was_approved = self.is_approved
+        with transaction.atomic():
+            ExpenseApproval.objects.update_or_create(
+                expense=self, user_id=user_id, defaults={'status': status}
+            )
+            getattr(self, '_prefetched_objects_cache', {}).pop('approvals', None)
+            self.check_and_update_approval_status()
+            
+            # The expense row is only written when it flips approval, and
+            # then the pairwise ledger is kept in sync
+            if self.is_approved != was_approved:
+                self.save(update_fields=['is_approved', 'updated_at'])
+                self.apply_to_balances(reverse=was_approved)
     
     def check_and_update_approval_status(self):
         """Check if all involved users have accepted and update is_approved"""
-        involved_users = self.get_involved_users()
+        involved_users = set(self.expense_splits.values_list('user_id', flat=True))
+        involved_users.add(self.paid_by_id)
+        statuses = dict(self.approvals.filter(user_id__in=involved_users).values_list('user_id', 'status'))
         
-        # Check if any user has rejected
-        for user_id in involved_users:
-            status = self.verification_status.get(str(user_id), 'pending')
-            if status == 'rejected':
-                self.is_approved = False
-                return
+        # An involved user without a row (e.g. added to the splits after the
+        # expense was created) is pending, not accepted: give them a row so
+        # the expense shows up in their pending approvals
+        missing_users = involved_users - statuses.keys()
+        if missing_users:
+            ExpenseApproval.objects.bulk_create(
+                [ExpenseApproval(expense=self, user_id=user_id) for user_id in missing_users],
+                ignore_conflicts=True
+            )
+        self.is_approved = not missing_users and all(status == 'accepted' for status in statuses.values())
+    
+    def build_initial_approvals(self, splitter_ids):
+        """
+        Unsaved approval rows for the payer and the split users (no queries).
         
-        # Check if all users have accepted
-        all_accepted = True
-        for user_id in involved_users:
-            status = self.verification_status.get(str(user_id), 'pending')
-            if status != 'accepted':
-                all_accepted = False
-                break
+        Also sets is_approved, so the expense row is written once; save the
+        returned rows with bulk_create after the expense.
+        """
+        involved_users = set(splitter_ids)
+        involved_users.add(self.paid_by_id)
         
-        self.is_approved = all_accepted
+        # Creator automatically accepts, others start as pending
+        self.is_approved = involved_users == {self.paid_by_id}
+        return [
+            ExpenseApproval(
+                expense=self,
+                user_id=user_id,
+                status='accepted' if user_id == self.paid_by_id else 'pending'
+            )
+            for user_id in involved_users
+        ]
     
     def initialize_verification_status(self):
         """Initialize verification status for all involved users"""
-        involved_users = self.get_involved_users()
-        
-        for user_id in involved_users:
-            if user_id == self.paid_by.id:
-                # Creator automatically accepts
-                self.verification_status[str(user_id)] = 'accepted'
-            else:
-                # Others start as pending
-                self.verification_status[str(user_id)] = 'pending'
-        
-        self.check_and_update_approval_status()
-        self.save()
+        with transaction.atomic():
+            self.approvals.all().delete()
+            ExpenseApproval.objects.bulk_create(self.build_initial_approvals(self.get_involved_users()))
+            self.save()
+    
+    def apply_to_balances(self, reverse=False):
+        """Add (or remove) this approved expense in the pair ledger and user snapshots"""
+        PairBalance.apply_expense(self, reverse=reverse)
+        UserBalanceSnapshot.apply_expense(self, reverse=reverse)
     
     def calculate_splits(self):
         """Calculate how much each person owes for this expense"""
         splits = []
         if self.split_type == 'equal':
             # Split equally among all participants
-            participants = self.expense_splits.all()
-            if participants.count() > 0:
-                amount_per_person = self.amount / participants.count()
-                for split in participants:
+            participants = list(self.expense_splits.select_related('user').order_by('user_id'))
+            if participants:
+                shares = Money.of(self.amount).split_evenly(len(participants))
+                for split, share in zip(participants, shares):
                     splits.append({
                         'user': split.user,
-                        'amount': amount_per_person,
-                        'paid': split.user == self.paid_by
+                        'amount': share.to_decimal(),
+                        'paid': split.user_id == self.paid_by_id
                     })
         return splits
 
 
+class ExpenseApproval(models.Model):
+    """
+    One user's verification of an expense: the payer and every split user
+    get a row when the expense is created
+    """
+    STATUS_CHOICES = [
+        ('accepted', 'Accepted'),
+        ('pending', 'Pending'),
+        ('rejected', 'Rejected'),
+    ]
+    
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='approvals')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='expense_approvals')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'expense_approvals'
+        unique_together = ('expense', 'user')
+        indexes = [
+            # Expenses waiting on a user's approval
+            models.Index(fields=['user', 'status'], name='expense_approvals_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.full_name} {self.status} {self.expense.title}"
+
+
 class ExpenseSplit(models.Model):
     """
     Model to track how an expense is split among users
@@ -136,6 +232,9 @@ class ExpenseSplit(models.Model):
     class Meta:
         db_table = 'expense_splits'
         unique_together = ('expense', 'user')
+        indexes = [
+            models.Index(fields=['user', 'expense'], name='expense_splits_user_exp_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.full_name} owes ${self.amount} for {self.expense.title}"
@@ -177,6 +276,371 @@ class Settlement(models.Model):
     class Meta:
         db_table = 'settlements'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['from_user', 'created_at'], name='settlements_from_created_idx'),
+            models.Index(fields=['to_user', 'created_at'], name='settlements_to_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.from_user.full_name} pays ${self.amount} to {self.to_user.full_name}"
+
+
+class PairBalance(models.Model):
+    """
+    Materialized ledger of how much one user owes another inside a group, per
+    currency (amounts in different currencies are never added together).
+
+    `amount` is the sum of approved expense splits the debtor owes the creditor,
+    minus confirmed settlements from the debtor to the creditor. Rows are kept up
+    to date by the write paths (expense approval, payments, settlements) so that
+    debt endpoints can read O(pairs) rows instead of walking every expense.
+    """
+    group = models.ForeignKey(
+        'groups.Group',
+        on_delete=models.CASCADE,
+        related_name='pair_balances'
+    )
+    debtor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='pair_debts'
+    )
+    creditor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='pair_credits'
+    )
+    currency = models.CharField(max_length=3, default='USD')
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'))
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'pair_balances'
+        unique_together = ('group', 'debtor', 'creditor', 'currency')
+    
+    def __str__(self):
+        return f"{self.debtor.full_name} owes {self.creditor.full_name} {self.amount} {self.currency} in {self.group.name}"
+    
+    @classmethod
+    def adjust(cls, group_id, debtor_id, creditor_id, currency, delta):
+        """Add `delta` to the debtor -> creditor balance of a group in one currency"""
+        if not group_id or debtor_id == creditor_id or not delta:
+            return
+        
+        balance, created = cls.objects.get_or_create(
+            group_id=group_id,
+            debtor_id=debtor_id,
+            creditor_id=creditor_id,
+            currency=currency,
+            defaults={'amount': delta}
+        )
+        if not created:
+            cls.objects.filter(pk=balance.pk).update(
+                amount=models.F('amount') + delta,
+                updated_at=timezone.now()
+            )
+    
+    @classmethod
+    def apply_expense(cls, expense, reverse=False):
+        """Add (or remove, when reverse=True) an approved expense's splits"""
+        if not expense.group_id:
+            return
+        
+        sign = -1 if reverse else 1
+        splits = ExpenseSplit.objects.filter(expense=expense).exclude(
+            user_id=expense.paid_by_id
+        ).values_list('user_id', 'amount')
+        
+        for user_id, amount in splits:
+            cls.adjust(expense.group_id, user_id, expense.paid_by_id, expense.currency, sign * amount)
+    
+    @classmethod
+    def debt_currencies(cls, debtor_id, creditor_id, group_id=None):
+        """Currencies the debtor owes the creditor money in (inside one group, if given)"""
+        balances = cls.objects.filter(debtor_id=debtor_id, creditor_id=creditor_id, amount__gt=0)
+        if group_id:
+            balances = balances.filter(group_id=group_id)
+        return sorted(set(balances.values_list('currency', flat=True)))
+    
+    @classmethod
+    def apply_settlement(cls, settlement):
+        """Record a confirmed settlement against the payer's debt"""
+        cls.adjust(
+            settlement.group_id,
+            settlement.from_user_id,
+            settlement.to_user_id,
+            settlement.currency,
+            -settlement.amount
+        )
+    
+    @classmethod
+    def aggregate_balances(cls, group_ids=None):
+        """
+        Compute {(group_id, debtor_id, creditor_id, currency): amount} with
+        set-based SQL: approved splits summed per (group, splitter, payer,
+        currency) netted against confirmed settlements summed per (group,
+        from_user, to_user, currency).
+        """
+        splits = ExpenseSplit.objects.filter(
+            expense__group__isnull=False,
+            expense__is_approved=True
+        ).exclude(user_id=models.F('expense__paid_by_id'))
+        settlements = Settlement.objects.filter(status='confirmed').exclude(
+            from_user_id=models.F('to_user_id')
+        )
+        if group_ids is not None:
+            splits = splits.filter(expense__group_id__in=group_ids)
+            settlements = settlements.filter(group_id__in=group_ids)
+        
+        balances = defaultdict(Decimal)
+        split_totals = splits.values_list(
+            'expense__group_id', 'user_id', 'expense__paid_by_id', 'expense__currency'
+        ).annotate(total=models.Sum('amount')).order_by()
+        for group_id, debtor_id, creditor_id, currency, total in split_totals:
+            balances[(group_id, debtor_id, creditor_id, currency)] += total
+        
+        settlement_totals = settlements.values_list(
+            'group_id', 'from_user_id', 'to_user_id', 'currency'
+        ).annotate(total=models.Sum('amount')).order_by()
+        for group_id, debtor_id, creditor_id, currency, total in settlement_totals:
+            balances[(group_id, debtor_id, creditor_id, currency)] -= total
+        
+        return balances
+    
+    @classmethod
+    def rebuild(cls, group_ids=None):
+        """Recompute balances from approved splits and confirmed settlements"""
+        balances = cls.objects.all()
+        if group_ids is not None:
+            balances = balances.filter(group_id__in=group_ids)
+        
+        with transaction.atomic():
+            balances.delete()
+            cls.objects.bulk_create([
+                cls(
+                    group_id=group_id, debtor_id=debtor_id, creditor_id=creditor_id,
+                    currency=currency, amount=amount
+                )
+                for (group_id, debtor_id, creditor_id, currency), amount
+                in cls.aggregate_balances(group_ids).items()
+            ])
+
+
+class Payment(models.Model):
+    """
+    A payment queued by process_payment and executed by the payment worker
+    (`python manage.py run_payment_worker`) outside the request cycle.
+    """
+    PAYMENT_STATUS = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    SETTLEMENT_TYPES = [
+        ('individual', 'Individual'),
+        ('group', 'Group'),
+        ('global', 'Global'),
+    ]
+    
+    payer = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='payments_sent'
+    )
+    receiver = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='payments_incoming'
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    actual_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    payment_method = models.CharField(max_length=20)
+    settlement_type = models.CharField(max_length=20, choices=SETTLEMENT_TYPES, default='individual')
+    expense = models.ForeignKey(
+        Expense,
+        on_delete=models.SET_NULL,
+        related_name='payments',
+        null=True,
+        blank=True
+    )
+    note = models.TextField(blank=True, default='')
+    
+    # Splits are reduced at most once per transaction id, even if a job is retried
+    transaction_id = models.CharField(max_length=12, unique=True)
+    splits_applied = models.BooleanField(default=False)
+    
+    status = models.CharField(max_length=20, choices=PAYMENT_STATUS, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'payments'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='payments_status_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.payer.full_name} pays ${self.amount} to {self.receiver.full_name} ({self.status})"
+
+
+class UserBalanceSnapshot(models.Model):
+    """
+    Per-user, per-currency running totals behind CustomUser.get_balance_summary.
+
+    Only approved expenses count. `owed_to_others` is the user's splits on
+    expenses other people paid, `owed_by_others` is other people's splits on
+    expenses the user paid, and `net` is their difference. Rows are updated
+    incrementally by the same write paths as PairBalance; the
+    rebuild_balance_snapshots command recomputes them and reports drift.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='balance_snapshots'
+    )
+    currency = models.CharField(max_length=3, default='USD')
+    owed_to_others = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'))
+    owed_by_others = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'))
+    net = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'))
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'user_balance_snapshots'
+        unique_together = ('user', 'currency')
+    
+    def __str__(self):
+        return f"{self.user.full_name}: net {self.net} {self.currency}"
+    
+    @classmethod
+    def adjust(cls, user_id, currency, owed_to_others=0, owed_by_others=0):
+        """Add deltas to a user's totals in one currency"""
+        if not owed_to_others and not owed_by_others:
+            return
+        
+        snapshot, created = cls.objects.get_or_create(
+            user_id=user_id,
+            currency=currency,
+            defaults={
+                'owed_to_others': owed_to_others,
+                'owed_by_others': owed_by_others,
+                'net': owed_by_others - owed_to_others,
+            }
+        )
+        if not created:
+            cls.objects.filter(pk=snapshot.pk).update(
+                owed_to_others=models.F('owed_to_others') + owed_to_others,
+                owed_by_others=models.F('owed_by_others') + owed_by_others,
+                net=models.F('net') + (owed_by_others - owed_to_others),
+                updated_at=timezone.now()
+            )
+    
+    @classmethod
+    def adjust_split(cls, debtor_id, creditor_id, currency, delta):
+        """Record that `debtor` owes `creditor` `delta` more on an approved expense"""
+        if debtor_id == creditor_id or not delta:
+            return
+        cls.adjust(debtor_id, currency, owed_to_others=delta)
+        cls.adjust(creditor_id, currency, owed_by_others=delta)
+    
+    @classmethod
+    def apply_expense(cls, expense, reverse=False):
+        """Add (or remove, when reverse=True) an approved expense's splits"""
+        sign = -1 if reverse else 1
+        splits = ExpenseSplit.objects.filter(expense=expense).exclude(
+            user_id=expense.paid_by_id
+        ).values_list('user_id', 'amount')
+        
+        total = Decimal('0')
+        for user_id, amount in splits:
+            cls.adjust(user_id, expense.currency, owed_to_others=sign * amount)
+            total += amount
+        cls.adjust(expense.paid_by_id, expense.currency, owed_by_others=sign * total)
+    
+    @classmethod
+    def aggregate_balances(cls):
+        """
+        Compute {(user_id, currency): (owed_to_others, owed_by_others)} from
+        approved splits with two GROUP BY queries.
+        """
+        splits = ExpenseSplit.objects.filter(expense__is_approved=True).exclude(
+            user_id=models.F('expense__paid_by_id')
+        )
+        totals = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+        
+        owed_to_others = splits.values_list('user_id', 'expense__currency').annotate(
+            total=models.Sum('amount')
+        ).order_by()
+        for user_id, currency, total in owed_to_others:
+            totals[(user_id, currency)][0] += total
+        
+        owed_by_others = splits.values_list('expense__paid_by_id', 'expense__currency').annotate(
+            total=models.Sum('amount')
+        ).order_by()
+        for user_id, currency, total in owed_by_others:
+            totals[(user_id, currency)][1] += total
+        
+        return {key: tuple(value) for key, value in totals.items()}
+
+
+class IdempotencyRecord(models.Model):
+    """
+    The stored outcome of a write sent with an Idempotency-Key header, so a
+    retried request gets the first response back instead of running twice.
+    The row is written in the same transaction as the view, so a row without
+    a status code is only ever seen by that request.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_records')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of method, path and body
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'idempotency_records'
+        unique_together = ('user', 'key')
+        indexes = [
+            # Expiry sweeps
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'in progress'})"
+    
+    @classmethod
+    def purge_expired(cls, ttl, user=None):
+        """Delete records older than `ttl`, for one user or everyone"""
+        expired = cls.objects.filter(created_at__lt=timezone.now() - ttl)
+        if user is not None:
+            expired = expired.filter(user=user)
+        return expired.delete()[0]
+
+
+class FxRate(models.Model):
+    """
+    One unit of `base` is worth `rate` units of `quote` on `date`.
+
+    Loaded from a file with the load_fx_rates command and read through
+    apps.expenses.fx, which caches lookups in-process.
+    """
+    date = models.DateField()
+    base = models.CharField(max_length=3)
+    quote = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    # The latest load is the version of the whole table (see fx.rates_version)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    class Meta:
+        db_table = 'fx_rates'
+        # Also serves "latest rate for a pair on or before a date"
+        unique_together = ('base', 'quote', 'date')
+    
+    def __str__(self):
+        return f"{self.base}/{self.quote} {self.rate} on {self.date}"
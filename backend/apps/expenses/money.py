@@ -0,0 +1,87 @@
+"""
+Money as an integer number of minor units (cents), for dividing amounts.
+
+Dividing an amount between people goes through `Money.allocate`, which
+works in whole cents with the largest remainder rule: everyone gets the
+floor of their share, and the cents left over go one each to the largest
+fractional remainders, ties to whoever comes first. The shares always add
+up to the amount, and the same inputs in the same order always give the
+same shares, so callers order participants (by user id) before allocating.
+
+Stored amounts stay Decimals (exact NUMERIC(..., 2) columns); Decimals are
+built from the shares with to_decimal().
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+
+CENT = Decimal('0.01')
+
+
+def to_cents(amount):
+    """Whole cents in a Decimal, int or numeric string, rounding half-cents up"""
+    return int(Decimal(str(amount)).quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def from_cents(cents):
+    """Exact two-place Decimal for a number of cents"""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+class Money:
+    """An amount of money in whole cents; immutable, hashable and exact"""
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        if not isinstance(cents, int):
+            raise TypeError(f'Money takes whole cents, not {type(cents).__name__}; use Money.of()')
+        object.__setattr__(self, 'cents', cents)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Money is immutable')
+
+    @classmethod
+    def of(cls, amount):
+        """Money from a Decimal, int or numeric string in major units (e.g. '12.50')"""
+        return cls(to_cents(amount))
+
+    def to_decimal(self):
+        return from_cents(self.cents)
+
+    def allocate(self, weights):
+        """
+        Split into one share per weight (Decimals or ints, e.g. percentages),
+        by the largest remainder rule. The shares add up to this amount.
+        """
+        weights = [Decimal(weight) for weight in weights]
+        if not weights or any(weight < 0 for weight in weights) or not sum(weights):
+            raise ValueError('Weights must be non-negative and not all zero')
+
+        total = sum(weights)
+        sign = -1 if self.cents < 0 else 1
+        cents = abs(self.cents)
+        exact = [cents * weight / total for weight in weights]
+        shares = [int(share) for share in exact]
+        leftover = cents - sum(shares)
+        # Largest fractional part first; sorted() is stable, so ties keep their order
+        by_remainder = sorted(range(len(weights)), key=lambda index: shares[index] - exact[index])
+        for index in by_remainder[:leftover]:
+            shares[index] += 1
+        return [Money(sign * share) for share in shares]
+
+    def split_evenly(self, count):
+        """`count` shares that differ by at most a cent, the larger ones first"""
+        return self.allocate([1] * count)
+
+    def __eq__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.cents == other.cents
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __str__(self):
+        return str(self.to_decimal())
+
+    def __repr__(self):
+        return f"Money('{self}')"
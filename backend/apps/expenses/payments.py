@@ -0,0 +1,255 @@
+"""
+Payment execution for the DB-backed payment queue.
+
+process_payment only records a queued Payment and returns 202; the payment
+worker (`python manage.py run_payment_worker`) claims queued rows and runs
+them here. Claiming is a conditional UPDATE, so any number of worker
+processes can share the queue without an external broker.
+"""
+import logging
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ExpenseSplit, PairBalance, Payment, UserBalanceSnapshot
+from .signals import bump_expense_after_commit
+from apps.sync.models import ChangeLog
+from apps.sync.signals import personal_expense_users, record_after_commit
+
+
+logger = logging.getLogger(__name__)
+
+
+# Simulated gateway latency per payment method (seconds)
+PROCESSING_TIME = {
+    'cash': 0.1,    # Instant for cash
+    'upi': 0.3,     # Fast UPI transaction
+    'venmo': 0.5,
+    'paypal': 0.8,
+    'bank': 1.2,
+    'zelle': 0.3
+}
+
+
+def claim_payments(limit=10):
+    """Atomically move up to `limit` queued payments to processing"""
+    claimed = []
+    candidate_ids = Payment.objects.filter(status='queued').order_by(
+        'created_at', 'id'
+    ).values_list('id', flat=True)[:limit]
+    
+    for payment_id in candidate_ids:
+        # Only one worker wins the queued -> processing transition
+        won = Payment.objects.filter(id=payment_id, status='queued').update(
+            status='processing',
+            started_at=timezone.now(),
+        )
+        if won:
+            claimed.append(Payment.objects.select_related('payer', 'receiver').get(id=payment_id))
+    
+    return claimed
+
+
+def requeue_stale_payments(older_than):
+    """Give payments stuck in processing (e.g. a worker crashed) back to the queue"""
+    return Payment.objects.filter(
+        status='processing',
+        started_at__lt=timezone.now() - older_than
+    ).update(status='queued')
+
+
+def net_balance_with(user, receiver):
+    """What `user` owes `receiver` across approved expenses (negative = receiver owes user)"""
+    user_splits = ExpenseSplit.objects.filter(
+        user=user,
+        expense__is_approved=True
+    ).select_related('expense')
+    
+    balance_with_receiver = Decimal('0')
+    
+    for split in user_splits:
+        expense = split.expense
+        if expense.paid_by_id == receiver.id:
+            # User owes money to receiver
+            balance_with_receiver += split.amount
+        elif expense.paid_by_id == user.id:
+            # Receiver owes money to user
+            balance_with_receiver -= split.amount
+    
+    return balance_with_receiver
+
+
+def execute_payment(payment):
+    """Run a claimed payment through the (simulated) gateway and settle its splits"""
+    payment.attempts += 1
+    payment.save(update_fields=['attempts'])
+    
+    processing_time = PROCESSING_TIME.get(payment.payment_method, 0.5)
+    time.sleep(processing_time)
+    
+    # Simulate 95% success rate
+    if random.random() >= 0.95:
+        payment.status = 'failed'
+        payment.error = 'Payment processing failed. Please try again.'
+        payment.completed_at = timezone.now()
+        payment.save(update_fields=['status', 'error', 'completed_at'])
+        return payment
+    
+    apply_payment_splits(payment.id, processing_time)
+    payment.refresh_from_db()
+    return payment
+
+
+def apply_payment_splits(payment_id, processing_time=0):
+    """
+    Reduce the splits covered by a payment.
+
+    Idempotent per transaction id: the payment row is locked and its
+    `splits_applied` flag checked, so a retried job never settles twice. A
+    payment failed in the meantime is left alone.
+    Everything runs in one transaction, so a failure leaves no split touched.
+    """
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().select_related(
+            'payer', 'receiver'
+        ).get(id=payment_id)
+        if payment.splits_applied or payment.status == 'failed':
+            # Settled already, or failed meanwhile (e.g. its expense was deleted)
+            return payment
+        
+        payer = payment.payer
+        receiver = payment.receiver
+        amount = payment.amount
+        settlement_type = payment.settlement_type
+        
+        # Splits where the payer owes the receiver (only approved expenses),
+        # optionally for one expense only. Global settlements additionally
+        # credit the receiver's debts to the payer.
+        owed = Q(user=payer, expense__paid_by=receiver)
+        if payment.expense_id:
+            owed &= Q(expense_id=payment.expense_id)
+        if settlement_type == 'global':
+            owed |= Q(user=receiver, expense__paid_by=payer)
+        
+        # Lock them all in one query in id order, so concurrent payments over
+        # the same splits wait for each other (and cannot deadlock) instead
+        # of reducing amounts they read before the other one committed
+        locked_splits = list(ExpenseSplit.objects.select_for_update(of=('self',)).filter(
+            owed, expense__is_approved=True
+        ).select_related('expense').order_by('id'))
+        user_splits = [split for split in locked_splits if split.user_id == payer.id]
+        receiver_splits = [split for split in locked_splits if split.user_id != payer.id]
+        
+        # For global settlements, calculate net balance between the two users
+        actual_amount = amount
+        if settlement_type == 'global':
+            actual_amount = abs(net_balance_with(payer, receiver))
+        
+        remaining_amount = actual_amount if settlement_type == 'global' else amount
+        payments_made = []
+        reductions = []
+        
+        # Pay the payer's splits first, then credit the receiver's debts
+        for splits, amount_key in ((user_splits, 'amount_paid'), (receiver_splits, 'amount_credited')):
+            for split in splits:
+                if remaining_amount <= 0:
+                    break
+                
+                # Calculate how much of this split we can pay (or credit)
+                split_amount = min(remaining_amount, split.amount)
+                reductions.append((split, split_amount))
+                
+                payments_made.append({
+                    'expense_id': split.expense.id,
+                    'expense_title': split.expense.title,
+                    'original_amount': float(split.amount),
+                    amount_key: float(split_amount),
+                    'remaining_amount': float(split.amount - split_amount)
+                })
+                
+                remaining_amount -= split_amount
+                logger.debug(
+                    "Settled %s of split %s (expense %s), %s remaining",
+                    split_amount, split.id, split.expense_id, split.amount - split_amount
+                )
+        
+        settle_splits(reductions)
+        
+        completed_at = timezone.now()
+        payment.actual_amount = actual_amount
+        payment.splits_applied = True
+        payment.status = 'completed'
+        payment.completed_at = completed_at
+        payment.result = {
+            'success': True,
+            'transaction_id': payment.transaction_id,
+            'requested_amount': float(amount),
+            'actual_amount': float(actual_amount),
+            'receiver': receiver.get_full_name(),
+            'payment_method': payment.payment_method,
+            'processing_time': int(processing_time * 1000),  # Convert to milliseconds
+            'processed_at': completed_at.isoformat(),
+            'status': 'completed',
+            'settlement_type': settlement_type,
+            'payments_made': payments_made,
+            'note': payment.note,
+            'message': f'Payment of ₹{actual_amount} sent successfully to {receiver.get_full_name()} via {payment.payment_method.title()}'
+        }
+        payment.save()
+    
+    return payment
+
+
+def settle_splits(reductions):
+    """
+    Apply (split, amount) reductions to locked, approved splits: one UPDATE
+    for the splits, one balance adjustment per (group, debtor, creditor)
+    """
+    if not reductions:
+        return
+    
+    balance_deltas = defaultdict(Decimal)
+    for split, split_amount in reductions:
+        expense = split.expense
+        split.amount = F('amount') - split_amount
+        balance_deltas[(expense.group_id, split.user_id, expense.paid_by_id, expense.currency)] -= split_amount
+    ExpenseSplit.objects.bulk_update([split for split, _ in reductions], ['amount'])
+    
+    for (group_id, debtor_id, creditor_id, currency), delta in balance_deltas.items():
+        PairBalance.adjust(group_id, debtor_id, creditor_id, currency, delta)
+        UserBalanceSnapshot.adjust_split(debtor_id, creditor_id, currency, delta)
+    
+    # bulk_update sends no signals, so bump the change counters and feed the
+    # sync log here
+    for expense_id in {split.expense_id for split, _ in reductions}:
+        bump_expense_after_commit(expense_id)
+    record_after_commit(
+        entry
+        for split, _ in reductions
+        for entry in ChangeLog.entries_for(
+            'split', split.id, 'upsert', split.expense.group_id,
+            () if split.expense.group_id else personal_expense_users(split.expense_id, split.expense.paid_by_id)
+        )
+    )
+
+
+def run_pending_payments(limit=10, stale_after=timedelta(minutes=5)):
+    """Claim and execute one batch of queued payments; returns how many ran"""
+    requeue_stale_payments(stale_after)
+    payments = claim_payments(limit)
+    for payment in payments:
+        try:
+            execute_payment(payment)
+        except Exception as e:
+            Payment.objects.filter(id=payment.id).update(
+                status='failed',
+                error=f'Payment processing error: {str(e)}',
+                completed_at=timezone.now(),
+            )
+    return len(payments)
@@ -1,10 +1,19 @@
+import logging
+
 from rest_framework import serializers
-from .models import Expense, ExpenseSplit, Settlement
+from django.db import transaction
+from backend_project.instrumentation import TimedSerializerMixin
+from .fx import is_currency_code
+from .models import Expense, ExpenseApproval, ExpenseSplit, PairBalance, Settlement
+from .money import Money
 from apps.users.serializers import UserSerializer
 from apps.groups.serializers import GroupSerializer
 
 
-class ExpenseSplitSerializer(serializers.ModelSerializer):
+logger = logging.getLogger(__name__)
+
+
+class ExpenseSplitSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.IntegerField(write_only=True)
     
@@ -12,11 +21,12 @@ class ExpenseSplitSerializer(serializers.ModelSerializer):
         model = ExpenseSplit
         fields = ('id', 'user', 'user_id', 'amount', 'percentage')
         extra_kwargs = {
+            'amount': {'required': False},
             'percentage': {'required': False, 'allow_null': True}
         }
 
 
-class ExpenseSerializer(serializers.ModelSerializer):
+class ExpenseSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     paid_by = UserSerializer(read_only=True)
     group_id = serializers.SerializerMethodField()
     group_name = serializers.SerializerMethodField()
@@ -24,29 +34,39 @@ class ExpenseSerializer(serializers.ModelSerializer):
     verification_details = serializers.SerializerMethodField()
     
     def get_group_id(self, obj):
-        return obj.group.id if obj.group else None
+        return obj.group_id
     
     def get_group_name(self, obj):
-        return obj.group.name if obj.group else None
+        return obj.group.name if obj.group_id else None
     
     def get_verification_details(self, obj):
         """Get verification details with user information"""
-        from apps.users.models import CustomUser
-        details = []
+        # Resolve users from the payer and the (prefetched) splits; only fall
+        # back to a single bulk query when the expense was loaded without them
+        users_by_id = {obj.paid_by_id: obj.paid_by}
+        if 'expense_splits' in getattr(obj, '_prefetched_objects_cache', {}):
+            for split in obj.expense_splits.all():
+                users_by_id[split.user_id] = split.user
         
         involved_users = obj.get_involved_users()
+        missing_ids = [user_id for user_id in involved_users if user_id not in users_by_id]
+        if missing_ids:
+            from apps.users.models import CustomUser
+            users_by_id.update(CustomUser.objects.in_bulk(missing_ids))
+        
+        verification_status = obj.verification_status
+        details = []
         for user_id in involved_users:
-            try:
-                user = CustomUser.objects.get(id=user_id)
-                status = obj.verification_status.get(str(user_id), 'pending')
-                details.append({
-                    'user_id': user_id,
-                    'user_name': user.full_name,
-                    'user_email': user.email,
-                    'status': status
-                })
-            except CustomUser.DoesNotExist:
+            user = users_by_id.get(user_id)
+            if user is None:
                 continue
+            status = verification_status.get(str(user_id), 'pending')
+            details.append({
+                'user_id': user_id,
+                'user_name': user.full_name,
+                'user_email': user.email,
+                'status': status
+            })
         
         return details
     
@@ -60,7 +80,7 @@ class ExpenseSerializer(serializers.ModelSerializer):
                           'group_name', 'verification_status', 'is_approved', 'verification_details')
 
 
-class ExpenseCreateSerializer(serializers.ModelSerializer):
+class ExpenseCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     group_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     splits = ExpenseSplitSerializer(many=True, write_only=True, required=False)
     
@@ -87,56 +107,88 @@ class ExpenseCreateSerializer(serializers.ModelSerializer):
         except Group.DoesNotExist:
             raise serializers.ValidationError("Group does not exist")
 
+    def validate(self, attrs):
+        splits_data = attrs.get('splits')
+        if not splits_data:
+            return attrs
+        
+        if attrs.get('split_type') == 'percentage':
+            # Amounts are derived from the percentages, to the cent, so
+            # they always add up to the expense amount
+            if any(split_data.get('percentage') is None for split_data in splits_data):
+                raise serializers.ValidationError({'splits': "Every split needs a percentage"})
+            if sum(split_data['percentage'] for split_data in splits_data) != 100:
+                raise serializers.ValidationError({'splits': "Percentages must add up to 100"})
+            splits_data = sorted(splits_data, key=lambda split_data: split_data['user_id'])
+            shares = Money.of(attrs['amount']).allocate(
+                [split_data['percentage'] for split_data in splits_data]
+            )
+            attrs['splits'] = [
+                {**split_data, 'amount': share.to_decimal()}
+                for split_data, share in zip(splits_data, shares)
+            ]
+        elif any(split_data.get('amount') is None for split_data in splits_data):
+            raise serializers.ValidationError({'splits': "Every split needs an amount"})
+        return attrs
+
+    @transaction.atomic
     def create(self, validated_data):
         splits_data = validated_data.pop('splits', [])
         group_id = validated_data.pop('group_id', None)
         request = self.context.get('request')
         
-        print(f"Creating expense with data: {validated_data}")
-        print(f"Splits data: {splits_data}")
-        print(f"Group ID: {group_id}")
-        
         group = None
         if group_id:
             from apps.groups.models import Group
             group = Group.objects.get(id=group_id)
-            print(f"Found group: {group.name}")
         
-        expense = Expense.objects.create(
+        # Work out who is splitting before touching the database, so the
+        # expense row is written once with is_approved already set
+        members = []
+        if not splits_data and group and validated_data.get('split_type') == 'equal':
+            # Create equal splits for all group members
+            from apps.groups.models import GroupMembership
+            members = list(GroupMembership.objects.filter(
+                group=group, is_active=True
+            ).values_list('user_id', flat=True))
+        
+        expense = Expense(
             paid_by=request.user,
             group=group,
             **validated_data
         )
+        splitter_ids = [split_data['user_id'] for split_data in splits_data] or members
+        approvals = expense.build_initial_approvals(splitter_ids)
+        expense.save()
+        ExpenseApproval.objects.bulk_create(approvals)
         
-        print(f"Created expense: {expense.id}")
-        print(f"Expense group: {expense.group}")
-        print(f"Expense group_id: {expense.group_id}")
+        logger.debug(
+            "Created expense %s in group %s with %s splits",
+            expense.id, group_id, len(splits_data) or len(members)
+        )
         
         # Create splits
         if splits_data:
-            for split_data in splits_data:
-                print(f"Creating split: {split_data}")
-                ExpenseSplit.objects.create(expense=expense, **split_data)
-        elif group and validated_data.get('split_type') == 'equal':
-            # Create equal splits for all group members
-            from apps.groups.models import GroupMembership
-            members = GroupMembership.objects.filter(group=group, is_active=True)
-            amount_per_person = expense.amount / members.count()
-            
-            for membership in members:
-                ExpenseSplit.objects.create(
-                    expense=expense,
-                    user=membership.user,
-                    amount=amount_per_person
-                )
+            ExpenseSplit.objects.bulk_create([
+                ExpenseSplit(expense=expense, **split_data)
+                for split_data in splits_data
+            ])
+        elif members:
+            # Shares differ by at most a cent and add up to the amount
+            shares = Money.of(expense.amount).split_evenly(len(members))
+            ExpenseSplit.objects.bulk_create([
+                ExpenseSplit(expense=expense, user_id=user_id, amount=share.to_decimal())
+                for user_id, share in zip(sorted(members), shares)
+            ])
         
-        # Initialize verification status after splits are created
-        expense.initialize_verification_status()
+        # Expenses nobody else has to approve count towards balances right away
+        if expense.is_approved:
+            expense.apply_to_balances()
         
         return expense
 
 
-class SettlementSerializer(serializers.ModelSerializer):
+class SettlementSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     from_user = UserSerializer(read_only=True)
     to_user = UserSerializer(read_only=True)
     group = GroupSerializer(read_only=True)
@@ -148,13 +200,35 @@ class SettlementSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at', 'confirmed_at')
 
 
-class SettlementCreateSerializer(serializers.ModelSerializer):
+class SettlementCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     to_user_id = serializers.IntegerField(write_only=True)
     group_id = serializers.IntegerField(write_only=True)
     
     class Meta:
         model = Settlement
         fields = ('to_user_id', 'group_id', 'amount', 'currency', 'notes')
+        extra_kwargs = {
+            'currency': {'required': False}
+        }
+
+    def validate_currency(self, value):
+        value = value.upper()
+        if not is_currency_code(value):
+            raise serializers.ValidationError("Must be a 3-letter currency code")
+        return value
+
+    def validate(self, attrs):
+        # Settle in the currency of the debt unless told otherwise
+        if 'currency' not in attrs:
+            request = self.context.get('request')
+            debt_currencies = PairBalance.debt_currencies(request.user.id, attrs['to_user_id'], attrs['group_id'])
+            if len(debt_currencies) > 1:
+                raise serializers.ValidationError({
+                    'currency': f"You owe this user in {', '.join(debt_currencies)}; say which currency you are settling"
+                })
+            if debt_currencies:
+                attrs['currency'] = debt_currencies[0]
+        return attrs
 
     def create(self, validated_data):
         to_user_id = validated_data.pop('to_user_id')
@@ -0,0 +1,130 @@
+"""
+Change counters behind the dashboard cache and ETags.
+
+Every write that can change what a user sees bumps that user's
+data_version, and every write that changes a group's members, expenses or
+settlements bumps the group's data_version, once the transaction commits
+(see apps.users.cache). Bulk writes do not send signals; code that uses
+bulk_create for expenses or splits bumps the counters itself with
+bump_after_commit().
+
+Deleting an expense also fails the payments still waiting to settle it,
+since the expense link is nulled on delete.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.groups.models import Group, GroupMembership
+from .models import Expense, ExpenseApproval, ExpenseSplit, Payment, Settlement
+
+
+# User fields shown inside group, expense and debt responses
+PROFILE_FIELDS = {
+    'email', 'username', 'first_name', 'last_name', 'phone_number',
+    'profile_picture', 'two_factor_enabled',
+}
+
+
+def bump_versions(user_ids=(), group_ids=()):
+    from apps.users.models import CustomUser
+    CustomUser.bump_data_version(user_ids)
+    Group.bump_data_version(group_ids)
+
+
+def bump_after_commit(user_ids=(), group_ids=()):
+    user_ids, group_ids = set(user_ids), set(group_ids)
+    transaction.on_commit(lambda: bump_versions(user_ids, group_ids))
+
+
+def expense_audience(expense_id, paid_by_id, group_id):
+    """Users whose dashboards show an expense: payer, split users and group members"""
+    user_ids = {paid_by_id}
+    user_ids.update(
+        ExpenseSplit.objects.filter(expense_id=expense_id).values_list('user_id', flat=True)
+    )
+    if group_id:
+        user_ids.update(GroupMembership.objects.filter(
+            group_id=group_id, is_active=True
+        ).values_list('user_id', flat=True))
+    return user_ids
+
+
+def bump_expense_after_commit(expense_id, extra_user_ids=()):
+    # Splits are usually written after their expense in the same transaction,
+    # so the audience is only worked out once everything has committed
+    def bump():
+        user_ids = set(extra_user_ids)
+        expense = Expense.objects.filter(id=expense_id).values_list(
+            'paid_by_id', 'group_id'
+        ).first()
+        if expense:
+            user_ids |= expense_audience(expense_id, *expense)
+        bump_versions(user_ids, [expense[1]] if expense else [])
+    
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Expense)
+def expense_saved(sender, instance, **kwargs):
+    bump_expense_after_commit(instance.id)
+
+
+@receiver(pre_delete, sender=Expense)
+def expense_deleted(sender, instance, **kwargs):
+    # The splits are gone after the delete, so collect the audience now
+    bump_after_commit(
+        expense_audience(instance.id, instance.paid_by_id, instance.group_id),
+        [instance.group_id]
+    )
+    # Expense payments cannot run once the link is nulled: they would settle
+    # every split between payer and receiver instead of this expense's
+    Payment.objects.filter(
+        expense_id=instance.id, splits_applied=False, status__in=['queued', 'processing']
+    ).update(
+        status='failed',
+        error='The expense was deleted before the payment was processed',
+        completed_at=timezone.now(),
+    )
+
+
+@receiver(post_save, sender=ExpenseSplit)
+@receiver(post_delete, sender=ExpenseSplit)
+def split_changed(sender, instance, origin=None, **kwargs):
+    # `origin` is the expense (or queryset of expenses) when the split is
+    # removed by a cascade, which expense_deleted has already handled
+    if getattr(origin, 'model', type(origin)) is Expense:
+        return
+    bump_expense_after_commit(instance.expense_id, [instance.user_id])
+
+
+@receiver(post_save, sender=ExpenseApproval)
+def approval_changed(sender, instance, **kwargs):
+    # Verification statuses are part of the expense's payload
+    bump_expense_after_commit(instance.expense_id)
+
+
+@receiver(post_save, sender=Settlement)
+@receiver(post_delete, sender=Settlement)
+def settlement_changed(sender, instance, **kwargs):
+    bump_after_commit([instance.from_user_id, instance.to_user_id], [instance.group_id])
+
+
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def membership_changed(sender, instance, **kwargs):
+    # Joining or leaving a group changes which expenses the user can see
+    bump_after_commit([instance.user_id], [instance.group_id])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def profile_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    # Members are listed by name in their groups' responses; logins only
+    # touch last_login and need no bump
+    if created or (update_fields is not None and not PROFILE_FIELDS & set(update_fields)):
+        return
+    bump_after_commit(group_ids=GroupMembership.objects.filter(
+        user_id=instance.id, is_active=True
+    ).values_list('group_id', flat=True))
@@ -0,0 +1,77 @@
+"""
+Minimum-cash-flow debt simplification for groups.
+
+Pairwise netting only cancels A <-> B debts. Here every member is reduced to a
+single net position (what the group owes them, or what they owe the group) and
+the largest debtor is repeatedly matched with the largest creditor. Each match
+settles at least one of the two members, so a group of n members needs at most
+n - 1 transfers and the matching runs in O(n log n) using two max-heaps.
+Each currency is simplified on its own.
+"""
+import heapq
+from collections import defaultdict
+from decimal import Decimal
+
+from .models import PairBalance
+
+
+def member_net_positions(group_id):
+    """
+    Net position per currency and member of a group, read from the
+    PairBalance ledger (approved splits minus confirmed settlements), as
+    {currency: {user_id: amount}}.
+
+    Positive = the group owes the member, negative = the member owes the group.
+    """
+    positions = defaultdict(lambda: defaultdict(Decimal))
+
+    ledger = PairBalance.objects.filter(group_id=group_id).values_list(
+        'debtor_id', 'creditor_id', 'currency', 'amount'
+    )
+    for debtor_id, creditor_id, currency, amount in ledger:
+        positions[currency][debtor_id] -= amount
+        positions[currency][creditor_id] += amount
+
+    return positions
+
+
+def simplify_debts(positions):
+    """
+    Turn net positions into a near-minimal list of transfers.
+
+    Returns a list of (from_user_id, to_user_id, amount) tuples. Ties are broken
+    by user id so the result is deterministic for the same input.
+    """
+    # heapq is a min-heap, so amounts are negated to pop the largest first
+    creditors = [(-amount, user_id) for user_id, amount in positions.items() if amount > 0]
+    debtors = [(amount, user_id) for user_id, amount in positions.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor_id = heapq.heappop(creditors)
+        debt, debtor_id = heapq.heappop(debtors)
+
+        amount = min(-credit, -debt)
+        transfers.append((debtor_id, creditor_id, amount))
+
+        # Whoever is not fully settled goes back on the heap with the remainder
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor_id))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor_id))
+
+    return transfers
+
+
+def simplify_group_debts(group_id):
+    """
+    Simplified transfers that settle every balance in a group, as
+    (from_user_id, to_user_id, amount, currency) tuples
+    """
+    return [
+        (*transfer, currency)
+        for currency, positions in sorted(member_net_positions(group_id).items())
+        for transfer in simplify_debts(positions)
+    ]
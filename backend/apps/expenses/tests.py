@@ -1,3 +1,1489 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.users.models import CustomUser
+from apps.groups.models import Group, GroupMembership
+from backend_project import instrumentation
+from . import balances, fx
+from .money import Money, from_cents
+from .models import Expense, ExpenseApproval, ExpenseSplit, FxRate, IdempotencyRecord, PairBalance, Payment, Settlement, UserBalanceSnapshot
+from .importer import ExpenseImporter, parse_ndjson
+from .simplify import member_net_positions, simplify_debts, simplify_group_debts
+from .serializers import ExpenseSerializer
+from .payments import apply_payment_splits, claim_payments, requeue_stale_payments, run_pending_payments
+
+
+class GroupFixtureMixin:
+    """An owner and a friend who share one group"""
+
+    def create_group(self):
+        self.user = CustomUser.objects.create_user(
+            email='owner@example.com', username='owner', password='password123'
+        )
+        self.friend = CustomUser.objects.create_user(
+            email='friend@example.com', username='friend', password='password123'
+        )
+        self.group = Group.objects.create(name='Flat', created_by=self.user)
+        GroupMembership.objects.create(group=self.group, user=self.user)
+        GroupMembership.objects.create(group=self.group, user=self.friend)
+
+    def authenticate(self, user):
+        # Real token auth, so every request loads the user's current data_version
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+
+class ExpenseListQueryCountTests(APITestCase):
+    """Serializing expense lists must not issue queries per expense or per user"""
+
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(
+                email=f'user{i}@example.com',
+                username=f'user{i}',
+                password='password123',
+                first_name=f'User{i}',
+                last_name='Test',
+            )
+            for i in range(8)
+        ]
+        self.user = self.users[0]
+        self.group = Group.objects.create(name='Trip', created_by=self.user)
+        for user in self.users:
+            GroupMembership.objects.create(group=self.group, user=user)
+        self.client.force_authenticate(self.user)
+
+    def create_expenses(self, count):
+        for i in range(count):
+            expense = Expense.objects.create(
+                title=f'Expense {i}',
+                amount=Decimal('80.00'),
+                paid_by=self.users[i % len(self.users)],
+                group=self.group,
+                expense_date=timezone.now(),
+            )
+            ExpenseSplit.objects.bulk_create([
+                ExpenseSplit(expense=expense, user=user, amount=Decimal('10.00'))
+                for user in self.users
+            ])
+
+    def test_group_expenses_query_count(self):
+        self.create_expenses(5)
+        url = f'/api/expenses/groups/{self.group.id}/'
+
+        # membership check, expenses (+payer, group), splits, split users, approvals
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(len(response.data[0]['verification_details']), 8)
+
+        self.create_expenses(20)
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 25)
+
+    def test_instrumentation(self):
+        self.create_expenses(3)
+        response = self.client.get(f'/api/expenses/groups/{self.group.id}/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="5 queries"', response['Server-Timing'])
+        # Serializer time is reported on its own, not inside the view's
+        self.assertRegex(response['Server-Timing'], r'view;dur=[\d.]+, serialize;dur=[\d.]+, render;dur=')
+        timer = instrumentation.SerializationTimer()
+        token = instrumentation.serialization_timer.set(timer)
+        try:
+            ExpenseSerializer(Expense.objects.with_details(), many=True).data
+        finally:
+            instrumentation.serialization_timer.reset(token)
+        self.assertGreater(timer.duration, 0)
+
+        # A sampled slow request reports its repeated statements; split users
+        # are fetched one by one without the prefetch
+        with mock.patch('backend_project.instrumentation.SQL_SAMPLE_RATE', 1.0), \
+                mock.patch('backend_project.instrumentation.SLOW_REQUEST_MS', 0), \
+                mock.patch('apps.expenses.models.ExpenseQuerySet.with_details', lambda queryset: queryset), \
+                self.assertLogs('backend_project.instrumentation', 'WARNING') as logs:
+            self.client.get(f'/api/expenses/groups/{self.group.id}/')
+        report = json.loads(logs.records[0].getMessage())
+        self.assertEqual(report['event'], 'slow_request')
+        self.assertGreaterEqual(report['repeated_sql'][0]['count'], 3)
+
+        # Closed by default; open to the scrape token or staff
+        self.assertEqual(self.client.get('/api/_metrics').status_code, 403)
+        with mock.patch('backend_project.instrumentation.METRICS_TOKEN', 'scrape-me'):
+            self.assertEqual(self.client.get('/api/_metrics').status_code, 401)
+            self.assertEqual(
+                self.client.get('/api/_metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401
+            )
+            metrics = self.client.get('/api/_metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(metrics['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn(
+            'http_requests_total{method="GET",route="api/expenses/groups/<int:group_id>/",status="200"}',
+            metrics.content.decode()
+        )
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/_metrics').status_code, 200)
+
+        # The per-request line is DEBUG only
+        with self.assertLogs('backend_project.instrumentation', 'DEBUG') as logs:
+            self.client.get('/api/expenses/')
+        self.assertEqual(logs.records[0].levelname, 'DEBUG')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['route'], 'api/expenses/')
+        self.assertIn('serialize_ms', record)
+
+    def test_expense_list_query_count(self):
+        self.create_expenses(5)
+
+        # expenses (+payer, group), splits, split users, approvals
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/expenses/')
+        self.assertEqual(len(response.data), 5)
+
+        self.create_expenses(20)
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/expenses/')
+        self.assertEqual(len(response.data), 25)
+
+
+class ExpenseCreateQueryCountTests(APITestCase):
+    """Expense creation must not issue queries per split"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='payer@example.com', username='payer', password='password123'
+        )
+        self.group = Group.objects.create(name='Flat', created_by=self.user)
+        GroupMembership.objects.create(group=self.group, user=self.user)
+        self.client.force_authenticate(self.user)
+
+    def add_members(self, count):
+        start = CustomUser.objects.count()
+        members = CustomUser.objects.bulk_create([
+            CustomUser(email=f'member{i}@example.com', username=f'member{i}')
+            for i in range(start, start + count)
+        ])
+        GroupMembership.objects.bulk_create([
+            GroupMembership(group=self.group, user=member) for member in members
+        ])
+
+    def create_equal_expense(self):
+        return self.client.post('/api/expenses/', {
+            'title': 'Groceries',
+            'amount': '120.00',
+            'group_id': self.group.id,
+            'split_type': 'equal',
+            'expense_date': timezone.now().isoformat(),
+        }, format='json')
+
+    def test_group_equal_split_query_count(self):
+        self.add_members(3)
+        with self.assertNumQueries(9):
+            response = self.create_equal_expense()
+        self.assertEqual(response.status_code, 201)
+
+        self.add_members(196)
+        with self.assertNumQueries(9):
+            response = self.create_equal_expense()
+        self.assertEqual(response.status_code, 201)
+
+        expense = Expense.objects.latest('id')
+        self.assertEqual(expense.expense_splits.count(), 200)
+        self.assertFalse(expense.is_approved)
+        self.assertEqual(expense.verification_status[str(self.user.id)], 'accepted')
+        self.assertEqual(
+            sum(status == 'pending' for status in expense.verification_status.values()), 199
+        )
+
+
+class ExpenseApprovalTests(GroupFixtureMixin, APITestCase):
+    """Approvals are rows per user: pending lists and approval checks are indexed lookups"""
+
+    def setUp(self):
+        self.create_group()
+
+    def create_expense(self, title):
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/expenses/', {
+            'title': title,
+            'amount': '40.00',
+            'group_id': self.group.id,
+            'split_type': 'equal',
+            'expense_date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Expense.objects.get(title=title)
+
+    def test_pending_approvals(self):
+        rent = self.create_expense('Rent')
+        self.create_expense('Power')
+
+        self.client.force_authenticate(self.friend)
+        # expenses (+payer, group), splits, split users, approvals
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/expenses/pending-approvals/')
+        self.assertEqual([expense['title'] for expense in response.data], ['Power', 'Rent'])
+
+        response = self.client.patch(
+            f'/api/expenses/{rent.id}/verification/update/', {'status': 'accepted'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['expense']['is_approved'])
+        self.assertEqual(response.data['expense']['verification_status'], {
+            str(self.user.id): 'accepted', str(self.friend.id): 'accepted',
+        })
+
+        response = self.client.get('/api/expenses/pending-approvals/')
+        self.assertEqual([expense['title'] for expense in response.data], ['Power'])
+
+        # The payer has nothing to approve
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/expenses/pending-approvals/').data, [])
+
+    def test_users_added_later_must_accept(self):
+        rent = self.create_expense('Rent')
+        latecomer = CustomUser.objects.create_user(
+            email='late@example.com', username='late', password='password123'
+        )
+        GroupMembership.objects.create(group=self.group, user=latecomer)
+        # Added to the splits without an approval row
+        ExpenseSplit.objects.create(expense=rent, user=latecomer, amount=Decimal('0.00'))
+
+        self.client.force_authenticate(self.friend)
+        response = self.client.patch(
+            f'/api/expenses/{rent.id}/verification/update/', {'status': 'accepted'}, format='json'
+        )
+        self.assertFalse(response.data['expense']['is_approved'])
+        self.assertEqual(response.data['expense']['verification_status'][str(latecomer.id)], 'pending')
+
+        self.client.force_authenticate(latecomer)
+        self.assertEqual(
+            [expense['title'] for expense in self.client.get('/api/expenses/pending-approvals/').data], ['Rent']
+        )
+        response = self.client.patch(
+            f'/api/expenses/{rent.id}/verification/update/', {'status': 'accepted'}, format='json'
+        )
+        self.assertTrue(response.data['expense']['is_approved'])
+
+
+class ExpenseImportTests(GroupFixtureMixin, APITestCase):
+    """Bulk import applies the single-create rules row by row"""
+
+    def setUp(self):
+        self.create_group()
+        self.client.force_authenticate(self.user)
+
+    def import_rows(self, body, content_type='application/x-ndjson'):
+        response = self.client.post('/api/expenses/bulk/', data=body, content_type=content_type)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ndjson(self, *rows):
+        return '\n'.join(json.dumps({
+            'amount': '100.00', 'group_id': self.group.id,
+            'expense_date': timezone.now().isoformat(), **row,
+        }) for row in rows)
+
+    def test_percentage_and_amount_splits(self):
+        summary = self.import_rows(self.ndjson(
+            {'title': 'Rent', 'split_type': 'equal'},
+            {'title': 'Power', 'split_type': 'percentage', 'splits': [
+                {'user_id': self.user.id, 'percentage': '33.33'},
+                {'user_id': self.friend.id, 'percentage': '66.67'},
+            ]},
+            {'title': 'Taxi', 'split_type': 'exact', 'splits': [
+                {'user_id': self.friend.id, 'amount': '100.00'},
+            ]},
+            {'title': 'Bad', 'split_type': 'percentage', 'splits': [
+                {'user_id': self.friend.id, 'percentage': '50'},
+            ]},
+        ))
+        self.assertEqual((summary['created'], summary['failed']), (3, 1))
+        self.assertEqual(summary['errors'], [{'row': 4, 'errors': {'splits': ['Percentages must add up to 100']}}])
+
+        splits = ExpenseSplit.objects.filter(expense__title='Power').order_by('user_id')
+        self.assertEqual([split.amount for split in splits], [Decimal('33.33'), Decimal('66.67')])
+        for expense in Expense.objects.prefetch_related('expense_splits'):
+            self.assertEqual(sum(split.amount for split in expense.expense_splits.all()), expense.amount)
+
+    def test_save_errors_do_not_leak_database_details(self):
+        bulk_create = Expense.objects.bulk_create
+
+        def failing_bulk_create(expenses, *args, **kwargs):
+            titles = {expense.title for expense in expenses}
+            if 'Clash' in titles:
+                raise IntegrityError('UNIQUE constraint failed: expenses.secret_column')
+            if 'Crash' in titles:
+                raise RuntimeError('password=hunter2')
+            return bulk_create(expenses, *args, **kwargs)
+
+        with mock.patch.object(Expense.objects, 'bulk_create', side_effect=failing_bulk_create), \
+                self.assertLogs('apps.expenses.importer', 'ERROR') as logs:
+            summary = self.import_rows(self.ndjson(
+                {'title': 'Rent'}, {'title': 'Clash'}, {'title': 'Crash'}, {'title': 'Power'},
+            ))
+
+        # Only the failing rows are lost, and the client sees generic messages
+        self.assertEqual((summary['created'], summary['failed']), (2, 2))
+        self.assertEqual(summary['errors'], [
+            {'row': 2, 'errors': {'non_field_errors': ["This row conflicts with existing data"]}},
+            {'row': 3, 'errors': {'non_field_errors': ["Could not save row"]}},
+        ])
+        self.assertEqual(set(Expense.objects.values_list('title', flat=True)), {'Rent', 'Power'})
+        # The unexpected error is logged with its cause
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('password=hunter2', logs.output[0])
+
+    def test_ndjson_rows(self):
+        other_group = Group.objects.create(name='Elsewhere', created_by=self.friend)
+        GroupMembership.objects.create(group=other_group, user=self.friend)
+        outsider = CustomUser.objects.create_user(
+            email='outsider@example.com', username='outsider', password='password123'
+        )
+        body = '\n'.join([
+            self.ndjson({'title': 'Rent', 'split_type': 'equal'}),
+            '{"title": "Broken"',
+            '',
+            '["not", "an", "object"]',
+            self.ndjson({'title': 'Theirs', 'split_type': 'equal', 'group_id': other_group.id}),
+            self.ndjson({'title': 'Missing', 'split_type': 'equal', 'group_id': 999999}),
+            self.ndjson({'title': 'Outsider', 'split_type': 'exact', 'splits': [
+                {'user_id': outsider.id, 'amount': '100.00'},
+            ]}),
+            self.ndjson({'title': 'Twice', 'split_type': 'exact', 'splits': [
+                {'user_id': self.friend.id, 'amount': '50.00'},
+                {'user_id': self.friend.id, 'amount': '50.00'},
+            ]}),
+            self.ndjson({'title': 'Unknown user', 'split_type': 'exact', 'group_id': None, 'splits': [
+                {'user_id': 999999, 'amount': '100.00'},
+            ]}),
+            self.ndjson({'title': 'No amount', 'split_type': 'exact', 'splits': [{'user_id': self.friend.id}]}),
+        ])
+        summary = self.import_rows(body)
+
+        self.assertEqual((summary['created'], summary['failed']), (1, 8))
+        errors = {error['row']: error['errors'] for error in summary['errors']}
+        self.assertEqual(sorted(errors), [2, 4, 5, 6, 7, 8, 9, 10])
+        self.assertTrue(errors[2]['non_field_errors'][0].startswith('Invalid JSON'))
+        self.assertEqual(errors[4], {'non_field_errors': ['Each line must be a JSON object']})
+        self.assertEqual(errors[5], {'group_id': ['You are not a member of this group']})
+        self.assertEqual(errors[6], {'group_id': ['Group does not exist']})
+        self.assertEqual(errors[7], {'splits': [f'Users [{outsider.id}] are not members of this group']})
+        self.assertEqual(errors[8], {'splits': ['A user appears in more than one split']})
+        self.assertEqual(errors[9], {'splits': ['Users [999999] do not exist']})
+        self.assertEqual(errors[10], {'splits': ['Every split needs an amount']})
+        self.assertEqual(list(Expense.objects.values_list('title', flat=True)), ['Rent'])
+
+    def test_csv_rows(self):
+        expense_date = timezone.now().isoformat()
+        body = '\n'.join([
+            'title,amount,group_id,split_type,expense_date,splits',
+            f'Rent,100.00,{self.group.id},equal,{expense_date},',
+            f'Taxi,30.00,{self.group.id},exact,{expense_date},{self.user.id}:10.00;{self.friend.id}:20.00',
+            f'Power,90.00,{self.group.id},percentage,{expense_date},'
+            f'"[{{""user_id"": {self.friend.id}, ""percentage"": 100}}]"',
+            f'Bad amount,lots,{self.group.id},equal,{expense_date},',
+            f'Bad splits,10.00,{self.group.id},exact,{expense_date},[oops',
+            f'No date,10.00,{self.group.id},equal,,',
+        ])
+        summary = self.import_rows(body, content_type='text/csv')
+
+        self.assertEqual((summary['created'], summary['failed']), (3, 3))
+        errors = {error['row']: error['errors'] for error in summary['errors']}
+        self.assertEqual(errors[4], {'amount': ['A valid number is required.']})
+        self.assertTrue(errors[5]['non_field_errors'][0].startswith('Invalid splits'))
+        self.assertEqual(errors[6], {'expense_date': ['This field is required.']})
+
+        amounts = dict(ExpenseSplit.objects.filter(expense__title='Taxi').values_list('user_id', 'amount'))
+        self.assertEqual(amounts, {self.user.id: Decimal('10.00'), self.friend.id: Decimal('20.00')})
+        self.assertEqual(
+            list(ExpenseSplit.objects.filter(expense__title='Power').values_list('amount', flat=True)),
+            [Decimal('90.00')]
+        )
+        self.assertEqual(ExpenseSplit.objects.filter(expense__title='Rent').count(), 2)
+
+    def test_chunks_share_the_membership_cache(self):
+        rows = [{'title': f'Expense {index}', 'split_type': 'equal'} for index in range(7)]
+        rows.insert(3, {'title': 'Bad', 'split_type': 'equal', 'amount': 'lots'})
+
+        importer = ExpenseImporter(mock.Mock(user=self.user), chunk_size=3)
+        with CaptureQueriesContext(connection) as queries:
+            summary = importer.run(parse_ndjson(StringIO(self.ndjson(*rows))))
+
+        self.assertEqual((summary['created'], summary['failed']), (7, 1))
+        self.assertEqual(summary['errors'][0]['row'], 4)
+        # The group is looked up once for all three chunks
+        self.assertEqual(sum('group_memberships' in query['sql'] for query in queries.captured_queries), 1)
+        self.assertEqual(Expense.objects.filter(group=self.group).count(), 7)
+        self.assertEqual(ExpenseSplit.objects.count(), 14)
+
+    def test_unsupported_content_type(self):
+        response = self.client.post('/api/expenses/bulk/', data='title\n', content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+
+
+class ExpenseLifecycleMixin(GroupFixtureMixin):
+    """Create and approve group expenses through the API"""
+
+    def create_expense(self, payer, title, amount, currency='USD'):
+        self.client.force_authenticate(payer)
+        response = self.client.post('/api/expenses/', {
+            'title': title,
+            'amount': amount,
+            'currency': currency,
+            'group_id': self.group.id,
+            'split_type': 'equal',
+            'expense_date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Expense.objects.get(title=title)
+
+    def set_approval(self, user, expense, approval):
+        self.client.force_authenticate(user)
+        response = self.client.patch(
+            f'/api/expenses/{expense.id}/verification/update/', {'status': approval}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class PairBalanceTests(ExpenseLifecycleMixin, APITestCase):
+    """The stored pair balances follow every approval change and delete"""
+
+    def setUp(self):
+        self.create_group()
+
+    def assert_pair_balances_current(self):
+        stored = {
+            (balance.group_id, balance.debtor_id, balance.creditor_id, balance.currency): balance.amount
+            for balance in PairBalance.objects.exclude(amount=0)
+        }
+        expected = {key: amount for key, amount in PairBalance.aggregate_balances().items() if amount}
+        self.assertEqual(stored, expected)
+
+    def test_pair_balances_follow_expense_changes(self):
+        rent = self.create_expense(self.user, 'Rent', '100.00')
+        self.assert_pair_balances_current()
+        self.assertFalse(PairBalance.objects.exclude(amount=0).exists())
+
+        self.set_approval(self.friend, rent, 'accepted')
+        self.assert_pair_balances_current()
+        self.assertEqual(
+            PairBalance.objects.get(debtor=self.friend, creditor=self.user).amount, Decimal('50.00')
+        )
+
+        self.set_approval(self.friend, rent, 'rejected')
+        self.assert_pair_balances_current()
+        self.assertFalse(PairBalance.objects.exclude(amount=0).exists())
+
+        self.set_approval(self.friend, rent, 'accepted')
+        groceries = self.create_expense(self.friend, 'Groceries', '30.00')
+        self.set_approval(self.user, groceries, 'accepted')
+        self.assert_pair_balances_current()
+        self.assertEqual(
+            PairBalance.objects.get(debtor=self.user, creditor=self.friend).amount, Decimal('15.00')
+        )
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.delete(f'/api/expenses/{rent.id}/').status_code, 204)
+        self.assert_pair_balances_current()
+        self.client.force_authenticate(self.friend)
+        self.assertEqual(self.client.delete(f'/api/expenses/{groceries.id}/').status_code, 204)
+        self.assert_pair_balances_current()
+        self.assertFalse(PairBalance.objects.exclude(amount=0).exists())
+
+    def test_currency_edit_moves_balances(self):
+        rent = self.create_expense(self.user, 'Rent', '100.00')
+        self.set_approval(self.friend, rent, 'accepted')
+
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(f'/api/expenses/{rent.id}/', {'currency': 'INR'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_pair_balances_current()
+        self.assertEqual(
+            {(balance.currency, balance.amount) for balance in PairBalance.objects.exclude(amount=0)},
+            {('INR', Decimal('50.00'))}
+        )
+        self.assertEqual(self.user.get_balance_summary()['currency'], 'INR')
+
+        self.assertEqual(self.client.delete(f'/api/expenses/{rent.id}/').status_code, 204)
+        self.assert_pair_balances_current()
+        self.assertFalse(PairBalance.objects.exclude(amount=0).exists())
+        self.assertFalse(UserBalanceSnapshot.objects.exclude(owed_to_others=0, owed_by_others=0).exists())
+
+
+class KeysetPaginationTests(GroupFixtureMixin, APITestCase):
+    """Cursor pages walk the feed newest first without gaps or repeats"""
+
+    def setUp(self):
+        self.create_group()
+        self.add_expenses(7)
+        # Rows sharing a timestamp are ordered by id
+        Expense.objects.filter(title__in=['Expense 2', 'Expense 3', 'Expense 4']).update(
+            created_at=Expense.objects.get(title='Expense 3').created_at
+        )
+        self.client.force_authenticate(self.user)
+
+    def add_expenses(self, count):
+        start = Expense.objects.count()
+        for i in range(start, start + count):
+            Expense.objects.create(
+                title=f'Expense {i}', amount=Decimal('10.00'), paid_by=self.user,
+                group=self.group, expense_date=timezone.now()
+            )
+
+    def feed_ids(self):
+        return list(Expense.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [expense['id'] for expense in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_the_feed(self):
+        expected = self.feed_ids()
+        self.assertEqual(self.walk('/api/expenses/?page_size=3'), expected)
+        self.assertEqual(self.walk(f'/api/expenses/groups/{self.group.id}/?page_size=2'), expected)
+
+        # Unpaginated clients still get a plain list
+        self.assertEqual([expense['id'] for expense in self.client.get('/api/expenses/').data], expected)
+
+    def test_next_cursor(self):
+        response = self.client.get('/api/expenses/?page_size=3')
+        first_page = [expense['id'] for expense in response.data['results']]
+        self.assertEqual(first_page, self.feed_ids()[:3])
+        self.assertIn('page_size=3', response.data['next'])
+        self.assertIn('cursor=', response.data['next'])
+
+        response = self.client.get('/api/expenses/?page_size=7')
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertIsNone(response.data['next'])
+
+        self.assertEqual(self.client.get('/api/expenses/?cursor=not-a-cursor').status_code, 404)
+
+    def test_stable_across_inserts(self):
+        before = self.feed_ids()
+        response = self.client.get('/api/expenses/?page_size=3')
+        seen = [expense['id'] for expense in response.data['results']]
+
+        # New expenses land before the cursor and do not shift later pages
+        self.add_expenses(4)
+        seen += self.walk(response.data['next'])
+        self.assertEqual(seen, before)
+
+
+class BalanceSnapshotTests(ExpenseLifecycleMixin, APITestCase):
+    """The per-user snapshots follow every approval change and the rebuild command finds drift"""
+
+    def setUp(self):
+        self.create_group()
+
+    def assert_snapshots_current(self):
+        stored = {
+            (snapshot.user_id, snapshot.currency): (snapshot.owed_to_others, snapshot.owed_by_others)
+            for snapshot in UserBalanceSnapshot.objects.exclude(owed_to_others=0, owed_by_others=0)
+        }
+        expected = {
+            key: totals for key, totals in UserBalanceSnapshot.aggregate_balances().items() if any(totals)
+        }
+        self.assertEqual(stored, expected)
+        for snapshot in UserBalanceSnapshot.objects.all():
+            self.assertEqual(snapshot.net, snapshot.owed_by_others - snapshot.owed_to_others)
+
+    def test_snapshots_follow_expense_changes(self):
+        rent = self.create_expense(self.user, 'Rent', '100.00')
+        # Pending expenses do not count yet
+        self.assertEqual(self.user.get_balance_summary()['net_balance'], 0.0)
+        self.assert_snapshots_current()
+
+        self.set_approval(self.friend, rent, 'accepted')
+        self.assert_snapshots_current()
+        with self.assertNumQueries(1):
+            summary = self.user.get_balance_summary()
+        self.assertEqual(summary, {
+            'owed_to_others': 0.0, 'owed_by_others': 50.0, 'net_balance': 50.0, 'currency': 'USD',
+            'by_currency': {'USD': {'owed_to_others': 0.0, 'owed_by_others': 50.0, 'net_balance': 50.0}},
+        })
+
+        self.set_approval(self.friend, rent, 'rejected')
+        self.assert_snapshots_current()
+        self.assertEqual(self.friend.get_balance_summary()['owed_to_others'], 0.0)
+
+        self.set_approval(self.friend, rent, 'accepted')
+        hotel = self.create_expense(self.friend, 'Hotel', '3000.00', currency='INR')
+        self.set_approval(self.user, hotel, 'accepted')
+        self.assert_snapshots_current()
+
+        # USD and INR are reported side by side, never added up
+        summary = self.user.get_balance_summary()
+        self.assertIsNone(summary['currency'])
+        self.assertIsNone(summary['net_balance'])
+        self.assertEqual(summary['by_currency']['USD']['net_balance'], 50.0)
+        self.assertEqual(summary['by_currency']['INR']['net_balance'], -1500.0)
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.delete(f'/api/expenses/{rent.id}/').status_code, 204)
+        self.assert_snapshots_current()
+        self.assertEqual(self.user.get_balance_summary()['currency'], 'INR')
+
+    def test_rebuild_reports_and_repairs_drift(self):
+        rent = self.create_expense(self.user, 'Rent', '100.00')
+        self.set_approval(self.friend, rent, 'accepted')
+        UserBalanceSnapshot.objects.filter(user=self.friend).update(owed_to_others=Decimal('7.00'))
+
+        output = StringIO()
+        call_command('rebuild_balance_snapshots', dry_run=True, stdout=output)
+        self.assertIn(f'user={self.friend.id} currency=USD stored(to=7.00', output.getvalue())
+        self.assertIn('1 of 2 snapshot(s) drifted', output.getvalue())
+        # A dry run only reports
+        self.assertEqual(UserBalanceSnapshot.objects.get(user=self.friend).owed_to_others, Decimal('7.00'))
+
+        call_command('rebuild_balance_snapshots', stdout=StringIO())
+        self.assert_snapshots_current()
+        output = StringIO()
+        call_command('rebuild_balance_snapshots', dry_run=True, stdout=output)
+        self.assertIn('0 of 2 snapshot(s) drifted', output.getvalue())
+
+
+class IdempotencyKeyTests(GroupFixtureMixin, APITestCase):
+    """Writes retried with the same Idempotency-Key run once and replay the first response"""
+
+    def setUp(self):
+        self.create_group()
+        self.expense_date = timezone.now().isoformat()
+        self.client.force_authenticate(self.user)
+
+    def post_expense(self, title, **headers):
+        return self.client.post('/api/expenses/', {
+            'title': title,
+            'amount': '30.00',
+            'split_type': 'exact',
+            'expense_date': self.expense_date,
+            'splits': [{'user_id': self.friend.id, 'amount': '30.00'}],
+        }, format='json', **headers)
+
+    def test_expense_create_replay(self):
+        first = self.post_expense('Taxi', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(first.status_code, 201)
+
+        replayed = self.post_expense('Taxi', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.json(), first.json())
+        self.assertEqual(Expense.objects.count(), 1)
+
+        # The same key for a different request is refused
+        reused = self.post_expense('Bus', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(reused.status_code, 422)
+
+        # Other keys, and requests without a key, run as usual
+        self.assertEqual(self.post_expense('Bus', HTTP_IDEMPOTENCY_KEY='retry-2').status_code, 201)
+        self.assertEqual(self.post_expense('Bus').status_code, 201)
+        self.assertEqual(Expense.objects.count(), 3)
+
+    def test_settlement_and_payment_replay(self):
+        for _ in range(2):
+            response = self.client.post('/api/expenses/settlements/create/', {
+                'to_user_id': self.friend.id, 'group_id': self.group.id, 'amount': '12.50',
+            }, format='json', HTTP_IDEMPOTENCY_KEY='settle-1')
+            self.assertEqual(response.status_code, 201)
+            response = self.client.post('/api/expenses/settlements/process-payment/', {
+                'receiver_id': self.friend.id, 'amount': '12.50', 'payment_method': 'upi',
+            }, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+            self.assertEqual(response.status_code, 202)
+        self.assertEqual(Settlement.objects.count(), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_crash_before_the_record_is_stored(self):
+        original_save = IdempotencyRecord.save
+
+        def crash_on_finish(record, *args, **kwargs):
+            if kwargs.get('update_fields'):
+                raise RuntimeError('worker died')
+            return original_save(record, *args, **kwargs)
+
+        with mock.patch.object(IdempotencyRecord, 'save', crash_on_finish), self.assertRaises(RuntimeError):
+            self.post_expense('Taxi', HTTP_IDEMPOTENCY_KEY='retry-1')
+        # The expense went with the key, so the retry runs instead of a 409
+        self.assertFalse(Expense.objects.exists())
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        response = self.post_expense('Taxi', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Expense.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        self.post_expense('Taxi', HTTP_IDEMPOTENCY_KEY='shared')
+        self.client.force_authenticate(self.friend)
+        self.assertNotIn('Idempotent-Replayed', self.post_expense('Taxi', HTTP_IDEMPOTENCY_KEY='shared'))
+        self.assertEqual(Expense.objects.count(), 2)
+        self.assertEqual(IdempotencyRecord.objects.count(), 2)
+
+
+class DashboardCacheTests(GroupFixtureMixin, APITestCase):
+    """Repeat dashboard loads are served from the per-user cache until a write bumps it"""
+
+    def setUp(self):
+        self.create_group()
+
+    def create_expense_as_friend(self):
+        self.authenticate(self.friend)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/expenses/', {
+                'title': 'Rent',
+                'amount': '100.00',
+                'group_id': self.group.id,
+                'split_type': 'equal',
+                'expense_date': timezone.now().isoformat(),
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.authenticate(self.user)
+
+    def test_dashboards_cached_until_expense_written(self):
+        self.authenticate(self.user)
+        for url, key in (('/api/auth/dashboard/', 'recent_expenses'),
+                         ('/api/expenses/dashboard/', 'recent_expenses')):
+            response = self.client.get(url)
+            self.assertEqual(response.json()[key], [])
+
+            # Only the authentication lookup of the user
+            with self.assertNumQueries(1):
+                cached = self.client.get(url)
+            self.assertEqual(cached.json(), response.json())
+
+        self.create_expense_as_friend()
+
+        response = self.client.get('/api/auth/dashboard/')
+        self.assertEqual(len(response.json()['recent_expenses']), 1)
+        response = self.client.get('/api/expenses/dashboard/')
+        self.assertEqual(len(response.json()['recent_expenses']), 1)
+
+
+class AsyncViewTests(GroupFixtureMixin, TestCase):
+    """The async read endpoints authenticate like the DRF views and run through the async middleware"""
+
+    def setUp(self):
+        self.create_group()
+
+        expense = Expense.objects.create(
+            title='Rent', amount=Decimal('100.00'), paid_by=self.user, group=self.group,
+            split_type='equal', expense_date=timezone.now(), is_approved=True
+        )
+        for user in (self.user, self.friend):
+            ExpenseSplit.objects.create(expense=expense, user=user, amount=Decimal('50.00'))
+        PairBalance.rebuild([self.group.id])
+
+    def get(self, url, user):
+        return self.async_client.get(url, headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'})
+
+    async def test_group_balance_summary(self):
+        url = f'/api/expenses/groups/{self.group.id}/balance/'
+        response = await self.get(url, self.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        self.assertEqual(response.json(), {
+            'group_id': self.group.id,
+            'total_expenses': 100.0,
+            'user_balance': 50.0,
+            'total_user_owes': 0.0,
+            'total_owed_to_user': 50.0,
+            'net_status': 'owed_to_you',
+        })
+
+        response = await self.get(url, self.friend)
+        self.assertEqual(response.json()['total_user_owes'], 50.0)
+        self.assertEqual(response.json()['net_status'], 'you_owe')
+
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, headers={'Authorization': 'Bearer nonsense'})).status_code, 401)
+        self.assertEqual((await self.get(f'/api/expenses/groups/{self.group.id + 1}/balance/', self.user)).status_code, 403)
+
+    async def test_dashboards(self):
+        summary = (await self.get('/api/expenses/dashboard/', self.user)).json()
+        self.assertEqual(summary['group_count'], 1)
+        self.assertEqual(summary['others_owe'], 50.0)
+        self.assertEqual([debt['id'] for debt in summary['settlements_received']], [self.friend.id])
+        self.assertEqual(summary['recent_expenses'][0]['title'], 'Rent')
+
+        dashboard = (await self.get('/api/auth/dashboard/', self.friend)).json()
+        self.assertEqual(dashboard['stats']['total_expenses'], 1)
+        self.assertEqual(dashboard['stats']['groups_count'], 1)
+        self.assertEqual(dashboard['user']['email'], 'friend@example.com')
+
+
+class PaymentLedgerMixin:
+    """Five approved 10.00 debts from payer to receiver in one group"""
+
+    def create_ledger(self):
+        self.payer = CustomUser.objects.create_user(
+            email='payer@example.com', username='payer', password='password123'
+        )
+        self.receiver = CustomUser.objects.create_user(
+            email='receiver@example.com', username='receiver', password='password123'
+        )
+        self.group = Group.objects.create(name='Flat', created_by=self.receiver)
+        for i in range(5):
+            expense = Expense.objects.create(
+                title=f'Expense {i}',
+                amount=Decimal('20.00'),
+                paid_by=self.receiver,
+                group=self.group,
+                expense_date=timezone.now(),
+                is_approved=True,
+            )
+            ExpenseSplit.objects.bulk_create([
+                ExpenseSplit(expense=expense, user=self.payer, amount=Decimal('10.00')),
+                ExpenseSplit(expense=expense, user=self.receiver, amount=Decimal('10.00')),
+            ])
+            expense.apply_to_balances()
+
+    def queue_payments(self, count, amount):
+        return [
+            Payment.objects.create(
+                payer=self.payer,
+                receiver=self.receiver,
+                amount=amount,
+                payment_method='cash',
+                transaction_id=f'TX{i:010d}',
+            ).id
+            for i in range(count)
+        ]
+
+    def assert_ledger_conserved(self, paid):
+        owed = sum(ExpenseSplit.objects.filter(user=self.payer).values_list('amount', flat=True))
+        self.assertEqual(owed, Decimal('50.00') - paid)
+        balance = PairBalance.objects.get(group=self.group, debtor=self.payer, creditor=self.receiver)
+        self.assertEqual(balance.amount, owed)
+        self.assertEqual(
+            PairBalance.aggregate_balances([self.group.id])[(self.group.id, self.payer.id, self.receiver.id, 'USD')],
+            owed
+        )
+
+
+class PaymentSettlementTests(PaymentLedgerMixin, TestCase):
+    """Settling a payment reduces exactly the amount paid, across splits"""
+
+    def setUp(self):
+        self.create_ledger()
+
+    def test_payments_conserve_ledger(self):
+        for payment_id in self.queue_payments(6, Decimal('7.00')):
+            payment = apply_payment_splits(payment_id)
+            self.assertEqual(payment.status, 'completed')
+        self.assert_ledger_conserved(Decimal('42.00'))
+
+        # Retrying a settled payment changes nothing
+        apply_payment_splits(payment_id)
+        self.assert_ledger_conserved(Decimal('42.00'))
+
+
+class PaymentQueueTests(PaymentLedgerMixin, APITestCase):
+    """Queueing, claiming, requeuing and polling payments"""
+
+    def setUp(self):
+        self.create_ledger()
+
+    def test_unknown_settlement_type_is_rejected(self):
+        self.client.force_authenticate(self.payer)
+        response = self.client.post('/api/expenses/settlements/process-payment/', {
+            'receiver_id': self.receiver.id,
+            'amount': '5.00',
+            'payment_method': 'cash',
+            'settlement_type': 'everything',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_only_one_worker_claims_a_payment(self):
+        first, second = self.queue_payments(2, Decimal('5.00'))
+        real_now = timezone.now
+        calls = []
+
+        def now_after_another_worker_claims():
+            # Another worker wins the first payment between our candidate
+            # query and our conditional UPDATE
+            if not calls:
+                Payment.objects.filter(id=first).update(status='processing')
+            calls.append(1)
+            return real_now()
+
+        with mock.patch('apps.expenses.payments.timezone.now', now_after_another_worker_claims):
+            claimed = claim_payments()
+
+        self.assertEqual([payment.id for payment in claimed], [second])
+        self.assertEqual(claim_payments(), [])
+
+    def test_stale_payments_are_requeued_and_run(self):
+        stale, recent = self.queue_payments(2, Decimal('5.00'))
+        Payment.objects.filter(id=stale).update(
+            status='processing', started_at=timezone.now() - timedelta(minutes=10)
+        )
+        Payment.objects.filter(id=recent).update(status='processing', started_at=timezone.now())
+
+        self.assertEqual(requeue_stale_payments(timedelta(minutes=5)), 1)
+        self.assertEqual(Payment.objects.get(id=stale).status, 'queued')
+        self.assertEqual(Payment.objects.get(id=recent).status, 'processing')
+
+        Payment.objects.filter(id=stale).update(status='processing', started_at=timezone.now() - timedelta(minutes=10))
+        with mock.patch('apps.expenses.payments.time.sleep'), \
+                mock.patch('apps.expenses.payments.random.random', return_value=0):
+            self.assertEqual(run_pending_payments(stale_after=timedelta(minutes=5)), 1)
+        payment = Payment.objects.get(id=stale)
+        self.assertEqual((payment.status, payment.attempts), ('completed', 1))
+        self.assert_ledger_conserved(Decimal('5.00'))
+
+    def test_status_endpoint(self):
+        payment_id, = self.queue_payments(1, Decimal('5.00'))
+        url = f'/api/expenses/settlements/payments/{payment_id}/'
+
+        self.client.force_authenticate(self.payer)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(response.data['requested_amount'], 5.0)
+
+        apply_payment_splits(payment_id)
+        self.client.force_authenticate(self.receiver)
+        response = self.client.get(url)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(response.data['payment_id'], payment_id)
+        self.assertEqual(response.data['actual_amount'], 5.0)
+
+        outsider = CustomUser.objects.create_user(
+            email='outsider@example.com', username='outsider', password='password123'
+        )
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_deleting_the_expense_fails_its_payment(self):
+        expense = Expense.objects.filter(group=self.group).first()
+        payment_id, = self.queue_payments(1, Decimal('30.00'))
+        Payment.objects.filter(id=payment_id).update(expense=expense)
+        expense.delete()
+
+        payment = apply_payment_splits(payment_id)
+        self.assertEqual(payment.status, 'failed')
+        self.assertIsNone(payment.expense_id)
+        self.assertFalse(payment.splits_applied)
+        # The other expenses' splits are untouched
+        self.assertEqual(
+            set(ExpenseSplit.objects.filter(user=self.payer).values_list('amount', flat=True)), {Decimal('10.00')}
+        )
+
+        self.client.force_authenticate(self.payer)
+        response = self.client.get(f'/api/expenses/settlements/payments/{payment_id}/')
+        self.assertEqual((response.data['success'], response.data['status']), (False, 'failed'))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentPaymentTests(PaymentLedgerMixin, TransactionTestCase):
+    """Parallel payments over the same splits never lose an update"""
+
+    def setUp(self):
+        self.create_ledger()
+
+    def test_parallel_payments_conserve_ledger(self):
+        payment_ids = self.queue_payments(6, Decimal('7.00'))
+        barrier = threading.Barrier(len(payment_ids))
+        errors = []
+
+        def pay(payment_id):
+            try:
+                barrier.wait()
+                apply_payment_splits(payment_id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay, args=(payment_id,)) for payment_id in payment_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assert_ledger_conserved(Decimal('42.00'))
+
+
+class SimplifyDebtsTests(APITestCase):
+    """Simplified transfers settle every member's net position exactly"""
+
+    def assert_settles(self, positions, transfers):
+        remaining = defaultdict(Decimal, positions)
+        for from_user_id, to_user_id, amount in transfers:
+            self.assertGreater(amount, 0)
+            remaining[from_user_id] += amount
+            remaining[to_user_id] -= amount
+        self.assertEqual({user_id: amount for user_id, amount in remaining.items() if amount}, {})
+        self.assertLessEqual(len(transfers), max(len([amount for amount in positions.values() if amount]) - 1, 0))
+
+    def test_random_positions(self):
+        rng = random.Random(7)
+        for _ in range(50):
+            amounts = [Decimal(rng.randint(-50000, 50000)) / 100 for _ in range(rng.randint(1, 12))]
+            # The last member balances the group
+            amounts.append(-sum(amounts))
+            positions = dict(enumerate(amounts))
+            self.assert_settles(positions, simplify_debts(positions))
+
+    def test_groups_settle_their_ledger(self):
+        call_command('seed_synthetic', users=10, groups=2, expenses=80, stdout=StringIO())
+        group = Group.objects.order_by('id').first()
+        debtor, creditor = group.members.order_by('id')[:2]
+        settlement = Settlement.objects.create(
+            group=group, from_user=debtor, to_user=creditor, amount=Decimal('12.34'), status='confirmed'
+        )
+        PairBalance.apply_settlement(settlement)
+
+        for group in Group.objects.all():
+            positions = member_net_positions(group.id)
+            # The ledger positions are what the splits and settlements say
+            expected = defaultdict(Decimal)
+            for split in ExpenseSplit.objects.filter(expense__group=group, expense__is_approved=True).select_related('expense'):
+                expected[split.user_id] -= split.amount
+                expected[split.expense.paid_by_id] += split.amount
+            for payment in Settlement.objects.filter(group=group, status='confirmed'):
+                expected[payment.from_user_id] += payment.amount
+                expected[payment.to_user_id] -= payment.amount
+            self.assertEqual(
+                {user_id: amount for user_id, amount in positions['USD'].items() if amount},
+                {user_id: amount for user_id, amount in expected.items() if amount}
+            )
+
+            transfers = simplify_group_debts(group.id)
+            self.assertTrue(transfers)
+            self.assert_settles(positions['USD'], [transfer[:3] for transfer in transfers])
+            self.assertEqual({transfer[3] for transfer in transfers}, {'USD'})
+
+        group = settlement.group
+        self.client.force_authenticate(debtor)
+        response = self.client.get(f'/api/expenses/debts/groups/{group.id}/simplified/')
+        self.assertEqual(
+            [(t['from_user']['id'], t['to_user']['id'], t['amount']) for t in response.data['transfers']],
+            [(from_user_id, to_user_id, float(amount)) for from_user_id, to_user_id, amount, _ in simplify_group_debts(group.id)]
+        )
+        self.assertEqual(response.data['transfer_count'], len(response.data['transfers']))
+
+        outsider = CustomUser.objects.create_user(
+            email='outsider@example.com', username='outsider', password='password123'
+        )
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.client.get(f'/api/expenses/debts/groups/{group.id}/simplified/').status_code, 403)
+
+
+class SyntheticBenchmarkTests(TestCase):
+    """The seeded dataset is consistent and the API benchmark reports every scenario"""
+
+    def setUp(self):
+        call_command('seed_synthetic', users=10, groups=3, expenses=40, batch_size=15, stdout=StringIO())
+
+    def test_seeded_splits_add_up(self):
+        self.assertEqual(Expense.objects.count(), 40)
+        for expense in Expense.objects.prefetch_related('expense_splits', 'approvals'):
+            splits = list(expense.expense_splits.all())
+            self.assertEqual(sum(split.amount for split in splits), expense.amount)
+            approvers = {approval.user_id for approval in expense.approvals.all()}
+            self.assertLessEqual({split.user_id for split in splits}, approvers)
+            if expense.split_type == 'percentage':
+                self.assertAlmostEqual(sum(split.percentage for split in splits), 100, delta=Decimal('0.1'))
+        self.assertTrue(PairBalance.objects.exists())
+
+    def test_benchmark_writes_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark_api', users=3, warmup=1, repeat=4, output=output,
+                stdout=StringIO(), stderr=StringIO()
+            )
+            with open(output) as results_file:
+                report = json.load(results_file)
+            call_command(
+                'benchmark_api', users=3, warmup=0, repeat=2, scenarios=['debts'], compare=output,
+                threshold=100, fail_on_regression=True, stdout=StringIO(), stderr=StringIO()
+            )
+
+        self.assertEqual(report['meta']['dataset']['expenses'], 40)
+        for result in report['results'].values():
+            self.assertEqual(result['requests'], 4)
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['queries_mean'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class BalanceKernelTests(APITestCase):
+    """The integer-cent balance kernels match a Decimal sum of the same splits exactly"""
+
+    def setUp(self):
+        call_command('seed_synthetic', users=12, groups=2, expenses=120, stdout=StringIO())
+        self.splits = ExpenseSplit.objects.filter(expense__is_approved=True)
+
+    def decimal_balances(self, user_id):
+        expected = defaultdict(Decimal)
+        for split in self.splits.select_related('expense'):
+            payer_id = split.expense.paid_by_id
+            if split.user_id == user_id and payer_id != user_id:
+                expected[payer_id] += split.amount
+            elif payer_id == user_id and split.user_id != user_id:
+                expected[split.user_id] -= split.amount
+        return {other_id: amount for other_id, amount in expected.items() if amount}
+
+    def decimal_matrix(self):
+        expected = defaultdict(Decimal)
+        for split in self.splits.select_related('expense'):
+            if split.user_id != split.expense.paid_by_id:
+                expected[(split.user_id, split.expense.paid_by_id)] += split.amount
+        return expected
+
+    def assert_matrix(self, member_ids, matrix):
+        expected = self.decimal_matrix()
+        for i, debtor_id in enumerate(member_ids):
+            for j, creditor_id in enumerate(member_ids):
+                self.assertEqual(from_cents(matrix[i][j]), expected[(debtor_id, creditor_id)])
+
+    def test_counterparty_balances(self):
+        rows = balances.ledger_rows(self.splits)
+        for user in CustomUser.objects.all():
+            self.assertEqual(balances.counterparty_balances(rows, user.id), self.decimal_balances(user.id))
+
+    def test_python_net_matrix(self):
+        self.assert_matrix(*balances.python_net_matrix(balances.ledger_rows(self.splits)))
+
+    def test_numpy_net_matrix(self):
+        rows = balances.ledger_rows(self.splits)
+        self.assert_matrix(*balances.numpy_net_matrix(rows))
+        self.assertEqual(balances.numpy_net_matrix([])[0], [])
+
+        # Past float64's exact range the int64 np.add.at path is used
+        with mock.patch.object(balances, 'EXACT_FLOAT_LIMIT', 0):
+            self.assert_matrix(*balances.numpy_net_matrix(rows))
+        member_ids, matrix = balances.numpy_net_matrix([(1, 2, 2 ** 53), (1, 2, 1)])
+        self.assertEqual(int(matrix[member_ids.index(2)][member_ids.index(1)]), 2 ** 53 + 1)
+
+    def test_settlement_summaries(self):
+        group = Group.objects.first()
+        user = group.members.first()
+        self.client.force_authenticate(user)
+        expected = self.decimal_balances(user.id)
+
+        # The ledger and the counterparties, however many splits
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/expenses/settlements/summary/')
+        self.assertEqual(
+            {row['user_id']: Decimal(str(row['amount'])) for row in response.data['summary']}, expected
+        )
+
+        self.splits = self.splits.filter(expense__group=group)
+        response = self.client.get(f'/api/groups/{group.id}/settlements/summary/')
+        self.assertEqual(
+            {row['user_id']: Decimal(str(row['balance'])) for row in response.data['summary']},
+            self.decimal_balances(user.id)
+        )
+
+
+class MoneyTests(APITestCase):
+    """Shares are whole cents that always add up to the amount"""
+
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(
+                email=f'money{i}@example.com', username=f'money{i}', password='pass12345'
+            )
+            for i in range(3)
+        ]
+        self.group = Group.objects.create(name='Trip', created_by=self.users[0])
+        for user in self.users:
+            GroupMembership.objects.create(group=self.group, user=user)
+        self.client.force_authenticate(self.users[0])
+
+    def test_allocate(self):
+        self.assertEqual(Money.of('10.00').split_evenly(3), [Money(334), Money(333), Money(333)])
+        self.assertEqual(Money.of('-0.05').split_evenly(3), [Money(-2), Money(-2), Money(-1)])
+        self.assertEqual(Money.of('100.00').allocate([Decimal('33.33')] * 3), [Money(3334), Money(3333), Money(3333)])
+        self.assertEqual(Money.of('0.10').allocate([1, 0, 3]), [Money(3), Money(0), Money(7)])
+        self.assertEqual(Money.of('1.005'), Money(101))
+        for cents in range(0, 1000, 7):
+            for count in range(1, 12):
+                self.assertEqual(sum(share.cents for share in Money(cents).split_evenly(count)), cents)
+        with self.assertRaises(ValueError):
+            Money(100).allocate([0, 0])
+        with self.assertRaises(TypeError):
+            Money(1.5)
+
+    def post_expense(self, split_type, **data):
+        return self.client.post('/api/expenses/', {
+            'title': 'Dinner',
+            'amount': '100.00',
+            'group_id': self.group.id,
+            'split_type': split_type,
+            'expense_date': timezone.now().isoformat(),
+            **data,
+        }, format='json')
+
+    def test_equal_split_adds_up(self):
+        response = self.post_expense('equal')
+        self.assertEqual(response.status_code, 201)
+        amounts = list(ExpenseSplit.objects.order_by('user_id').values_list('amount', flat=True))
+        self.assertEqual(amounts, [Decimal('33.34'), Decimal('33.33'), Decimal('33.33')])
+
+    def test_percentage_split_adds_up(self):
+        response = self.post_expense('percentage', splits=[
+            {'user_id': user.id, 'percentage': percentage}
+            for user, percentage in zip(self.users, ['33.33', '33.33', '33.34'])
+        ])
+        self.assertEqual(response.status_code, 201)
+        amounts = list(ExpenseSplit.objects.order_by('user_id').values_list('amount', flat=True))
+        self.assertEqual(amounts, [Decimal('33.33'), Decimal('33.33'), Decimal('33.34')])
+
+        response = self.post_expense('percentage', splits=[
+            {'user_id': user.id, 'percentage': '30'} for user in self.users
+        ])
+        self.assertEqual(response.status_code, 400)
+        response = self.post_expense('exact', splits=[{'user_id': self.users[1].id}])
+        self.assertEqual(response.status_code, 400)
+
+
+class DebtResponseTests(GroupFixtureMixin, APITestCase):
+    """The debts payload read from the aggregated ledger, pinned byte for byte"""
+
+    def setUp(self):
+        self.create_group()
+        self.carol = CustomUser.objects.create_user(
+            email='carol@example.com', username='carol', password='password123',
+            first_name='Carol', last_name='Jones'
+        )
+        self.trip = Group.objects.create(name='Trip', created_by=self.friend)
+        for user in (self.user, self.friend, self.carol):
+            GroupMembership.objects.create(group=self.trip, user=user)
+
+        self.add_expense(self.group, self.user, {self.user: '45.00', self.friend: '45.00'})
+        self.add_expense(self.trip, self.friend, {self.user: '20.00', self.friend: '20.00', self.carol: '20.00'})
+        self.add_expense(self.trip, self.carol, {self.user: '15.50', self.carol: '15.50'})
+        # Unapproved expenses do not count
+        self.add_expense(self.trip, self.carol, {self.user: '99.00', self.carol: '1.00'}, is_approved=False)
+        settlement = Settlement.objects.create(
+            group=self.group, from_user=self.friend, to_user=self.user, amount=Decimal('10.00'), status='confirmed'
+        )
+        PairBalance.apply_settlement(settlement)
+        self.client.force_authenticate(self.user)
+
+    def add_expense(self, group, payer, shares, is_approved=True):
+        expense = Expense.objects.create(
+            title='Shared', amount=sum(Decimal(amount) for amount in shares.values()), paid_by=payer,
+            group=group, expense_date=timezone.now(), is_approved=is_approved
+        )
+        for user, amount in shares.items():
+            ExpenseSplit.objects.create(expense=expense, user=user, amount=Decimal(amount))
+        if is_approved:
+            expense.apply_to_balances()
+
+    def test_debts_payload(self):
+        friend = f'"id":{self.friend.id},"name":"friend@example.com","email":"friend@example.com"'
+        carol = f'"id":{self.carol.id},"name":"Carol Jones","email":"carol@example.com"'
+
+        response = self.client.get('/api/expenses/debts/')
+        self.assertEqual(response.content.decode(), (
+            '{"debts":[{' + carol + ',"amount":15.5,"currency":"USD","type":"owes"}],'
+            '"settlements_received":[{' + friend + ',"amount":15.0,"currency":"USD","type":"owed"}],'
+            '"currency":"USD","total_owed_by_user":15.5,"total_owed_to_user":15.0,"net_balance":-0.5,'
+            '"totals":{"USD":{"owed_by_user":15.5,"owed_to_user":15.0,"net_balance":-0.5}}}'
+        ))
+
+        response = self.client.get(f'/api/expenses/debts/groups/{self.trip.id}/')
+        self.assertEqual(response.content.decode(), (
+            '{"debts":[{' + friend + ',"amount":20.0,"currency":"USD","type":"owes"},'
+            '{' + carol + ',"amount":15.5,"currency":"USD","type":"owes"}],'
+            '"settlements_received":[],'
+            '"currency":"USD","total_owed_by_user":35.5,"total_owed_to_user":0.0,"net_balance":-35.5,'
+            '"totals":{"USD":{"owed_by_user":35.5,"owed_to_user":0.0,"net_balance":-35.5}}}'
+        ))
+
+    def test_payload_matches_the_split_walk(self):
+        # What the user owes each counterparty, walking every approved split
+        # and confirmed settlement the way the per-expense code did
+        owed = defaultdict(Decimal)
+        for split in ExpenseSplit.objects.filter(expense__is_approved=True).select_related('expense'):
+            if split.user_id == self.user.id:
+                owed[split.expense.paid_by_id] += split.amount
+            elif split.expense.paid_by_id == self.user.id:
+                owed[split.user_id] -= split.amount
+        for settlement in Settlement.objects.filter(status='confirmed'):
+            if settlement.from_user_id == self.user.id:
+                owed[settlement.to_user_id] -= settlement.amount
+            elif settlement.to_user_id == self.user.id:
+                owed[settlement.from_user_id] += settlement.amount
+        owed.pop(self.user.id, None)
+
+        data = self.client.get('/api/expenses/debts/').data
+        self.assertEqual(
+            {entry['id']: entry['amount'] for entry in data['debts']},
+            {user_id: float(amount) for user_id, amount in owed.items() if amount > 0}
+        )
+        self.assertEqual(
+            {entry['id']: entry['amount'] for entry in data['settlements_received']},
+            {user_id: float(-amount) for user_id, amount in owed.items() if amount < 0}
+        )
+
+
+class MultiCurrencyTests(GroupFixtureMixin, APITestCase):
+    """Balances net per currency, or in one currency at the loaded exchange rates"""
+
+    def setUp(self):
+        self.create_group()
+
+        # The friend owes 50 USD, the user owes 500 INR
+        for payer, amount, currency in ((self.user, '100.00', 'USD'), (self.friend, '1000.00', 'INR')):
+            expense = Expense.objects.create(
+                title='Hotel', amount=Decimal(amount), currency=currency, paid_by=payer, group=self.group,
+                split_type='equal', expense_date=timezone.now(), is_approved=True
+            )
+            for user in (self.user, self.friend):
+                ExpenseSplit.objects.create(expense=expense, user=user, amount=Decimal(amount) / 2)
+            expense.apply_to_balances()
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as rates_file:
+            rates_file.write('date,base,quote,rate\n2026-01-01,USD,INR,80\n2026-01-01,EUR,USD,1.25\n')
+        self.addCleanup(os.remove, rates_file.name)
+        call_command('load_fx_rates', rates_file.name, stdout=StringIO())
+        self.addCleanup(fx.clear_cache)
+        self.client.force_authenticate(self.user)
+
+    def test_ledger_is_per_currency(self):
+        self.assertEqual(
+            {(balance.currency, balance.amount) for balance in PairBalance.objects.all()},
+            {('USD', Decimal('50.00')), ('INR', Decimal('500.00'))}
+        )
+        self.assertEqual(
+            dict(PairBalance.aggregate_balances([self.group.id])),
+            {
+                (self.group.id, self.friend.id, self.user.id, 'USD'): Decimal('50.00'),
+                (self.group.id, self.user.id, self.friend.id, 'INR'): Decimal('500.00'),
+            }
+        )
+
+        transfers = self.client.get(f'/api/expenses/debts/groups/{self.group.id}/simplified/').data['transfers']
+        self.assertEqual(
+            [(transfer['from_user']['id'], transfer['amount'], transfer['currency']) for transfer in transfers],
+            [(self.user.id, 500.0, 'INR'), (self.friend.id, 50.0, 'USD')]
+        )
+
+    def test_debts_per_currency(self):
+        data = self.client.get('/api/expenses/debts/').data
+        self.assertEqual([(debt['amount'], debt['currency']) for debt in data['debts']], [(500.0, 'INR')])
+        self.assertEqual(
+            [(debt['amount'], debt['currency']) for debt in data['settlements_received']], [(50.0, 'USD')]
+        )
+        # Mixed currencies have no single total
+        self.assertIsNone(data['currency'])
+        self.assertIsNone(data['net_balance'])
+        self.assertEqual(data['totals']['INR']['net_balance'], -500.0)
+        self.assertEqual(data['totals']['USD']['net_balance'], 50.0)
+
+    def test_debts_in_home_currency(self):
+        data = self.client.get('/api/expenses/debts/?currency=usd&date=2026-06-01').data
+        self.assertEqual(data['currency'], 'USD')
+        self.assertEqual(data['debts'], [])
+        self.assertEqual([debt['amount'] for debt in data['settlements_received']], [43.75])
+        self.assertEqual(data['net_balance'], 43.75)
+
+        data = self.client.get('/api/expenses/debts/?currency=INR&date=2026-06-01').data
+        self.assertEqual(data['net_balance'], 3500.0)
+
+        # Crossed through USD
+        data = self.client.get('/api/expenses/debts/?currency=EUR&date=2026-06-01').data
+        self.assertEqual(data['net_balance'], 35.0)
+
+        response = self.client.get('/api/expenses/debts/?currency=USD&date=2025-12-31')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No INR/USD exchange rate', response.data['error'])
+        self.assertEqual(self.client.get('/api/expenses/debts/?currency=dollars').status_code, 400)
+
+    def test_settlement_defaults_to_debt_currency(self):
+        response = self.client.post('/api/expenses/settlements/create/', {
+            'to_user_id': self.friend.id, 'group_id': self.group.id, 'amount': '200.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['settlement']['currency'], 'INR')
+        self.assertEqual(
+            dict(PairBalance.objects.filter(debtor=self.user).values_list('currency', 'amount')),
+            {'INR': Decimal('300.00')}
+        )
+
+        # Pending settlements through the list endpoint pick the currency the same way
+        self.client.force_authenticate(self.friend)
+        response = self.client.post('/api/expenses/settlements/', {
+            'to_user_id': self.user.id, 'group_id': self.group.id, 'amount': '10.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Settlement.objects.get(from_user=self.friend).currency, 'USD')
+
+        # Owing in two currencies, the settlement has to name one
+        expense = Expense.objects.create(
+            title='Museum', amount=Decimal('20.00'), currency='USD', paid_by=self.friend, group=self.group,
+            split_type='exact', expense_date=timezone.now(), is_approved=True
+        )
+        ExpenseSplit.objects.create(expense=expense, user=self.user, amount=Decimal('20.00'))
+        expense.apply_to_balances()
+        self.client.force_authenticate(self.user)
+        settle = {'to_user_id': self.friend.id, 'group_id': self.group.id, 'amount': '20.00'}
+        response = self.client.post('/api/expenses/settlements/create/', settle, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('INR, USD', response.data['error'])
+        response = self.client.post('/api/expenses/settlements/create/', {**settle, 'currency': 'usd'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(PairBalance.objects.filter(debtor=self.user, currency='USD').exclude(amount=0).exists())
+        response = self.client.post('/api/expenses/settlements/create/', {**settle, 'currency': 'US$'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag_changes_when_rates_are_reloaded(self):
+        url = '/api/expenses/debts/?currency=USD&date=2026-06-01'
+        self.authenticate(self.user)
+        first = self.client.get(url)
+        self.assertEqual(first.json()['net_balance'], 43.75)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as rates_file:
+            rates_file.write('date,base,quote,rate\n2026-01-01,USD,INR,50\n')
+        self.addCleanup(os.remove, rates_file.name)
+        # Another process loading rates leaves this process's cache alone
+        with mock.patch.object(fx, 'clear_cache'):
+            call_command('load_fx_rates', rates_file.name, stdout=StringIO())
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['net_balance'], 40.0)
+
+    def test_rates_are_cached(self):
+        on_date = date(2026, 6, 1)
+        version = fx.rates_version()
+        self.assertEqual(fx.rates_to(version, ['USD', 'INR'], 'USD', on_date), {'USD': 1, 'INR': 1 / Decimal(80)})
+        with self.assertNumQueries(0):
+            fx.rates_to(version, ['USD', 'INR', 'INR'], 'USD', on_date)
+
+        # Reloading replaces the rate and clears the cache
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as rates_file:
+            rates_file.write('date,base,quote,rate\n2026-01-01,USD,INR,50\n')
+        self.addCleanup(os.remove, rates_file.name)
+        call_command('load_fx_rates', rates_file.name, stdout=StringIO())
+        self.assertEqual(FxRate.objects.count(), 2)
+        self.assertEqual(fx.get_rate(fx.rates_version(), on_date, 'USD', 'INR'), 50)
@@ -5,7 +5,9 @@ app_name = 'expenses'
 
 urlpatterns = [
     path('', views.ExpenseListCreateView.as_view(), name='expense_list_create'),
+    path('bulk/', views.bulk_import_expenses, name='bulk_import_expenses'),
     path('<int:pk>/', views.ExpenseDetailView.as_view(), name='expense_detail'),
+    path('pending-approvals/', views.pending_approvals, name='pending_approvals'),
     path('<int:expense_id>/verification/', views.expense_verification_status, name='expense_verification_status'),
     path('<int:expense_id>/verification/update/', views.update_expense_verification, name='update_expense_verification'),
     path('dashboard/', views.user_dashboard_summary, name='dashboard_summary'),
@@ -17,6 +19,8 @@ urlpatterns = [
     path('settlements/history/', views.user_settlement_history, name='settlement_history'),
     path('settlements/summary/', views.settlement_summary, name='settlement_summary'),
     path('settlements/process-payment/', views.process_payment, name='process_payment'),
+    path('settlements/payments/<int:payment_id>/', views.payment_status, name='payment_status'),
     path('debts/', views.calculate_user_debts, name='calculate_debts'),
     path('debts/groups/<int:group_id>/', views.calculate_user_debts, name='calculate_group_debts'),
+    path('debts/groups/<int:group_id>/simplified/', views.simplified_group_debts, name='simplified_group_debts'),
 ]
\ No newline at end of file
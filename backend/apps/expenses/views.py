@@ -3,39 +3,55 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.db import transaction
 from django.db.models import Q, Sum, Count
 from django.utils import timezone
 from collections import defaultdict
+from datetime import date
 from decimal import Decimal
-from .models import Expense, ExpenseSplit, Settlement
+from asgiref.sync import sync_to_async
+import asyncio
+import logging
+from . import fx
+from .balances import counterparty_balances, ledger_rows
+from .models import Expense, ExpenseSplit, Settlement, PairBalance, Payment
+from .simplify import simplify_group_debts
+from .pagination import KeysetPagination
+from .idempotency import idempotent
+from .importer import CONTENT_TYPES, PARSERS, ExpenseImporter
 from .serializers import (
     ExpenseSerializer, ExpenseCreateSerializer, 
     SettlementSerializer, SettlementCreateSerializer
 )
 from apps.groups.models import GroupMembership
+from apps.users.authentication import async_api_view, json_response
+from apps.users.cache import make_etag, not_modified, with_etag
+
+
+logger = logging.getLogger(__name__)
 
 
 class ExpenseListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return ExpenseCreateSerializer
         return ExpenseSerializer
     
+    @method_decorator(idempotent)
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+    
     def get_queryset(self):
-        user = self.request.user
-        
-        # Return expenses from groups where user is a member OR personal expenses
-        user_groups = GroupMembership.objects.filter(
-            user=user, is_active=True
-        ).values_list('group_id', flat=True)
-        
-        return Expense.objects.filter(
-            Q(group_id__in=user_groups) |  # Group expenses where user is member
-            Q(group__isnull=True, paid_by=user) |  # Personal expenses by user
-            Q(expense_splits__user=user)  # Expenses where user is involved in splits
-        ).distinct().order_by('-created_at')
+        # Group expenses where user is member, personal expenses by user and
+        # expenses where user is involved in splits
+        return Expense.objects.visible_to(
+            self.request.user
+        ).with_details().order_by('-created_at', '-id')
 
 
 class ExpenseDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -43,16 +59,25 @@ class ExpenseDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        user = self.request.user
-        user_groups = GroupMembership.objects.filter(
-            user=user, is_active=True
-        ).values_list('group_id', flat=True)
-        
-        return Expense.objects.filter(
-            Q(group_id__in=user_groups) |  # Group expenses where user is member
-            Q(group__isnull=True, paid_by=user) |  # Personal expenses by user  
-            Q(expense_splits__user=user)  # Expenses where user is involved in splits
-        ).distinct()
+        return Expense.objects.visible_to(self.request.user).with_details()
+    
+    def perform_update(self, serializer):
+        # The balance tables are keyed by currency: take an approved expense
+        # out under its stored currency and put it back under the new one
+        with transaction.atomic():
+            instance = serializer.instance
+            old_currency = instance.currency
+            if instance.is_approved and serializer.validated_data.get('currency', old_currency) != old_currency:
+                instance.apply_to_balances(reverse=True)
+                serializer.save().apply_to_balances()
+            else:
+                serializer.save()
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            if instance.is_approved:
+                instance.apply_to_balances(reverse=True)
+            instance.delete()
 
 
 class SettlementListCreateView(generics.ListCreateAPIView):
@@ -69,36 +94,36 @@ class SettlementListCreateView(generics.ListCreateAPIView):
         ).order_by('-created_at')
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def user_dashboard_summary(request):
+@async_api_view(['GET'])
+async def user_dashboard_summary(request):
     user = request.user
     
+    # Served from the per-user cache until something on the dashboard changes
+    from apps.users.cache import aget_or_build
+    return json_response(await aget_or_build(user, 'dashboard_summary', lambda: build_dashboard_summary(user)))
+
+
+async def build_dashboard_summary(user):
     # Get user's groups
-    user_groups = GroupMembership.objects.filter(
-        user=user, is_active=True
-    ).values_list('group_id', flat=True)
+    user_groups = GroupMembership.objects.filter(user=user, is_active=True).values('group_id')
     
     # Get recent expenses (both group and personal expenses where user is involved)
     # Include both approved and pending expenses for visibility, but mark them appropriately
-    recent_expenses = Expense.objects.filter(
-        Q(group_id__in=user_groups) |  # Group expenses where user is member
-        Q(group__isnull=True, paid_by=user) |  # Personal expenses paid by user
-        Q(expense_splits__user=user)  # Any expenses where user has splits
-    ).distinct().order_by('-created_at')[:5]
-    
-    # Use the debt calculation function to get accurate balances
-    debt_response = calculate_user_debts(request)
-    debt_data = debt_response.data
+    recent_expenses = Expense.objects.visible_to(user).with_details().order_by('-created_at', '-id')[:5]
+    
+    # Recent expenses, debts and the group count are independent of each other
+    recent_expense_data, debt_data, group_count = await asyncio.gather(
+        sync_to_async(lambda: ExpenseSerializer(recent_expenses, many=True).data)(),
+        # Use the debt calculation to get accurate balances
+        sync_to_async(build_user_debts)(user, PairBalance.objects.filter(group_id__in=user_groups)),
+        user_groups.acount(),
+    )
     
     user_owes = debt_data['total_owed_by_user']
     others_owe = debt_data['total_owed_to_user']
     net_balance = debt_data['net_balance']
     
-    # Group count
-    group_count = len(user_groups)
-    
-    return Response({
+    return {
         'user': {
             'id': user.id,
             'email': user.email,
@@ -106,43 +131,82 @@ def user_dashboard_summary(request):
             'last_name': user.last_name,
             'full_name': user.full_name,
         },
-        'recent_expenses': ExpenseSerializer(recent_expenses, many=True).data,
+        'recent_expenses': recent_expense_data,
         'user_owes': user_owes,
         'others_owe': others_owe,
         'net_balance': net_balance,
+        # The totals above are in this currency; None when they span several
+        'currency': debt_data['currency'],
+        'totals': debt_data['totals'],
         'group_count': group_count,
-        'total_expenses': recent_expenses.count(),
+        'total_expenses': len(recent_expense_data),
         'debts': debt_data['debts'],
         'settlements_received': debt_data['settlements_received']
-    })
-
+    }
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def group_expenses(request, group_id):
-    print(f"=== GROUP EXPENSES API ===")
-    print(f"Requested group_id: {group_id}")
-    print(f"Requesting user: {request.user.id}")
-    
     # Check if user is member of the group
     membership = GroupMembership.objects.filter(
         group_id=group_id, user=request.user, is_active=True
-    ).first()
+    ).select_related('group').first()
     
     if not membership:
-        print(f"User {request.user.id} is not a member of group {group_id}")
+        logger.debug("User %s is not a member of group %s", request.user.id, group_id)
         return Response(
             {'error': 'You are not a member of this group'}, 
             status=status.HTTP_403_FORBIDDEN
         )
     
-    expenses = Expense.objects.filter(group_id=group_id).order_by('-created_at')
-    print(f"Found {expenses.count()} expenses for group {group_id}")
-    for expense in expenses:
-        print(f"- Expense: {expense.title}, Amount: {expense.amount}, Group ID: {expense.group_id}")
-    print("=========================")
+    # Every change to the group's expenses bumps its version
+    group = membership.group
+    etag = make_etag(request, group.id, group.data_version, group.updated_at)
+    response = not_modified(request, etag)
+    if response:
+        return response
     
-    return Response(ExpenseSerializer(expenses, many=True).data)
+    expenses = Expense.objects.filter(group_id=group_id).with_details().order_by('-created_at', '-id')
+    
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(expenses, request)
+    if page is not None:
+        logger.debug("Returning %s expenses for group %s", len(page), group_id)
+        return with_etag(paginator.get_paginated_response(ExpenseSerializer(page, many=True).data), etag)
+    
+    data = ExpenseSerializer(expenses, many=True).data
+    logger.debug("Returning %s expenses for group %s", len(data), group_id)
+    return with_etag(Response(data), etag)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_import_expenses(request):
+    """
+    Import many expenses paid by the current user from an NDJSON or CSV body.
+    
+    Send `Content-Type: application/x-ndjson` (one JSON object per line) or
+    `text/csv` (header row; splits as `user_id:amount;...`). Rows use the same
+    fields and rules as a single expense create. Invalid rows are skipped and
+    reported with their row number; the rest of the file is still imported.
+    """
+    fmt = CONTENT_TYPES.get(request.content_type.split(';')[0].strip().lower())
+    if fmt is None:
+        return Response({
+            'error': 'Send the file as application/x-ndjson or text/csv'
+        }, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    
+    # Read the raw body line by line instead of parsing it into request.data
+    stream = request.stream
+    if stream is None:
+        return Response({
+            'error': 'The import file is empty'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    summary = ExpenseImporter(request).run(PARSERS[fmt](stream))
+    logger.info("Bulk import by user %s: %s created, %s failed", request.user.id, summary['created'], summary['failed'])
+    
+    return Response(summary, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -165,71 +229,56 @@ def confirm_settlement(request, settlement_id):
     
     settlement.status = 'confirmed'
     settlement.confirmed_at = timezone.now()
-    settlement.save()
+    with transaction.atomic():
+        settlement.save()
+        PairBalance.apply_settlement(settlement)
     
     return Response({'message': 'Settlement confirmed successfully'})
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def group_balance_summary(request, group_id):
+@async_api_view(['GET'])
+async def group_balance_summary(request, group_id):
     """Get user's balance summary for a specific group"""
     user = request.user
     
     # Check if user is member of the group
-    from apps.groups.models import GroupMembership
-    membership = GroupMembership.objects.filter(
+    is_member = await GroupMembership.objects.filter(
         group_id=group_id, user=user, is_active=True
-    ).first()
+    ).aexists()
     
-    if not membership:
-        return Response(
+    if not is_member:
+        return json_response(
             {'error': 'You are not a member of this group'}, 
             status=status.HTTP_403_FORBIDDEN
         )
     
-    # Calculate balances from expense splits for this group (only approved expenses)
-    user_splits = ExpenseSplit.objects.filter(
-        user=user,
-        expense__group_id=group_id,
-        expense__is_approved=True
-    ).select_related('expense')
-    
-    total_user_owes = 0  # What user owes to others
-    total_owed_to_user = 0  # What others owe to user
-    
-    # Group by who user owes money to
-    balances = defaultdict(Decimal)
-    
-    for split in user_splits:
-        expense = split.expense
-        if expense.paid_by != user:
-            # User owes money to the person who paid
-            balances[expense.paid_by.id] += split.amount
-            total_user_owes += float(split.amount)
-        else:
-            # User paid, others in this expense owe to user
-            other_splits = ExpenseSplit.objects.filter(
-                expense=expense
-            ).exclude(user=user)
-            
-            for other_split in other_splits:
-                balances[other_split.user.id] -= other_split.amount
-                total_owed_to_user += float(other_split.amount)
+    # Balances from this group's approved expenses the user has a split in:
+    # the user's own splits of expenses others paid, and the other members'
+    # splits of expenses the user paid
+    user_expense_ids = ExpenseSplit.objects.filter(user=user).values('expense_id')
+    split_totals, group_totals = await asyncio.gather(
+        ExpenseSplit.objects.filter(
+            expense__group_id=group_id, expense__is_approved=True, expense_id__in=user_expense_ids
+        ).aaggregate(
+            user_owes=Sum('amount', filter=Q(user=user) & ~Q(expense__paid_by=user)),
+            owed_to_user=Sum('amount', filter=Q(expense__paid_by=user) & ~Q(user=user)),
+        ),
+        # Get total group expenses
+        Expense.objects.filter(group_id=group_id).aaggregate(total=Sum('amount')),
+    )
+    
+    total_user_owes = split_totals['user_owes'] or Decimal('0')  # What user owes to others
+    total_owed_to_user = split_totals['owed_to_user'] or Decimal('0')  # What others owe to user
     
     # Calculate net balance (positive = others owe you, negative = you owe others)
     net_balance = total_owed_to_user - total_user_owes
     
-    # Get total group expenses
-    group_expenses = Expense.objects.filter(group_id=group_id)
-    total_group_expenses = sum(float(exp.amount) for exp in group_expenses)
-    
-    return Response({
+    return json_response({
         'group_id': group_id,
-        'total_expenses': total_group_expenses,
-        'user_balance': net_balance,
-        'total_user_owes': total_user_owes,
-        'total_owed_to_user': total_owed_to_user,
+        'total_expenses': float(group_totals['total'] or 0),
+        'user_balance': float(net_balance),
+        'total_user_owes': float(total_user_owes),
+        'total_owed_to_user': float(total_owed_to_user),
         'net_status': 'owed_to_you' if net_balance > 0 else 'you_owe' if net_balance < 0 else 'settled'
     })
 
@@ -238,15 +287,27 @@ def group_balance_summary(request, group_id):
 @permission_classes([IsAuthenticated])
 def calculate_user_debts(request, group_id=None):
     """
-    Calculate who owes whom in a specific group or across all groups
+    Calculate who owes whom in a specific group or across all groups.
+    
+    Debts are netted per currency. With ?currency=EUR every balance is
+    converted to EUR first (at the latest rates on or before ?date=, default
+    today), so debts in different currencies net against each other.
     """
     user = request.user
     
+    currency = request.query_params.get('currency', '').upper() or None
+    if currency is not None and not fx.is_currency_code(currency):
+        return Response({'error': 'currency must be a 3-letter code'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        on_date = date.fromisoformat(request.query_params['date']) if 'date' in request.query_params else timezone.localdate()
+    except ValueError:
+        return Response({'error': 'date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    
     if group_id:
         # Calculate debts for a specific group
         membership = GroupMembership.objects.filter(
             group_id=group_id, user=user, is_active=True
-        ).first()
+        ).select_related('group').first()
         
         if not membership:
             return Response(
@@ -254,106 +315,177 @@ def calculate_user_debts(request, group_id=None):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        expenses = Expense.objects.filter(group_id=group_id, is_approved=True)
+        group_versions = [(group_id, membership.group.data_version, membership.group.updated_at)]
+        pair_balances = PairBalance.objects.filter(group_id=group_id)
     else:
         # Calculate debts across all user's groups
-        user_groups = GroupMembership.objects.filter(
+        group_versions = list(GroupMembership.objects.filter(
             user=user, is_active=True
-        ).values_list('group_id', flat=True)
+        ).order_by('group_id').values_list('group_id', 'group__data_version', 'group__updated_at'))
+        user_groups = [group_id for group_id, _, _ in group_versions]
         
-        expenses = Expense.objects.filter(group_id__in=user_groups, is_approved=True)
+        pair_balances = PairBalance.objects.filter(group_id__in=user_groups)
     
-    # Calculate net balances between users
-    balances = defaultdict(lambda: defaultdict(Decimal))
+    # The user's version covers the balances, the groups' versions cover
+    # counterparties' names, the date and rates version the exchange rates
+    rates_version = fx.rates_version() if currency else None
+    etag = make_etag(request, user.data_version, on_date if currency else None, rates_version, *group_versions)
+    response = not_modified(request, etag)
+    if response:
+        return response
     
-    for expense in expenses:
-        paid_by = expense.paid_by
-        expense_splits = expense.expense_splits.all()
-        
-        for split in expense_splits:
-            ower = split.user
-            amount = Decimal(str(split.amount))
-            
-            if ower != paid_by:
-                # Person owes money to the payer
-                balances[ower.id][paid_by.id] += amount
-    
-    # Calculate net balances (simplify debts)
-    net_balances = defaultdict(lambda: defaultdict(Decimal))
-    processed_pairs = set()
-    
-    for ower_id in balances:
-        for payer_id in balances[ower_id]:
-            pair = tuple(sorted([ower_id, payer_id]))
-            if pair in processed_pairs:
-                continue
-            processed_pairs.add(pair)
-            
-            ower_to_payer = balances[ower_id][payer_id]
-            payer_to_ower = balances[payer_id][ower_id]
-            net_amount = ower_to_payer - payer_to_ower
-            
-            if net_amount > 0:
-                net_balances[ower_id][payer_id] = net_amount
-            elif net_amount < 0:
-                net_balances[payer_id][ower_id] = abs(net_amount)
+    try:
+        data = build_user_debts(
+            user, pair_balances, currency=currency, on_date=on_date, rates_version=rates_version
+        )
+    except fx.RateNotFound as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return with_etag(Response(data), etag)
+
+
+def build_user_debts(user, pair_balances, currency=None, on_date=None, rates_version=None):
+    """
+    Net what the user owes and is owed per counterparty and currency, from
+    the given PairBalance rows.
+    
+    With `currency`, each per-currency balance is converted at the rate on
+    `on_date` (default today) before netting, and every amount is in that
+    currency. Raises fx.RateNotFound if a rate is missing.
+    `rates_version` saves the lookup when the caller already has it.
+    """
+    # Read the materialized ledger (approved splits minus confirmed settlements)
+    # for every pair involving the user, summed across groups in one query
+    pair_totals = list(pair_balances.filter(
+        Q(debtor=user) | Q(creditor=user)
+    ).values_list('debtor_id', 'creditor_id', 'currency').annotate(
+        total=Sum('amount')
+    ).order_by('debtor_id', 'creditor_id', 'currency'))
+    
+    if currency:
+        # One rate per currency, applied to the already aggregated totals
+        rates = fx.rates_to(
+            rates_version or fx.rates_version(),
+            [row[2] for row in pair_totals], currency, on_date or timezone.localdate()
+        )
+        pair_totals = [
+            (debtor_id, creditor_id, currency, fx.convert(total, rates[total_currency]))
+            for debtor_id, creditor_id, total_currency, total in pair_totals
+        ]
+    
+    # What the user owes each counterparty in each currency, net of what
+    # they owe the user (negative = they owe the user)
+    net_balances = defaultdict(Decimal)
+    for debtor_id, creditor_id, total_currency, total in pair_totals:
+        if debtor_id == user.id:
+            net_balances[(creditor_id, total_currency)] += total
+        else:
+            net_balances[(debtor_id, total_currency)] -= total
     
     # Convert to response format
     debts = []
     settlements_received = []
+    totals = defaultdict(lambda: {'owed_by_user': Decimal('0'), 'owed_to_user': Decimal('0')})
     
-    # Get confirmed settlements to subtract from debts
-    confirmed_settlements = Settlement.objects.filter(
-        status='confirmed'
-    )
-    if group_id:
-        confirmed_settlements = confirmed_settlements.filter(group_id=group_id)
+    # Fetch every counterparty in a single query
+    from apps.users.models import CustomUser
+    users_by_id = CustomUser.objects.in_bulk({other_id for other_id, _ in net_balances})
+    
+    for (other_id, total_currency), remaining_amount in sorted(net_balances.items()):
+        if not remaining_amount:
+            continue
+        other = users_by_id[other_id]
+        entry = {
+            'id': other_id,
+            'name': other.full_name or f"{other.first_name} {other.last_name}".strip() or other.email,
+            'email': other.email,
+            'amount': float(abs(remaining_amount)),
+            'currency': total_currency,
+        }
+        if remaining_amount > 0:
+            debts.append({**entry, 'type': 'owes'})  # User owes this person
+            totals[total_currency]['owed_by_user'] += remaining_amount
+        else:
+            settlements_received.append({**entry, 'type': 'owed'})  # This person owes user
+            totals[total_currency]['owed_to_user'] -= remaining_amount
+    
+    # Totals are summed exactly per currency and only turned into floats for
+    # the response. The top-level totals need a single currency: the
+    # requested one, or the only one the user has balances in.
+    summary_currency = currency or (next(iter(totals)) if len(totals) == 1 else None)
+    if summary_currency or not totals:
+        summary = totals[summary_currency] if summary_currency else totals.default_factory()
+        total_owed_by_user = float(summary['owed_by_user'])
+        total_owed_to_user = float(summary['owed_to_user'])
+        net_balance = float(summary['owed_to_user'] - summary['owed_by_user'])
+    else:
+        total_owed_by_user = total_owed_to_user = net_balance = None
     
-    settlement_amounts = defaultdict(lambda: defaultdict(Decimal))
-    for settlement in confirmed_settlements:
-        settlement_amounts[settlement.from_user.id][settlement.to_user.id] += settlement.amount
+    return {
+        'debts': debts,  # People user owes money to
+        'settlements_received': settlements_received,  # People who owe user money
+        'currency': summary_currency,
+        'total_owed_by_user': total_owed_by_user,
+        'total_owed_to_user': total_owed_to_user,
+        'net_balance': net_balance,
+        'totals': {
+            total_currency: {
+                'owed_by_user': float(summary['owed_by_user']),
+                'owed_to_user': float(summary['owed_to_user']),
+                'net_balance': float(summary['owed_to_user'] - summary['owed_by_user']),
+            }
+            for total_currency, summary in totals.items()
+        },
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def simplified_group_debts(request, group_id):
+    """
+    Minimal set of transfers that settles every balance in a group
+    """
+    membership = GroupMembership.objects.filter(
+        group_id=group_id, user=request.user, is_active=True
+    ).first()
+    
+    if not membership:
+        return Response(
+            {'error': 'You are not a member of this group'}, 
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    transfers = simplify_group_debts(group_id)
     
     from apps.users.models import CustomUser
+    user_ids = {user_id for transfer in transfers for user_id in transfer[:2]}
+    users_by_id = CustomUser.objects.in_bulk(user_ids)
     
-    for ower_id in net_balances:
-        for payer_id in net_balances[ower_id]:
-            amount = net_balances[ower_id][payer_id]
-            # Subtract confirmed settlements
-            settled_amount = settlement_amounts[ower_id][payer_id]
-            remaining_amount = amount - settled_amount
-            
-            if remaining_amount > 0:
-                ower = CustomUser.objects.get(id=ower_id)
-                payer = CustomUser.objects.get(id=payer_id)
-                
-                if ower == user:
-                    debts.append({
-                        'id': payer_id,
-                        'name': payer.full_name or f"{payer.first_name} {payer.last_name}".strip() or payer.email,
-                        'email': payer.email,
-                        'amount': float(remaining_amount),
-                        'type': 'owes'  # User owes this person
-                    })
-                elif payer == user:
-                    settlements_received.append({
-                        'id': ower_id,
-                        'name': ower.full_name or f"{ower.first_name} {ower.last_name}".strip() or ower.email,
-                        'email': ower.email,
-                        'amount': float(remaining_amount),
-                        'type': 'owed'  # This person owes user
-                    })
+    def user_info(user_id):
+        other = users_by_id[user_id]
+        return {
+            'id': user_id,
+            'name': other.full_name or other.email,
+            'email': other.email,
+        }
     
     return Response({
-        'debts': debts,  # People user owes money to
-        'settlements_received': settlements_received,  # People who owe user money
-        'total_owed_by_user': sum(debt['amount'] for debt in debts),
-        'total_owed_to_user': sum(settlement['amount'] for settlement in settlements_received),
-        'net_balance': sum(settlement['amount'] for settlement in settlements_received) - sum(debt['amount'] for debt in debts)
+        'group_id': group_id,
+        'transfers': [
+            {
+                'from_user': user_info(from_user_id),
+                'to_user': user_info(to_user_id),
+                'amount': float(amount),
+                'currency': currency,
+            }
+            for from_user_id, to_user_id, amount, currency in transfers
+        ],
+        'transfer_count': len(transfers),
     })
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_settlement(request):
     """
     Create a new settlement/payment
@@ -361,6 +493,7 @@ def create_settlement(request):
     to_user_id = request.data.get('to_user_id')
     group_id = request.data.get('group_id')
     amount = request.data.get('amount')
+    currency = request.data.get('currency')
     notes = request.data.get('notes', '')
     
     if not to_user_id or not amount:
@@ -414,15 +547,36 @@ def create_settlement(request):
                 status=status.HTTP_404_NOT_FOUND
             )
     
+    # A settlement pays off the debt in its own currency, so it defaults to
+    # the currency the debt is in
+    if currency:
+        currency = str(currency).upper()
+        if not fx.is_currency_code(currency):
+            return Response(
+                {'error': 'currency must be a 3-letter code'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    else:
+        debt_currencies = PairBalance.debt_currencies(request.user.id, to_user.id, group_id)
+        if len(debt_currencies) > 1:
+            return Response(
+                {'error': f'You owe this user in {", ".join(debt_currencies)}; say which currency you are settling'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        currency = debt_currencies[0] if debt_currencies else Settlement._meta.get_field('currency').default
+    
     # Create settlement
-    settlement = Settlement.objects.create(
-        from_user=request.user,
-        to_user=to_user,
-        group=group,
-        amount=amount,
-        notes=notes,
-        status='confirmed'  # For now, auto-confirm settlements
-    )
+    with transaction.atomic():
+        settlement = Settlement.objects.create(
+            from_user=request.user,
+            to_user=to_user,
+            group=group,
+            amount=amount,
+            currency=currency,
+            notes=notes,
+            status='confirmed'  # For now, auto-confirm settlements
+        )
+        PairBalance.apply_settlement(settlement)
     
     return Response({
         'id': settlement.id,
@@ -439,7 +593,12 @@ def user_settlement_history(request):
     """
     settlements = Settlement.objects.filter(
         Q(from_user=request.user) | Q(to_user=request.user)
-    ).order_by('-created_at')
+    ).order_by('-created_at', '-id')
+    
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(settlements, request)
+    if page is not None:
+        return paginator.get_paginated_response(SettlementSerializer(page, many=True).data)
     
     return Response(SettlementSerializer(settlements, many=True).data)
 
@@ -450,44 +609,29 @@ def settlement_summary(request):
     """Get user's settlement summary - who owes what to whom"""
     user = request.user
     
-    # Calculate balances from expense splits (only approved expenses)
-    user_splits = ExpenseSplit.objects.filter(user=user, expense__is_approved=True).select_related('expense')
-    
-    # Group by other users to calculate net amounts
-    balances = defaultdict(Decimal)
-    
-    for split in user_splits:
-        expense = split.expense
-        if expense.paid_by != user:
-            # User owes money to the person who paid
-            balances[expense.paid_by.id] += split.amount
-        else:
-            # User paid, others owe to user
-            other_splits = ExpenseSplit.objects.filter(
-                expense=expense
-            ).exclude(user=user)
-            
-            for other_split in other_splits:
-                balances[other_split.user.id] -= other_split.amount
+    # Net the approved splits between the user and everyone else
+    balances = counterparty_balances(ledger_rows(ExpenseSplit.objects.filter(
+        Q(user=user) | Q(expense__paid_by=user), expense__is_approved=True
+    )), user.id)
     
     # Convert to list format with user details
+    from apps.users.models import CustomUser
+    users_by_id = CustomUser.objects.in_bulk(balances)
     summary = []
     for user_id, amount in balances.items():
-        if amount != 0:  # Only include non-zero balances
-            from apps.users.models import CustomUser
-            other_user = CustomUser.objects.get(id=user_id)
-            summary.append({
-                'user_id': user_id,
-                'user_name': other_user.get_full_name(),
-                'user_email': other_user.email,
-                'amount': float(amount),
-                'type': 'owes_to_them' if amount > 0 else 'owes_to_you'
-            })
+        other_user = users_by_id[user_id]
+        summary.append({
+            'user_id': user_id,
+            'user_name': other_user.get_full_name(),
+            'user_email': other_user.email,
+            'amount': float(amount),
+            'type': 'owes_to_them' if amount > 0 else 'owes_to_you'
+        })
     
     return Response({
         'summary': summary,
-        'total_owed_by_you': sum(float(amt) for amt in balances.values() if amt > 0),
-        'total_owed_to_you': sum(float(abs(amt)) for amt in balances.values() if amt < 0)
+        'total_owed_by_you': float(sum(amt for amt in balances.values() if amt > 0)),
+        'total_owed_to_you': float(-sum(amt for amt in balances.values() if amt < 0))
     })
 
 
@@ -541,6 +685,24 @@ def update_expense_verification(request, expense_id):
         )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def pending_approvals(request):
+    """
+    Expenses waiting on the user's approval, newest first
+    """
+    expenses = Expense.objects.filter(
+        approvals__user=request.user, approvals__status='pending'
+    ).with_details().order_by('-created_at', '-id')
+    
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(expenses, request)
+    if page is not None:
+        return paginator.get_paginated_response(ExpenseSerializer(page, many=True).data)
+    
+    return Response(ExpenseSerializer(expenses, many=True).data)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def expense_verification_status(request, expense_id):
@@ -578,8 +740,14 @@ def expense_verification_status(request, expense_id):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def process_payment(request):
-    """Process a payment with net settlement calculation for global settlements"""
+    """
+    Queue a payment with net settlement calculation for global settlements.
+    
+    The payment is executed by the payment worker; poll payment_status with
+    the returned payment id for the outcome.
+    """
     
     # Extract payment data
     receiver_id = request.data.get('receiver_id')
@@ -594,6 +762,14 @@ def process_payment(request):
             'error': 'receiver_id, amount, and payment_method are required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    settlement_types = [value for value, _ in Payment.SETTLEMENT_TYPES]
+    if settlement_type not in settlement_types:
+        return Response({
+            'error': f"settlement_type must be one of {', '.join(settlement_types)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    from apps.users.models import CustomUser
+    
     try:
         amount = Decimal(str(amount))
         if amount <= 0:
@@ -602,193 +778,75 @@ def process_payment(request):
             }, status=status.HTTP_400_BAD_REQUEST)
             
         # Get receiver user
-        from apps.users.models import CustomUser
         receiver = CustomUser.objects.get(id=receiver_id)
         
-        # For global settlements, calculate net balance between the two users
-        actual_amount = amount
-        if settlement_type == 'global':
-            # Calculate net balance: what current user owes to receiver (only approved expenses)
-            user_splits = ExpenseSplit.objects.filter(
-                user=request.user,
-                expense__is_approved=True
-            ).select_related('expense')
-            
-            balance_with_receiver = Decimal('0')
-            
-            for split in user_splits:
-                expense = split.expense
-                if expense.paid_by == receiver:
-                    # User owes money to receiver
-                    balance_with_receiver += split.amount
-                elif expense.paid_by == request.user:
-                    # Receiver owes money to user
-                    balance_with_receiver -= split.amount
-            
-            # Use net balance as actual amount (but respect original request amount)
-            actual_amount = abs(balance_with_receiver)
-            
-            # The amount requested should be the net balance
-            if balance_with_receiver > 0:
-                # User owes receiver
-                actual_amount = balance_with_receiver
-            elif balance_with_receiver < 0:
-                # Receiver owes user - this is reversed direction, but we'll still process
-                actual_amount = abs(balance_with_receiver)
-        
-        # Simulate payment processing delay
-        import time
-        import random
-        
-        # Simulate different payment methods with different processing times
-        processing_time = {
-            'cash': 0.1,    # Instant for cash
-            'upi': 0.3,     # Fast UPI transaction
-            'venmo': 0.5,
-            'paypal': 0.8,
-            'bank': 1.2,
-            'zelle': 0.3
-        }.get(payment_method, 0.5)
+        if expense_id and not Expense.objects.filter(id=expense_id).exists():
+            return Response({
+                'error': 'Expense not found'
+            }, status=status.HTTP_404_NOT_FOUND)
         
-        time.sleep(processing_time)
+        import uuid
+        payment = Payment.objects.create(
+            payer=request.user,
+            receiver=receiver,
+            amount=amount,
+            payment_method=payment_method,
+            settlement_type=settlement_type,
+            expense_id=expense_id or None,
+            note=note,
+            transaction_id=str(uuid.uuid4())[:12].upper()
+        )
         
-        # Simulate 95% success rate
-        if random.random() < 0.95:
-            # Create settlement record - but Settlement model requires group field
-            # For now, let's create a simpler response without database storage
-            # until we modify the Settlement model or create a separate Payment model
-            
-            import uuid
-            transaction_id = str(uuid.uuid4())[:12].upper()
-            
-            # Create a simple payment record and track payments made
-            from django.utils import timezone
-            from datetime import datetime
-            
-            # For now, let's update the expense splits to reflect the payment
-            # Find expenses where current user owes money to the receiver
-            if expense_id:
-                # Settle specific expense only (only approved expenses)
-                user_splits = ExpenseSplit.objects.filter(
-                    user=request.user,
-                    expense__paid_by=receiver,
-                    expense_id=expense_id,
-                    expense__is_approved=True
-                ).select_related('expense')
-            elif settlement_type == 'global':
-                # For global settlement, get all splits involving both users (only approved expenses)
-                # This includes splits where user owes AND where receiver owes
-                user_splits = ExpenseSplit.objects.filter(
-                    user=request.user,
-                    expense__paid_by=receiver,
-                    expense__is_approved=True
-                ).select_related('expense')
-                
-                # Also mark splits where receiver owes (they are debtor, not payer)
-                receiver_splits = ExpenseSplit.objects.filter(
-                    user=receiver,
-                    expense__paid_by=request.user,
-                    expense__is_approved=True
-                ).select_related('expense')
-            else:
-                # Settle any/all expenses (original behavior for general settlements, only approved)
-                user_splits = ExpenseSplit.objects.filter(
-                    user=request.user,
-                    expense__paid_by=receiver,
-                    expense__is_approved=True
-                ).select_related('expense')
-            
-            remaining_amount = actual_amount if settlement_type == 'global' else amount
-            payments_made = []
-            
-            # Actually update the database - reduce split amounts
-            for split in user_splits:
-                if remaining_amount <= 0:
-                    break
-                    
-                # Calculate how much of this split we can pay
-                split_amount = min(remaining_amount, split.amount)
-                
-                # Update the split amount in database (mark as paid/settled)
-                split.amount -= split_amount
-                split.save()
-                
-                # Create a payment record
-                payments_made.append({
-                    'expense_id': split.expense.id,
-                    'expense_title': split.expense.title,
-                    'original_amount': float(split.amount + split_amount),
-                    'amount_paid': float(split_amount),
-                    'remaining_amount': float(split.amount)
-                })
-                
-                # Reduce the remaining amount
-                remaining_amount -= split_amount
-                
-                # If split is fully paid, it will now show 0 in future settlements
-                print(f"Updated split for expense {split.expense.title}: paid {split_amount}, remaining {split.amount}")
-            
-            # For global settlements, also mark receiver's debts (where they owe us)
-            if settlement_type == 'global':
-                receiver_splits_list = ExpenseSplit.objects.filter(
-                    user=receiver,
-                    expense__paid_by=request.user,
-                    expense__is_approved=True
-                ).select_related('expense')
-                
-                for split in receiver_splits_list:
-                    if remaining_amount <= 0:
-                        break
-                    
-                    # Calculate how much of this split we can credit
-                    split_amount = min(remaining_amount, split.amount)
-                    
-                    # Mark receiver's debt as settled
-                    split.amount -= split_amount
-                    split.save()
-                    
-                    payments_made.append({
-                        'expense_id': split.expense.id,
-                        'expense_title': split.expense.title,
-                        'original_amount': float(split.amount + split_amount),
-                        'amount_credited': float(split_amount),  # They owed us, so it's credited
-                        'remaining_amount': float(split.amount)
-                    })
-                    
-                    remaining_amount -= split_amount
-                    print(f"Credited split for expense {split.expense.title}: credited {split_amount}, remaining {split.amount}")
-            
-            return Response({
-                'success': True,
-                'transaction_id': transaction_id,
-                'requested_amount': float(amount),
-                'actual_amount': float(actual_amount),
-                'receiver': receiver.get_full_name(),
-                'payment_method': payment_method,
-                'processing_time': int(processing_time * 1000),  # Convert to milliseconds
-                'processed_at': datetime.now().isoformat(),
-                'status': 'completed',
-                'settlement_type': settlement_type,
-                'payments_made': payments_made,
-                'note': note,
-                'message': f'Payment of ₹{actual_amount} sent successfully to {receiver.get_full_name()} via {payment_method.title()}'
-            })
-        else:
-            # Simulate payment failure
-            return Response({
-                'success': False,
-                'error': 'Payment processing failed. Please try again.'
-            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'success': True,
+            'payment_id': payment.id,
+            'transaction_id': payment.transaction_id,
+            'status': payment.status,
+            'status_url': request.build_absolute_uri(
+                reverse('expenses:payment_status', args=[payment.id])
+            ),
+            'message': f'Payment of ₹{amount} to {receiver.get_full_name()} is being processed'
+        }, status=status.HTTP_202_ACCEPTED)
             
     except CustomUser.DoesNotExist:
         return Response({
             'error': 'Receiver not found'
         }, status=status.HTTP_404_NOT_FOUND)
-    except (ValueError, TypeError):
+    except (ValueError, TypeError, ArithmeticError):
         return Response({
             'error': 'Invalid amount'
         }, status=status.HTTP_400_BAD_REQUEST)
-    except Exception as e:
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def payment_status(request, payment_id):
+    """
+    Poll the outcome of a queued payment
+    """
+    payment = get_object_or_404(
+        Payment.objects.filter(Q(payer=request.user) | Q(receiver=request.user)),
+        id=payment_id
+    )
+    
+    if payment.status == 'completed':
+        return Response({'payment_id': payment.id, **payment.result})
+    
+    if payment.status == 'failed':
         return Response({
-            'error': f'Payment processing error: {str(e)}'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            'payment_id': payment.id,
+            'transaction_id': payment.transaction_id,
+            'success': False,
+            'status': payment.status,
+            'error': payment.error
+        })
+    
+    return Response({
+        'payment_id': payment.id,
+        'transaction_id': payment.transaction_id,
+        'success': True,
+        'status': payment.status,
+        'requested_amount': float(payment.amount),
+        'payment_method': payment.payment_method,
+        'settlement_type': payment.settlement_type
+    })
@@ -16,6 +16,9 @@ class GroupAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
     inlines = [GroupMembershipInline]
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stats()
+    
     fieldsets = (
         (None, {'fields': ('name', 'description', 'created_by')}),
         ('Settings', {'fields': ('is_active', 'group_image')}),
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -2,6 +2,27 @@ from django.db import models
 from django.conf import settings
 
 
+class GroupQuerySet(models.QuerySet):
+    def with_stats(self):
+        """
+        Annotate each group with its expense total and active member count,
+        computed in the same query as correlated subqueries (joins would
+        multiply expenses by members)
+        """
+        from apps.expenses.models import Expense
+        expense_totals = Expense.objects.filter(group=models.OuterRef('pk')).order_by().values(
+            'group'
+        ).annotate(total=models.Sum('amount')).values('total')
+        member_counts = GroupMembership.objects.filter(
+            group=models.OuterRef('pk'), is_active=True
+        ).order_by().values('group').annotate(count=models.Count('id')).values('count')
+        
+        return self.annotate(
+            expense_total=models.Subquery(expense_totals),
+            active_member_count=models.Subquery(member_counts),
+        )
+
+
 class Group(models.Model):
     """
     Group model for splitting expenses among multiple users
@@ -22,6 +43,11 @@ class Group(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Bumped whenever the group's members, expenses or settlements change;
+    # together with updated_at it makes up the group's ETags
+    data_version = models.PositiveIntegerField(default=0)
+    
+    objects = GroupQuerySet.as_manager()
     
     class Meta:
         db_table = 'groups'
@@ -30,9 +56,19 @@ class Group(models.Model):
     def __str__(self):
         return self.name
     
+    @classmethod
+    def bump_data_version(cls, group_ids):
+        """Invalidate the ETags of the given groups"""
+        group_ids = {group_id for group_id in group_ids if group_id}
+        if group_ids:
+            cls.objects.filter(id__in=group_ids).update(data_version=models.F('data_version') + 1)
+    
     @property
     def total_expenses(self):
         """Calculate total expenses for this group"""
+        # Already computed when the group was loaded through with_stats()
+        if hasattr(self, 'expense_total'):
+            return self.expense_total or 0
         return self.expenses.aggregate(
             total=models.Sum('amount')
         )['total'] or 0
@@ -40,6 +76,8 @@ class Group(models.Model):
     @property
     def member_count(self):
         """Get number of active members in the group"""
+        if hasattr(self, 'active_member_count'):
+            return self.active_member_count or 0
         return self.group_memberships.filter(is_active=True).count()
 
 
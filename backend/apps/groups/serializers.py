@@ -1,9 +1,10 @@
 from rest_framework import serializers
+from backend_project.instrumentation import TimedSerializerMixin
 from .models import Group, GroupMembership
 from apps.users.serializers import UserSerializer
 
 
-class GroupMemberSerializer(serializers.ModelSerializer):
+class GroupMemberSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
     class Meta:
@@ -11,7 +12,18 @@ class GroupMemberSerializer(serializers.ModelSerializer):
         fields = ('user', 'joined_at', 'is_admin', 'is_active')
 
 
-class GroupSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Accept a `fields` argument that limits the serializer to those fields"""
+    
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class GroupSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     group_memberships = GroupMemberSerializer(many=True, read_only=True)
     member_count = serializers.ReadOnlyField()
@@ -38,7 +50,7 @@ class GroupSerializer(serializers.ModelSerializer):
         return group
 
 
-class GroupCreateSerializer(serializers.ModelSerializer):
+class GroupCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     member_emails = serializers.ListField(
         child=serializers.EmailField(),
         write_only=True,
@@ -1,3 +1,225 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.expenses.exporter import iter_expense_chunks
+from apps.expenses.models import Expense, ExpenseSplit
+from apps.expenses.tests import GroupFixtureMixin
+from apps.users.models import CustomUser
+from .models import Group, GroupMembership
+
+
+class ConditionalGetTests(GroupFixtureMixin, APITestCase):
+    """Unchanged resources are answered with 304 before anything is serialized"""
+
+    def setUp(self):
+        self.create_group()
+        self.authenticate(self.user)
+
+    def add_expense_as_friend(self):
+        self.authenticate(self.friend)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/expenses/', {
+                'title': 'Rent',
+                'amount': '100.00',
+                'group_id': self.group.id,
+                'split_type': 'equal',
+                'expense_date': timezone.now().isoformat(),
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.authenticate(self.user)
+
+    def test_not_modified_until_group_changes(self):
+        urls = [
+            '/api/groups/',
+            f'/api/groups/{self.group.id}/',
+            f'/api/expenses/groups/{self.group.id}/',
+            '/api/expenses/debts/',
+            f'/api/expenses/debts/groups/{self.group.id}/',
+        ]
+        etags = {}
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etags[url] = response['ETag']
+
+            # User lookup and the version query (or membership check) only
+            with self.assertNumQueries(2):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etags[url])
+
+        self.add_expense_as_friend()
+
+        for url in urls:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etags[url])
+
+
+class GroupListQueryCountTests(APITestCase):
+    """Listing groups costs the same number of queries however many there are"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='owner@example.com', username='owner', password='password123'
+        )
+        self.friend = CustomUser.objects.create_user(
+            email='friend@example.com', username='friend', password='password123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def add_groups(self, count):
+        groups = Group.objects.bulk_create(
+            Group(name=f'Group {index}', created_by=self.friend)
+            for index in range(Group.objects.count(), Group.objects.count() + count)
+        )
+        GroupMembership.objects.bulk_create(
+            GroupMembership(group=group, user=user)
+            for group in groups for user in (self.user, self.friend)
+        )
+
+    def test_query_count_is_flat(self):
+        total = 0
+        for count in (1, 49, 450):
+            self.add_groups(count)
+            total += count
+            # ETag versions, groups with stats, memberships with their users
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/groups/')
+            self.assertEqual(len(response.data), total)
+            self.assertEqual(len(response.data[0]['group_memberships']), 2)
+
+            # Sparse fields skip the member prefetch
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/groups/?fields=id,name')
+            self.assertEqual(set(response.data[0]), {'id', 'name'})
+
+    def test_unknown_sparse_field(self):
+        response = self.client.get('/api/groups/?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+
+
+class GroupStatsTests(GroupFixtureMixin, APITestCase):
+    """Listed groups carry the same expense totals and member counts as the properties"""
+
+    def setUp(self):
+        self.create_group()
+        self.empty = Group.objects.create(name='Empty', created_by=self.user)
+        GroupMembership.objects.create(group=self.empty, user=self.user)
+        former = CustomUser.objects.create_user(
+            email='former@example.com', username='former', password='password123'
+        )
+        GroupMembership.objects.create(group=self.group, user=former, is_active=False)
+        for amount in ('12.50', '30.00', '7.25'):
+            Expense.objects.create(
+                title='Groceries', amount=Decimal(amount), paid_by=self.user,
+                group=self.group, expense_date=timezone.now()
+            )
+        self.client.force_authenticate(self.user)
+
+    def test_list_and_detail_stats(self):
+        stats = {
+            group['id']: (group['total_expenses'], group['member_count'])
+            for group in self.client.get('/api/groups/').data
+        }
+        self.assertEqual(stats, {
+            self.group.id: (Decimal('49.75'), 2),
+            self.empty.id: (0, 1),
+        })
+
+        # The properties fall back to their own queries on plain instances
+        for group in Group.objects.filter(id__in=stats):
+            self.assertEqual((group.total_expenses, group.member_count), stats[group.id])
+
+        response = self.client.get(f'/api/groups/{self.group.id}/')
+        self.assertEqual((response.data['total_expenses'], response.data['member_count']), (Decimal('49.75'), 2))
+
+        response = self.client.get('/api/groups/?fields=id,member_count')
+        self.assertEqual(
+            {group['id']: group['member_count'] for group in response.data}, {self.group.id: 2, self.empty.id: 1}
+        )
+
+    def test_stats_are_one_query(self):
+        with self.assertNumQueries(1):
+            groups = list(Group.objects.filter(id__in=[self.group.id, self.empty.id]).with_stats())
+            self.assertEqual(
+                sorted((group.total_expenses, group.member_count) for group in groups),
+                [(0, 1), (Decimal('49.75'), 2)]
+            )
+
+
+class LedgerExportTests(GroupFixtureMixin, APITestCase):
+    """A group's expenses stream out as CSV or NDJSON; errors stay JSON"""
+
+    def setUp(self):
+        self.create_group()
+        for i in range(5):
+            expense = Expense.objects.create(
+                title=f'Expense {i}', amount=Decimal('30.00'), paid_by=self.user,
+                group=self.group, expense_date=timezone.now(), is_approved=True
+            )
+            ExpenseSplit.objects.bulk_create([
+                ExpenseSplit(expense=expense, user=self.user, amount=Decimal('10.00')),
+                ExpenseSplit(expense=expense, user=self.friend, amount=Decimal('20.00')),
+            ])
+        self.url = f'/api/groups/{self.group.id}/export/'
+        self.client.force_authenticate(self.friend)
+
+    def body(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn(f'group-{self.group.id}-expenses.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(self.body(response))))
+
+        self.assertEqual([row['title'] for row in rows], [f'Expense {i}' for i in range(5)])
+        self.assertEqual(rows[0]['paid_by_email'], 'owner@example.com')
+        self.assertEqual(rows[0]['splits'], f'{self.user.id}:10.00;{self.friend.id}:20.00')
+
+    def test_ndjson(self):
+        response = self.client.get(self.url, {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = [json.loads(line) for line in self.body(response).splitlines()]
+
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[0]['amount'], '30.00')
+        self.assertEqual(lines[0]['paid_by_email'], 'owner@example.com')
+        self.assertEqual(
+            [(split['user_id'], split['amount']) for split in lines[0]['splits']],
+            [(self.user.id, '10.00'), (self.friend.id, '20.00')]
+        )
+
+    def test_chunks_read_splits_once_each(self):
+        # One query for the expenses and one per chunk for their splits
+        with self.assertNumQueries(4):
+            chunks = list(iter_expense_chunks(self.group.id, chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(len(chunks[2][0][1]), 2)
+
+    def test_errors_are_json(self):
+        missing = self.client.get('/api/groups/999999/export/', {'format': 'csv'})
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(missing['Content-Type'], 'application/json')
+        self.assertIn('detail', json.loads(missing.content))
+
+        outsider = CustomUser.objects.create_user(
+            email='outsider@example.com', username='outsider', password='password123'
+        )
+        self.client.force_authenticate(outsider)
+        forbidden = self.client.get(self.url, {'format': 'ndjson'})
+        self.assertEqual(forbidden.status_code, 403)
+        self.assertEqual(json.loads(forbidden.content), {'error': 'You are not a member of this group'})
+
+        self.client.force_authenticate(None)
+        unauthenticated = self.client.get(self.url)
+        self.assertEqual(unauthenticated.status_code, 401)
+        self.assertEqual(unauthenticated['Content-Type'], 'application/json')
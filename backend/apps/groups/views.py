@@ -1,18 +1,77 @@
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-from collections import defaultdict
-from decimal import Decimal
+from django.http import StreamingHttpResponse
+from django.db.models import Q, Prefetch, prefetch_related_objects
 from .models import Group, GroupMembership
 from .serializers import GroupSerializer, GroupCreateSerializer, AddMemberSerializer
 from apps.users.models import CustomUser
-from apps.expenses.models import Expense, ExpenseSplit
+from apps.expenses.balances import counterparty_balances, ledger_rows
+from apps.expenses.models import ExpenseSplit
+from apps.expenses.exporter import CSVRenderer, NDJSONRenderer, STREAMS
+from apps.users.cache import make_etag, not_modified, with_etag
 
 
-class GroupListCreateView(generics.ListCreateAPIView):
+class GroupQuerysetMixin:
+    """
+    Groups the user is an active member of, loaded with everything
+    GroupSerializer reads so serializing a page costs a fixed number of
+    queries. Clients can ask for a subset of fields with `?fields=id,name`,
+    in which case members and stats are only loaded when asked for.
+    """
+    
+    def get_base_queryset(self):
+        return Group.objects.filter(
+            group_memberships__user=self.request.user,
+            group_memberships__is_active=True,
+            is_active=True
+        ).distinct()
+    
+    def get_queryset(self, prefetch=True):
+        fields = self.get_sparse_fields()
+        queryset = self.get_base_queryset()
+        
+        if fields is None or 'created_by' in fields:
+            queryset = queryset.select_related('created_by')
+        if fields is None or {'member_count', 'total_expenses'} & fields:
+            queryset = queryset.with_stats()
+        if prefetch:
+            queryset = queryset.prefetch_related(*self.get_prefetches())
+        return queryset
+    
+    def get_prefetches(self):
+        fields = self.get_sparse_fields()
+        if fields is not None and 'group_memberships' not in fields:
+            return []
+        return [Prefetch(
+            'group_memberships',
+            queryset=GroupMembership.objects.filter(is_active=True).select_related('user')
+        )]
+    
+    def get_sparse_fields(self):
+        """Fields requested with `?fields=`, or None for all of them (reads only)"""
+        if self.request.method != 'GET' or 'fields' not in self.request.query_params:
+            return None
+        
+        fields = {field.strip() for field in self.request.query_params['fields'].split(',') if field.strip()}
+        unknown = fields - set(GroupSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+        return fields
+    
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None and self.get_serializer_class() is GroupSerializer:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+
+class GroupListCreateView(GroupQuerysetMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_serializer_class(self):
@@ -20,25 +79,28 @@ class GroupListCreateView(generics.ListCreateAPIView):
             return GroupCreateSerializer
         return GroupSerializer
     
-    def get_queryset(self):
-        # Return groups where user is a member
-        return Group.objects.filter(
-            group_memberships__user=self.request.user,
-            group_memberships__is_active=True,
-            is_active=True
-        ).distinct()
+    def list(self, request, *args, **kwargs):
+        # One row of counters per group decides whether anything changed
+        versions = self.get_base_queryset().order_by('id').values_list('id', 'data_version', 'updated_at')
+        etag = make_etag(request, *versions)
+        return not_modified(request, etag) or with_etag(super().list(request, *args, **kwargs), etag)
 
 
-class GroupDetailView(generics.RetrieveUpdateDestroyAPIView):
+class GroupDetailView(GroupQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = GroupSerializer
     permission_classes = [IsAuthenticated]
     
-    def get_queryset(self):
-        return Group.objects.filter(
-            group_memberships__user=self.request.user,
-            group_memberships__is_active=True,
-            is_active=True
-        ).distinct()
+    def retrieve(self, request, *args, **kwargs):
+        # Members are loaded after the ETag check, so a 304 never reads them
+        group = get_object_or_404(self.get_queryset(prefetch=False), pk=kwargs['pk'])
+        self.check_object_permissions(request, group)
+        etag = make_etag(request, group.id, group.data_version, group.updated_at)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        
+        prefetch_related_objects([group], *self.get_prefetches())
+        return with_etag(Response(self.get_serializer(group).data), etag)
 
 
 @api_view(['POST'])
@@ -145,43 +207,64 @@ def group_settlement_summary(request, group_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    # Get only approved expenses in this group
-    expenses = Expense.objects.filter(group_id=group_id, is_approved=True)
-    
-    # Calculate balances from expense splits
-    balances = defaultdict(Decimal)
-    
-    for expense in expenses:
-        splits = expense.expense_splits.all()
-        
-        for split in splits:
-            if split.user == user:
-                if expense.paid_by != user:
-                    # Current user owes money to the person who paid
-                    balances[expense.paid_by.id] += split.amount
-                else:
-                    # Current user paid, others in this expense owe them
-                    other_splits = splits.exclude(user=user)
-                    for other_split in other_splits:
-                        balances[other_split.user.id] -= other_split.amount
+    # Net the approved splits between the user and everyone else in the group
+    balances = counterparty_balances(ledger_rows(ExpenseSplit.objects.filter(
+        Q(user=user) | Q(expense__paid_by=user),
+        expense__group_id=group_id, expense__is_approved=True
+    )), user.id)
     
     # Convert to list format with user details
+    users_by_id = CustomUser.objects.in_bulk(balances)
     summary = []
     for user_id, amount in balances.items():
-        if amount != 0:  # Only include non-zero balances
-            other_user = CustomUser.objects.get(id=user_id)
-            summary.append({
-                'user_id': user_id,
-                'name': other_user.get_full_name() or other_user.username,
-                'email': other_user.email,
-                'balance': float(amount),
-                'type': 'owes_to_them' if amount > 0 else 'owes_to_you',
-                'amount': float(abs(amount))
-            })
+        other_user = users_by_id[user_id]
+        summary.append({
+            'user_id': user_id,
+            'name': other_user.get_full_name() or other_user.username,
+            'email': other_user.email,
+            'balance': float(amount),
+            'type': 'owes_to_them' if amount > 0 else 'owes_to_you',
+            'amount': float(abs(amount))
+        })
     
     return Response({
         'summary': summary,
         'group_id': group_id,
-        'total_owed_by_you': sum(float(amt) for amt in balances.values() if amt > 0),
-        'total_owed_to_you': sum(float(abs(amt)) for amt in balances.values() if amt < 0)
+        'total_owed_by_you': float(sum(amt for amt in balances.values() if amt > 0)),
+        'total_owed_to_you': float(-sum(amt for amt in balances.values() if amt < 0))
     })
+
+
+class GroupLedgerExportView(APIView):
+    """
+    Stream every expense of a group, with its splits, as CSV (default) or NDJSON.
+    
+    Pick the format with `?format=csv` or `?format=ndjson`. Errors are
+    always JSON, whatever format was asked for.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+    
+    def get(self, request, group_id):
+        group = get_object_or_404(Group, id=group_id)
+        if not GroupMembership.objects.filter(group=group, user=request.user, is_active=True).exists():
+            return Response(
+                {'error': 'You are not a member of this group'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            STREAMS[renderer.format](group.id),
+            content_type=f'{renderer.media_type}; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="group-{group.id}-expenses.{renderer.format}"'
+        return response
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Error bodies (including 401s and 404s raised before get() runs) are
+        # rendered as JSON rather than as a one-row CSV
+        if isinstance(response, Response) and response.status_code >= 400:
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import ChangeLog
+
+@admin.register(ChangeLog)
+class ChangeLogAdmin(admin.ModelAdmin):
+    list_display = ('id', 'model_name', 'object_id', 'action', 'group', 'user', 'created_at')
+    list_filter = ('model_name', 'action', 'created_at')
+    search_fields = ('object_id', 'group__name', 'user__email')
+    readonly_fields = ('created_at',)
+    ordering = ('-id',)
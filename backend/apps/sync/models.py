@@ -0,0 +1,69 @@
+from django.db import models
+from django.conf import settings
+
+
+class ChangeLog(models.Model):
+    """
+    Append-only log of changes to the records the mobile client syncs.
+    
+    Each change is recorded against the group it belongs to (seen by every
+    current member) and/or against individual users (personal expenses,
+    settlements, a member's own membership). The id is the sync cursor.
+    """
+    MODEL_CHOICES = [
+        ('expense', 'Expense'),
+        ('split', 'Expense split'),
+        ('settlement', 'Settlement'),
+        ('membership', 'Group membership'),
+    ]
+    
+    ACTION_CHOICES = [
+        ('upsert', 'Created or updated'),
+        ('delete', 'Deleted'),
+    ]
+    
+    model_name = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    group = models.ForeignKey(
+        'groups.Group',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='change_log'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='change_log'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'change_log'
+        indexes = [
+            models.Index(fields=['group', 'id'], name='change_log_group_idx'),
+            models.Index(fields=['user', 'id'], name='change_log_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.model_name} {self.object_id}"
+    
+    @classmethod
+    def entries_for(cls, model_name, object_id, action, group_id=None, user_ids=()):
+        """Unsaved log rows for one change: one for the group, one per extra user"""
+        entries = []
+        if group_id:
+            entries.append(cls(model_name=model_name, object_id=object_id, action=action, group_id=group_id))
+        entries.extend(
+            cls(model_name=model_name, object_id=object_id, action=action, user_id=user_id)
+            for user_id in sorted({user_id for user_id in user_ids if user_id})
+        )
+        return entries
+    
+    @classmethod
+    def record(cls, model_name, object_id, action, group_id=None, user_ids=()):
+        """Append one change to the log"""
+        cls.objects.bulk_create(cls.entries_for(model_name, object_id, action, group_id, user_ids))
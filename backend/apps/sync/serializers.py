@@ -0,0 +1,33 @@
+from rest_framework import serializers
+from backend_project.instrumentation import TimedSerializerMixin
+from apps.expenses.models import ExpenseSplit, Settlement
+from apps.groups.serializers import GroupMemberSerializer
+from apps.users.serializers import UserSerializer
+
+
+class SyncSplitSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """A split on its own; splits of a new or changed expense come nested in the expense"""
+    expense_id = serializers.IntegerField(read_only=True)
+    user_id = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = ExpenseSplit
+        fields = ('id', 'expense_id', 'user_id', 'amount', 'percentage')
+
+
+class SyncSettlementSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    from_user = UserSerializer(read_only=True)
+    to_user = UserSerializer(read_only=True)
+    group_id = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Settlement
+        fields = ('id', 'from_user', 'to_user', 'group_id', 'amount', 'currency',
+                 'status', 'notes', 'created_at', 'confirmed_at')
+
+
+class SyncMembershipSerializer(GroupMemberSerializer):
+    group_id = serializers.IntegerField(read_only=True)
+    
+    class Meta(GroupMemberSerializer.Meta):
+        fields = ('id', 'group_id') + GroupMemberSerializer.Meta.fields
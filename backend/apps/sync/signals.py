@@ -0,0 +1,99 @@
+"""
+Change log feed for /api/sync/.
+
+Changes are appended once the transaction commits, when the whole audience
+is known (the splits of a new expense are written after the expense).
+Group expenses and memberships are logged once against the group; personal
+expenses, settlements and a member's own membership are logged per user.
+Bulk writes do not send signals; code that uses bulk_create records its
+changes itself with record_after_commit().
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.expenses.models import Expense, ExpenseApproval, ExpenseSplit, Settlement
+from apps.groups.models import GroupMembership
+from .models import ChangeLog
+
+
+def record_after_commit(entries):
+    entries = list(entries)
+    transaction.on_commit(lambda: ChangeLog.objects.bulk_create(entries))
+
+
+def personal_expense_users(expense_id, paid_by_id):
+    """A personal expense is seen by its payer and its split users"""
+    user_ids = {paid_by_id}
+    user_ids.update(
+        ExpenseSplit.objects.filter(expense_id=expense_id).values_list('user_id', flat=True)
+    )
+    return user_ids
+
+
+@receiver(post_save, sender=Expense)
+def expense_saved(sender, instance, **kwargs):
+    expense_id, paid_by_id, group_id = instance.id, instance.paid_by_id, instance.group_id
+    
+    def record():
+        user_ids = () if group_id else personal_expense_users(expense_id, paid_by_id)
+        ChangeLog.record('expense', expense_id, 'upsert', group_id, user_ids)
+    
+    transaction.on_commit(record)
+
+
+@receiver(post_save, sender=ExpenseApproval)
+def approval_saved(sender, instance, **kwargs):
+    # Verification statuses are part of the expense's payload
+    expense_saved(Expense, instance.expense)
+
+
+@receiver(pre_delete, sender=Expense)
+def expense_deleted(sender, instance, **kwargs):
+    # The splits are gone after the delete, so collect the audience now
+    user_ids = () if instance.group_id else personal_expense_users(instance.id, instance.paid_by_id)
+    record_after_commit(
+        ChangeLog.entries_for('expense', instance.id, 'delete', instance.group_id, user_ids)
+    )
+
+
+@receiver(post_save, sender=ExpenseSplit)
+@receiver(post_delete, sender=ExpenseSplit)
+def split_changed(sender, instance, signal, origin=None, **kwargs):
+    # Splits removed by an expense delete go away with the expense's tombstone
+    if getattr(origin, 'model', type(origin)) is Expense:
+        return
+    action = 'delete' if signal is post_delete else 'upsert'
+    split_id, expense_id, user_id = instance.id, instance.expense_id, instance.user_id
+    
+    def record():
+        user_ids = {user_id}
+        group_id = None
+        expense = Expense.objects.filter(id=expense_id).values_list('paid_by_id', 'group_id').first()
+        if expense:
+            paid_by_id, group_id = expense
+            if not group_id:
+                user_ids |= personal_expense_users(expense_id, paid_by_id)
+        ChangeLog.record('split', split_id, action, group_id, () if group_id else user_ids)
+    
+    transaction.on_commit(record)
+
+
+@receiver(post_save, sender=Settlement)
+@receiver(post_delete, sender=Settlement)
+def settlement_changed(sender, instance, signal, **kwargs):
+    action = 'delete' if signal is post_delete else 'upsert'
+    record_after_commit(ChangeLog.entries_for(
+        'settlement', instance.id, action, user_ids=[instance.from_user_id, instance.to_user_id]
+    ))
+
+
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def membership_changed(sender, instance, signal, **kwargs):
+    # Logged for the member too, who no longer sees the group's entries once
+    # they have left it
+    action = 'delete' if signal is post_delete else 'upsert'
+    record_after_commit(ChangeLog.entries_for(
+        'membership', instance.id, action, instance.group_id, [instance.user_id]
+    ))
@@ -0,0 +1,53 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.expenses.tests import GroupFixtureMixin
+
+
+@mock.patch('apps.sync.views.SETTLE_DELAY', timedelta(0))
+class SyncChangesTests(GroupFixtureMixin, APITestCase):
+    """A delta sync returns only what changed since the cursor, with tombstones"""
+
+    def setUp(self):
+        # The memberships are logged on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_group()
+        self.client.force_authenticate(self.user)
+
+    def create_expense(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/expenses/', {
+                'title': title,
+                'amount': '50.00',
+                'group_id': self.group.id,
+                'split_type': 'equal',
+                'expense_date': timezone.now().isoformat(),
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return self.group.expenses.get(title=title)
+
+    def test_delta_sync(self):
+        old = self.create_expense('Old')
+        self.create_expense('Unchanged')
+
+        full = self.client.get('/api/sync/').data
+        self.assertTrue(full['full'])
+        self.assertEqual(len(full['expenses']), 2)
+        self.assertEqual(len(full['memberships']), 2)
+
+        self.create_expense('New')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/expenses/{old.id}/')
+
+        delta = self.client.get(f"/api/sync/?since={full['cursor']}").data
+        self.assertFalse(delta['full'])
+        self.assertEqual([expense['title'] for expense in delta['expenses']], ['New'])
+        self.assertEqual(delta['deleted']['expenses'], [old.id])
+        self.assertEqual(delta['memberships'], [])
+
+        empty = self.client.get(f"/api/sync/?since={delta['cursor']}").data
+        self.assertEqual(empty['cursor'], delta['cursor'])
+        self.assertEqual(empty['expenses'], [])
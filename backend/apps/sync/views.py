@@ -0,0 +1,142 @@
+from datetime import timedelta
+
+from django.db.models import Max, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from apps.expenses.models import Expense, ExpenseSplit, Settlement
+from apps.expenses.serializers import ExpenseSerializer
+from apps.groups.models import GroupMembership
+from .models import ChangeLog
+from .serializers import SyncMembershipSerializer, SyncSettlementSerializer, SyncSplitSerializer
+
+
+SYNC_PAGE_SIZE = 500
+
+# Log ids are handed out when a change is appended, so a change appended
+# just now could still be followed by a lower id from a slower writer.
+# Changes younger than this are held back until the next sync.
+SETTLE_DELAY = timedelta(seconds=2)
+
+RESPONSE_KEYS = {
+    'expense': 'expenses',
+    'split': 'splits',
+    'settlement': 'settlements',
+    'membership': 'memberships',
+}
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """
+    Expenses, splits, settlements and memberships changed since a cursor.
+
+    Without `since` the user's full current state is returned (`full: true`).
+    Pass the returned `cursor` as `since` on the next call, and call again
+    straight away while `has_more` is true. Deleted records are listed by id
+    under `deleted`; the splits of a deleted expense are not listed separately.
+    """
+    user = request.user
+    
+    since = request.query_params.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+            if since < 0:
+                raise ValueError
+        except ValueError:
+            return Response({
+                'error': 'since must be a cursor returned by a previous sync'
+            }, status=status.HTTP_400_BAD_REQUEST)
+    
+    cutoff = timezone.now() - SETTLE_DELAY
+    group_ids = list(GroupMembership.objects.filter(
+        user=user, is_active=True
+    ).values_list('group_id', flat=True))
+    
+    if since is None:
+        # Everything after this cursor is delivered by the next delta sync
+        cursor = ChangeLog.objects.filter(created_at__lte=cutoff).aggregate(Max('id'))['id__max'] or 0
+        return Response(full_snapshot(user, group_ids, cursor))
+    
+    entries = list(ChangeLog.objects.filter(
+        Q(group_id__in=group_ids) | Q(user=user), id__gt=since
+    ).order_by('id').values_list(
+        'id', 'model_name', 'object_id', 'action', 'created_at'
+    )[:SYNC_PAGE_SIZE + 1])
+    
+    has_more = len(entries) > SYNC_PAGE_SIZE
+    entries = entries[:SYNC_PAGE_SIZE]
+    for index, entry in enumerate(entries):
+        if entry[4] > cutoff:
+            entries = entries[:index]
+            has_more = False
+            break
+    
+    # Only the last change to each record matters
+    latest = {}
+    for _, model_name, object_id, action, _ in entries:
+        latest[(model_name, object_id)] = action
+    
+    upserts = {model_name: set() for model_name in RESPONSE_KEYS}
+    deleted = {key: [] for key in RESPONSE_KEYS.values()}
+    for (model_name, object_id), action in latest.items():
+        if action == 'delete':
+            deleted[RESPONSE_KEYS[model_name]].append(object_id)
+        else:
+            upserts[model_name].add(object_id)
+    
+    # A group the user has just joined comes with its whole history, which
+    # happened before the user's cursor
+    joined_group_ids = list(GroupMembership.objects.filter(
+        id__in=upserts['membership'], user=user, is_active=True, group_id__in=group_ids
+    ).values_list('group_id', flat=True))
+    
+    return Response(sync_payload(
+        cursor=entries[-1][0] if entries else since,
+        has_more=has_more,
+        full=False,
+        expenses=Expense.objects.filter(
+            Q(id__in=upserts['expense']) | Q(group_id__in=joined_group_ids)
+        ),
+        splits=ExpenseSplit.objects.filter(id__in=upserts['split']),
+        settlements=Settlement.objects.filter(id__in=upserts['settlement']),
+        memberships=GroupMembership.objects.filter(
+            Q(id__in=upserts['membership']) | Q(group_id__in=joined_group_ids)
+        ),
+        deleted=deleted,
+    ))
+
+
+def full_snapshot(user, group_ids, cursor):
+    return sync_payload(
+        cursor=cursor,
+        has_more=False,
+        full=True,
+        expenses=Expense.objects.visible_to(user),
+        splits=ExpenseSplit.objects.none(),
+        settlements=Settlement.objects.filter(Q(from_user=user) | Q(to_user=user)),
+        memberships=GroupMembership.objects.filter(Q(group_id__in=group_ids) | Q(user=user)),
+        deleted={key: [] for key in RESPONSE_KEYS.values()},
+    )
+
+
+def sync_payload(cursor, has_more, full, expenses, splits, settlements, memberships, deleted):
+    return {
+        'cursor': cursor,
+        'has_more': has_more,
+        'full': full,
+        'expenses': ExpenseSerializer(expenses.with_details().order_by('id'), many=True).data,
+        'splits': SyncSplitSerializer(splits.order_by('id'), many=True).data,
+        'settlements': SyncSettlementSerializer(
+            settlements.select_related('from_user', 'to_user').order_by('id'), many=True
+        ).data,
+        'memberships': SyncMembershipSerializer(
+            memberships.select_related('user').order_by('id'), many=True
+        ).data,
+        'deleted': deleted,
+    }
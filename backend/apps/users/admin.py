@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser, OTP
+from .models import CustomUser, OTP, EmailOutbox
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
@@ -27,3 +27,12 @@ class OTPAdmin(admin.ModelAdmin):
         return obj.is_valid()
     is_valid_status.short_description = 'Valid'
     is_valid_status.boolean = True
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('created_at', 'sent_at')
+    ordering = ('-created_at',)
@@ -0,0 +1,55 @@
+"""
+JWT authentication for the async views.
+
+DRF views are synchronous, so the async endpoints are plain Django views.
+`async_api_view` gives them what `@api_view` and `IsAuthenticated` give the
+others: the same Bearer token check, error responses in DRF's shape, and
+JSON rendered with DRF's encoder (Decimals, dates).
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+jwt_authentication = JWTAuthentication()
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    return JsonResponse(data, status=status, headers=headers, encoder=JSONEncoder, safe=False)
+
+
+def async_api_view(http_method_names):
+    """Decorate an async view that only authenticated users may call with the given methods"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in http_method_names:
+                return json_response({
+                    'detail': f'Method "{request.method}" not allowed.'
+                }, status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': ', '.join(http_method_names)})
+
+            # One user lookup, run like any other async ORM call
+            try:
+                authenticated = await sync_to_async(jwt_authentication.authenticate)(request)
+            except APIException as exc:
+                detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+                return unauthorized(request, detail)
+            if authenticated is None:
+                return unauthorized(request, {'detail': 'Authentication credentials were not provided.'})
+
+            request.user = authenticated[0]
+            return await view(request, *args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def unauthorized(request, detail):
+    return json_response(detail, status=status.HTTP_401_UNAUTHORIZED, headers={
+        'WWW-Authenticate': jwt_authentication.authenticate_header(request),
+    })
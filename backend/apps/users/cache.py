@@ -0,0 +1,75 @@
+"""
+Per-user response cache for the dashboard endpoints.
+
+Entries are keyed by the user's `data_version`, which the signals in
+apps.expenses.signals bump whenever an expense, split, settlement or
+membership involving the user changes, so stale entries are never read
+again and simply expire. The key also includes `updated_at`, so a save of a
+stale user instance (which can write an old data_version back) or a profile
+change never hits an older entry.
+
+The version is read from request.user, which the authentication class has
+just loaded, so a cache hit costs no query at all.
+
+The same counters (plus Group.data_version) make up the strong ETags of the
+group, expense and debt endpoints: a view computes the ETag from a few
+version numbers and answers If-None-Match with 304 before serializing.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+DASHBOARD_CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def user_cache_key(user, name):
+    return f"user:{user.id}:{user.data_version}:{user.updated_at.timestamp()}:{name}"
+
+
+def get_or_build(user, name, build, timeout=DASHBOARD_CACHE_TIMEOUT):
+    """Return the cached `name` payload for the user, building it on a miss"""
+    return cache.get_or_set(user_cache_key(user, name), build, timeout)
+
+
+async def aget_or_build(user, name, build, timeout=DASHBOARD_CACHE_TIMEOUT):
+    """get_or_build for async views; `build` is a coroutine function"""
+    key = user_cache_key(user, name)
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, timeout)
+    return data
+
+
+def make_etag(request, *parts):
+    """
+    Strong ETag for a response built from the given change counters.
+    
+    The path, query string and renderer are part of it, so pages, filters
+    and formats of the same resource never share a tag.
+    """
+    raw = ':'.join(str(part) for part in (
+        request.user.id, request.get_full_path(), request.accepted_renderer.format, *parts
+    ))
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def not_modified(request, etag):
+    """A 304 response if the client's copy is current (If-None-Match), else None"""
+    client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in client_etags or '*' in client_etags:
+        return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    return None
+
+
+def with_etag(response, etag):
+    response['ETag'] = etag
+    # Per-user data: clients may keep it but must revalidate, shared caches must not
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.users.services import EmailService
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox emails, reusing one SMTP connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails sent per SMTP connection')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Email outbox worker started')
+
+        while True:
+            stats = EmailService.drain_outbox(options['batch_size'])
+            if stats['claimed']:
+                self.report(stats)
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+    def report(self, stats):
+        latencies = sorted(stats['latencies_ms'])
+        line = f"sent={stats['sent']} retried={stats['retried']} failed={stats['failed']}"
+        if latencies:
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            line += f" latency_ms p50={p50:.1f} p95={p95:.1f} max={latencies[-1]:.1f}"
+        self.stdout.write(line)
@@ -19,6 +19,10 @@ class CustomUser(AbstractUser):
     two_factor_enabled = models.BooleanField(default=True)  # Enable 2FA by default
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped whenever expenses, splits, settlements or memberships that show
+    # up on this user's dashboards change; part of the dashboard cache key
+    # and of the user's ETags
+    data_version = models.PositiveIntegerField(default=0)
     
     # Use email as the username field
     USERNAME_FIELD = 'email'
@@ -36,33 +40,52 @@ class CustomUser(AbstractUser):
     def full_name(self):
         return f"{self.first_name} {self.last_name}".strip()
     
+    @classmethod
+    def bump_data_version(cls, user_ids):
+        """Invalidate the cached dashboards of the given users"""
+        user_ids = {user_id for user_id in user_ids if user_id}
+        if user_ids:
+            cls.objects.filter(id__in=user_ids).update(data_version=models.F('data_version') + 1)
+    
+    def balance_snapshot_rows(self):
+        # Snapshots are kept per currency and maintained on every split,
+        # approval and payment change (see UserBalanceSnapshot); the user's
+        # rows are read straight off the (user, currency) unique index
+        return self.balance_snapshots.exclude(
+            owed_to_others=0, owed_by_others=0
+        ).order_by('currency').values_list('currency', 'owed_to_others', 'owed_by_others')
+    
     def get_balance_summary(self):
-        """Calculate user's balance from expenses (only approved expenses)"""
-        from django.db.models import Sum
-        from apps.expenses.models import ExpenseSplit, Settlement, Expense
-        
-        # Amount user owes to others (splits where they are assigned, but EXCLUDE expenses they paid for)
-        # Only count splits from expenses paid by OTHER people AND only from APPROVED expenses
-        owed_to_others = self.expense_splits.exclude(
-            expense__paid_by=self
-        ).filter(
-            expense__is_approved=True
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Amount others owe to user (from expenses they paid, minus their own split)
-        # Only count APPROVED expenses
-        owed_by_others = 0
-        user_paid_expenses = Expense.objects.filter(paid_by=self, is_approved=True)
-        for expense in user_paid_expenses:
-            # Sum of all splits except user's own split
-            total_splits = expense.expense_splits.exclude(user=self).aggregate(total=Sum('amount'))['total'] or 0
-            owed_by_others += total_splits
-        
-        return {
-            'owed_to_others': float(owed_to_others),
-            'owed_by_others': float(owed_by_others),
-            'net_balance': float(owed_by_others - owed_to_others)
+        """User's balances from approved expenses per currency, read from the balance snapshots"""
+        return self.format_balance_summary(list(self.balance_snapshot_rows()))
+    
+    async def aget_balance_summary(self):
+        """get_balance_summary for async views"""
+        return self.format_balance_summary([row async for row in self.balance_snapshot_rows()])
+    
+    @staticmethod
+    def format_balance_summary(rows):
+        """
+        Totals per currency, plus top-level totals when the user's balances
+        are all in one currency (None when they span several, since amounts
+        in different currencies are never added together)
+        """
+        by_currency = {
+            currency: {
+                'owed_to_others': float(owed_to_others),
+                'owed_by_others': float(owed_by_others),
+                'net_balance': float(owed_by_others - owed_to_others)
+            }
+            for currency, owed_to_others, owed_by_others in rows
         }
+        if len(by_currency) == 1:
+            currency, summary = next(iter(by_currency.items()))
+        elif not by_currency:
+            currency, summary = None, {'owed_to_others': 0.0, 'owed_by_others': 0.0, 'net_balance': 0.0}
+        else:
+            currency, summary = None, {'owed_to_others': None, 'owed_by_others': None, 'net_balance': None}
+        
+        return {**summary, 'currency': currency, 'by_currency': by_currency}
 
 
 class OTP(models.Model):
@@ -162,3 +185,38 @@ class OTPToken(models.Model):
     
     def __str__(self):
         return f"OTP {self.otp_code} for {self.user.email}"
+
+
+class EmailOutbox(models.Model):
+    """
+    Outgoing emails queued by request handlers and delivered by the outbox
+    drain worker (`python manage.py drain_email_outbox`), so requests never
+    wait on an SMTP round-trip.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    to_email = models.EmailField()
+    from_email = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'email_outbox'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} to {self.to_email} ({self.status})"
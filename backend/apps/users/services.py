@@ -1,15 +1,24 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 class EmailService:
     """Service for sending emails"""
     
+    # Retry schedule for the outbox: 30s, 1m, 2m, 4m, ... then give up
+    MAX_ATTEMPTS = 6
+    RETRY_BASE_SECONDS = 30
+    CLAIM_LEASE = timedelta(minutes=5)
+    
     @staticmethod
     def send_otp_email(user, otp_code):
-        """Send OTP code to user's email"""
+        """Queue OTP code for delivery to user's email"""
         try:
             subject = 'SplitWise - Your OTP Code'
             
@@ -23,21 +32,119 @@ This code will expire in 10 minutes. If you didn't request this code, please ign
 Best regards,
 SplitWise Team"""
             
-            # Send email
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
+            # Queue email; the outbox worker delivers it
+            EmailService.queue_email(user.email, subject, message)
             
-            logger.info(f"OTP email sent successfully to {user.email}")
-            print(f"SUCCESS: OTP email sent to {user.email}: {otp_code}")
+            logger.info(f"OTP email queued for {user.email}")
             return True
-            
+        
         except Exception as e:
-            logger.error(f"Failed to send OTP email to {user.email}: {str(e)}")
+            logger.error(f"Failed to queue OTP email to {user.email}: {str(e)}")
             print(f"EMAIL FAILED - OTP for {user.email}: {otp_code}")
             print(f"Error details: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    @staticmethod
+    def queue_email(to_email, subject, body, from_email=None):
+        """Write an email to the outbox"""
+        from .models import EmailOutbox
+        return EmailOutbox.objects.create(
+            to_email=to_email,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            subject=subject,
+            body=body,
+        )
+    
+    @staticmethod
+    def claim_due_emails(batch_size):
+        """
+        Atomically move up to `batch_size` due emails to sending.
+        
+        Claims are leased: an email left in sending by a crashed worker becomes
+        due again once its lease expires.
+        """
+        from .models import EmailOutbox
+        now = timezone.now()
+        due = Q(status='pending') | Q(status='sending')
+        due_ids = list(EmailOutbox.objects.filter(
+            due, next_attempt_at__lte=now
+        ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+        
+        claimed_ids = [
+            email_id for email_id in due_ids
+            # Only one worker wins the transition to sending
+            if EmailOutbox.objects.filter(due, id=email_id, next_attempt_at__lte=now).update(
+                status='sending',
+                next_attempt_at=now + EmailService.CLAIM_LEASE
+            )
+        ]
+        return list(EmailOutbox.objects.filter(id__in=claimed_ids).order_by('id'))
+    
+    @staticmethod
+    def drain_outbox(batch_size=100):
+        """
+        Deliver one batch of due outbox emails over a single SMTP connection.
+
+        Failed emails are rescheduled with exponential backoff until
+        MAX_ATTEMPTS is reached. Returns delivery stats with send latencies.
+        """
+        stats = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'latencies_ms': []}
+        
+        emails = EmailService.claim_due_emails(batch_size)
+        stats['claimed'] = len(emails)
+        if not emails:
+            return stats
+        
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error(f"Could not open email connection: {str(e)}")
+            for email in emails:
+                EmailService._schedule_retry(email, e, stats)
+            return stats
+        
+        try:
+            for email in emails:
+                message = EmailMessage(
+                    subject=email.subject,
+                    body=email.body,
+                    from_email=email.from_email,
+                    to=[email.to_email],
+                    connection=connection,
+                )
+                started = time.perf_counter()
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    logger.error(f"Failed to send email {email.id} to {email.to_email}: {str(e)}")
+                    EmailService._schedule_retry(email, e, stats)
+                    continue
+                
+                latency_ms = (time.perf_counter() - started) * 1000
+                stats['latencies_ms'].append(latency_ms)
+                stats['sent'] += 1
+                
+                email.status = 'sent'
+                email.attempts += 1
+                email.sent_at = timezone.now()
+                email.save(update_fields=['status', 'attempts', 'sent_at'])
+                logger.info(f"Email {email.id} sent to {email.to_email} in {latency_ms:.1f}ms")
+        finally:
+            connection.close()
+        
+        return stats
+    
+    @staticmethod
+    def _schedule_retry(email, error, stats):
+        email.attempts += 1
+        email.last_error = str(error)
+        if email.attempts >= EmailService.MAX_ATTEMPTS:
+            email.status = 'failed'
+            stats['failed'] += 1
+        else:
+            email.status = 'pending'
+            delay = EmailService.RETRY_BASE_SECONDS * 2 ** (email.attempts - 1)
+            email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+            stats['retried'] += 1
+        email.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
@@ -1,3 +1,110 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from .models import EmailOutbox
+from .services import EmailService
+
+
+class FailingBackend(EmailBackend):
+    """An SMTP server that refuses every message"""
+
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('Connection refused')
+
+
+class UnreachableBackend(EmailBackend):
+    """An SMTP server that cannot be connected to"""
+
+    def open(self):
+        raise TimeoutError('Timed out')
+
+
+class EmailOutboxTests(TestCase):
+    """Emails are queued with the request's transaction and delivered by the drain worker"""
+
+    def queue(self):
+        email = EmailService.queue_email('friend@example.com', 'Your OTP', '123456')
+        # The worker's clock starts when the email is due
+        self.now = email.next_attempt_at
+        return email
+
+    def drain(self, backend='django.core.mail.backends.locmem.EmailBackend'):
+        with override_settings(EMAIL_BACKEND=backend), \
+                mock.patch('apps.users.services.logger'), \
+                mock.patch('apps.users.services.timezone.now', return_value=self.now):
+            return EmailService.drain_outbox()
+
+    def test_queued_on_commit_only(self):
+        try:
+            with transaction.atomic():
+                EmailService.queue_email('lost@example.com', 'Hi', 'Rolled back')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(EmailOutbox.objects.exists())
+
+        with transaction.atomic():
+            email = EmailService.queue_email('kept@example.com', 'Hi', 'Committed')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('pending', 0))
+        # Nothing is sent inside the request
+        self.assertEqual(mail.outbox, [])
+
+    def test_retries_with_backoff_then_delivers(self):
+        email = self.queue()
+
+        stats = self.drain(backend='apps.users.tests.FailingBackend')
+        self.assertEqual((stats['claimed'], stats['retried'], stats['sent']), (1, 1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertEqual(email.last_error, 'Connection refused')
+        self.assertEqual(email.next_attempt_at, self.now + timedelta(seconds=30))
+
+        # Not due again until the backoff has passed
+        self.assertEqual(self.drain()['claimed'], 0)
+
+        self.now += timedelta(seconds=30)
+        self.drain(backend='apps.users.tests.UnreachableBackend')
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 2)
+        self.assertEqual(email.next_attempt_at, self.now + timedelta(seconds=60))
+
+        self.now += timedelta(seconds=60)
+        output = StringIO()
+        with mock.patch('apps.users.services.logger'), \
+                mock.patch('apps.users.services.timezone.now', return_value=self.now):
+            call_command('drain_email_outbox', once=True, stdout=output)
+        self.assertIn('sent=1 retried=0 failed=0', output.getvalue())
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('sent', 3))
+        self.assertEqual([message.to for message in mail.outbox], [['friend@example.com']])
+
+    def test_gives_up_after_max_attempts(self):
+        email = self.queue()
+        EmailOutbox.objects.filter(id=email.id).update(attempts=EmailService.MAX_ATTEMPTS - 1)
+
+        stats = self.drain(backend='apps.users.tests.FailingBackend')
+        self.assertEqual((stats['retried'], stats['failed']), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', EmailService.MAX_ATTEMPTS))
+
+        self.now += timedelta(days=1)
+        self.assertEqual(self.drain()['claimed'], 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_crashed_worker_claims_expire(self):
+        email = self.queue()
+        with mock.patch('apps.users.services.timezone.now', return_value=self.now):
+            self.assertEqual(EmailService.claim_due_emails(10), [email])
+            # A second worker cannot claim it while the lease holds
+            self.assertEqual(EmailService.claim_due_emails(10), [])
+
+        self.now += EmailService.CLAIM_LEASE
+        self.assertEqual(self.drain()['sent'], 1)
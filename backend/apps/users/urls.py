@@ -9,7 +9,7 @@ urlpatterns = [
     path('login/', views.LoginView.as_view(), name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('profile/', views.ProfileView.as_view(), name='profile'),
-    path('dashboard/', views.DashboardView.as_view(), name='dashboard'),
+    path('dashboard/', views.dashboard, name='dashboard'),
     path('refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('password-reset/', views.password_reset_request, name='password_reset'),
     path('verify-password-reset-otp/', views.verify_password_reset_otp, name='verify_password_reset_otp'),
@@ -6,13 +6,20 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.utils import timezone
+from asgiref.sync import sync_to_async
 from datetime import timedelta
+import asyncio
+import logging
 import random
+from .authentication import async_api_view, json_response
 from .models import CustomUser, OTP
 from .serializers import UserRegistrationSerializer, UserSerializer, LoginSerializer
 from .services import EmailService
 
 
+logger = logging.getLogger(__name__)
+
+
 class RegisterView(generics.CreateAPIView):
     queryset = CustomUser.objects.all()
     serializer_class = UserRegistrationSerializer
@@ -126,6 +133,8 @@ class ProfileView(generics.RetrieveUpdateAPIView):
             'balance': balance_data['net_balance'],    # Net balance (positive = you're owed, negative = you owe)
             'owes': balance_data['owed_to_others'],    # Amount you owe to others  
             'owed': balance_data['owed_by_others'],    # Amount others owe to you
+            'currency': balance_data['currency'],      # Currency of the three above (None if mixed)
+            'balances_by_currency': balance_data['by_currency'],
             'stats': {
                 'total_expenses': 0,  # TODO: Calculate from actual expenses
                 'groups_count': 0,    # TODO: Calculate from actual group memberships
@@ -135,63 +144,59 @@ class ProfileView(generics.RetrieveUpdateAPIView):
         return Response(profile_data)
 
 
-class DashboardView(generics.RetrieveAPIView):
-    permission_classes = [IsAuthenticated]
+@async_api_view(['GET'])
+async def dashboard(request):
+    user = request.user
+    
+    # Served from the per-user cache until something on the dashboard changes
+    from .cache import aget_or_build
+    dashboard_data = await aget_or_build(user, 'dashboard', lambda: build_dashboard(user))
+    
+    return json_response(dashboard_data)
 
-    def get(self, request, *args, **kwargs):
-        user = request.user
-        
-        # Get user data
-        user_data = UserSerializer(user).data
-        
-        # Get real balance data
-        balance_data = user.get_balance_summary()
-        
-        # Get expense and group counts
-        from apps.expenses.models import Expense, ExpenseSplit
-        from apps.expenses.serializers import ExpenseSerializer
-        from apps.groups.models import Group, GroupMembership
-        from django.db.models import Q
-        
-        # Get user's groups for filtering
-        user_groups = GroupMembership.objects.filter(
-            user=user, is_active=True
-        ).values_list('group_id', flat=True)
-        
-        # Get recent expenses (both group and personal expenses where user is involved)
-        recent_expenses = Expense.objects.filter(
-            Q(group_id__in=user_groups) |  # Group expenses where user is member
-            Q(group__isnull=True, paid_by=user) |  # Personal expenses paid by user
-            Q(expense_splits__user=user)  # Any expenses where user has splits
-        ).distinct().order_by('-created_at')[:10]
-        
+
+async def build_dashboard(user):
+    from apps.expenses.models import Expense
+    from apps.expenses.serializers import ExpenseSerializer
+    from apps.groups.models import Group
+    from django.db.models import Q
+    
+    # Get recent expenses (both group and personal expenses where user is involved)
+    recent_expenses = Expense.objects.visible_to(user).with_details().order_by('-created_at', '-id')[:10]
+    
+    # The balance, the recent expenses and the counts don't depend on each
+    # other, so none of them waits for another
+    balance_data, recent_expense_data, total_expenses, total_groups = await asyncio.gather(
+        user.aget_balance_summary(),
+        sync_to_async(lambda: ExpenseSerializer(recent_expenses, many=True).data)(),
         # Count expenses where user is involved (either paid by user or user has splits)
-        total_expenses = Expense.objects.filter(
-            Q(paid_by=user) | Q(expense_splits__user=user)
-        ).distinct().count()
-        
+        Expense.objects.filter(Q(paid_by=user) | Q(expense_splits__user=user)).distinct().acount(),
         # Count groups where user is a member
-        total_groups = Group.objects.filter(members=user).count()
-        
-        # Build dashboard data with real calculations
-        dashboard_data = {
-            'user': user_data,
-            'stats': {
-                'total_expenses': total_expenses,
-                'total_owed': balance_data['owed_to_others'],    # Amount user owes to others
-                'total_owing': balance_data['owed_by_others'],   # Amount others owe to user
-                'net_balance': balance_data['net_balance'],      # Net balance
-                'groups_count': total_groups,
-            },
-            'recent_expenses': ExpenseSerializer(recent_expenses, many=True).data,
-            'recent_groups': [],    # TODO: Add recent groups query
-        }
-        
-        print(f"Dashboard data for user {user.email}:")
-        print(f"Recent expenses count: {len(recent_expenses)}")
-        print(f"Balance data: {balance_data}")
-        
-        return Response(dashboard_data)
+        Group.objects.filter(members=user).acount(),
+    )
+    
+    # Build dashboard data with real calculations
+    dashboard_data = {
+        'user': UserSerializer(user).data,
+        'stats': {
+            'total_expenses': total_expenses,
+            'total_owed': balance_data['owed_to_others'],    # Amount user owes to others
+            'total_owing': balance_data['owed_by_others'],   # Amount others owe to user
+            'net_balance': balance_data['net_balance'],      # Net balance
+            'currency': balance_data['currency'],            # Currency of the totals (None if mixed)
+            'balances_by_currency': balance_data['by_currency'],
+            'groups_count': total_groups,
+        },
+        'recent_expenses': recent_expense_data,
+        'recent_groups': [],    # TODO: Add recent groups query
+    }
+    
+    logger.debug(
+        "Built dashboard for user %s: %s recent expenses, balance %s",
+        user.id, len(dashboard_data['recent_expenses']), balance_data
+    )
+    
+    return dashboard_data
 
 
 def generate_otp():
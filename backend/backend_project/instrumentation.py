@@ -0,0 +1,288 @@
+"""
+Per-request instrumentation: query count, SQL time, serialization time,
+render time and view time.
+
+Every request gets a Server-Timing header and one structured (JSON) line at
+DEBUG on this module's logger, and feeds the in-process counters served at
+/api/_metrics in the Prometheus text format. Counters live in each worker
+process, so scrape every worker to get the full picture. The endpoint is
+closed unless METRICS_TOKEN is set (or the caller is a staff user).
+
+Counting and timing queries costs one wrapper call per query. SQL text is
+only kept for the share of requests picked by
+INSTRUMENTATION_SQL_SAMPLE_RATE (0, i.e. off, by default); a sampled
+request slower than INSTRUMENTATION_SLOW_REQUEST_MS is logged with its
+most repeated statements, which is what an N+1 query pattern looks like.
+
+Serialization is the time spent in the to_representation() of serializers
+that use TimedSerializerMixin (nested ones count once, in their parent).
+Render is DRF's response.render(); view is the rest of the request.
+"""
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+SQL_SAMPLE_RATE = getattr(settings, 'INSTRUMENTATION_SQL_SAMPLE_RATE', 0.0)
+SLOW_REQUEST_MS = getattr(settings, 'INSTRUMENTATION_SLOW_REQUEST_MS', 500)
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+TOP_REPEATED_STATEMENTS = 5
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# The current request's serialization time; a mutable holder, so serializers
+# run in sync_to_async threads (which get a copy of the context) add to it
+serialization_timer = contextvars.ContextVar('serialization_timer', default=None)
+in_serializer = contextvars.ContextVar('in_serializer', default=False)
+
+
+class SerializationTimer:
+    def __init__(self):
+        self.duration = 0.0
+
+
+class TimedSerializerMixin:
+    """Count the time spent in to_representation() as the request's serialization time"""
+
+    def to_representation(self, instance):
+        timer = serialization_timer.get()
+        if timer is None or in_serializer.get():
+            return super().to_representation(instance)
+
+        token = in_serializer.set(True)
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timer.duration += time.perf_counter() - start
+            in_serializer.reset(token)
+
+
+class QueryRecorder:
+    """Database execute wrapper counting and timing queries (and keeping their SQL when sampled)"""
+
+    def __init__(self, sample_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter() if sample_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            if self.statements is not None:
+                # Parameters are separate, so repeats of one statement share its text
+                self.statements[sql] += 1
+
+    def repeated_statements(self):
+        return [
+            {'sql': sql, 'count': count}
+            for sql, count in self.statements.most_common(TOP_REPEATED_STATEMENTS)
+            if count > 1
+        ]
+
+
+class Metrics:
+    """Request counters and histograms for this process, by method, route and status"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.duration_sum = defaultdict(float)
+        self.duration_count = Counter()
+        self.queries = Counter()
+        self.query_seconds = defaultdict(float)
+
+    def observe(self, method, route, status, duration, queries, query_seconds):
+        labels = (method, route)
+        with self.lock:
+            self.requests[(method, route, str(status))] += 1
+            buckets = self.duration_buckets[labels]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+            self.duration_sum[labels] += duration
+            self.duration_count[labels] += 1
+            self.queries[labels] += queries
+            self.query_seconds[labels] += query_seconds
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            family('http_requests_total', 'counter', 'Requests served.')
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{format_labels(method=method, route=route, status=status)} {count}')
+
+            family('http_request_duration_seconds', 'histogram', 'Time spent handling requests.')
+            for (method, route), buckets in sorted(self.duration_buckets.items()):
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(
+                        f'http_request_duration_seconds_bucket{format_labels(method=method, route=route, le=str(bound))} {count}'
+                    )
+                count = self.duration_count[(method, route)]
+                lines.append(f'http_request_duration_seconds_bucket{format_labels(method=method, route=route, le="+Inf")} {count}')
+                lines.append(f'http_request_duration_seconds_sum{format_labels(method=method, route=route)} {self.duration_sum[(method, route)]}')
+                lines.append(f'http_request_duration_seconds_count{format_labels(method=method, route=route)} {count}')
+
+            family('db_queries_total', 'counter', 'Database queries run while handling requests.')
+            for (method, route), count in sorted(self.queries.items()):
+                lines.append(f'db_queries_total{format_labels(method=method, route=route)} {count}')
+
+            family('db_query_duration_seconds_total', 'counter', 'Time spent in database queries while handling requests.')
+            for (method, route), seconds in sorted(self.query_seconds.items()):
+                lines.append(f'db_query_duration_seconds_total{format_labels(method=method, route=route)} {seconds}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def watch_connections(stack, recorder):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+
+
+def format_labels(**labels):
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+metrics = Metrics()
+
+
+class InstrumentationMiddleware:
+    """
+    Time every request and count its queries. Keep it first in MIDDLEWARE so
+    the numbers cover the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = self.recorder()
+        timer = SerializationTimer()
+        token = serialization_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                watch_connections(stack, recorder)
+                response = self.get_response(request)
+        finally:
+            serialization_timer.reset(token)
+        return self.finish(request, response, recorder, timer, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        recorder = self.recorder()
+        timer = SerializationTimer()
+        token = serialization_timer.set(timer)
+        start = time.perf_counter()
+        # Under ASGI the ORM runs in the request's sync thread, whose
+        # connections are not this (event loop) thread's
+        stack = ExitStack()
+        await sync_to_async(watch_connections)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            serialization_timer.reset(token)
+        return self.finish(request, response, recorder, timer, time.perf_counter() - start)
+
+    @staticmethod
+    def recorder():
+        return QueryRecorder(sample_sql=SQL_SAMPLE_RATE > 0 and random.random() < SQL_SAMPLE_RATE)
+
+    def finish(self, request, response, recorder, timer, total):
+        render = getattr(request, '_render_duration', 0.0)
+        serialize = timer.duration
+        # Serializers run concurrently by an async view can add up to more
+        # than the wall time they took
+        view = max(total - render - serialize, 0.0)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"',
+            f'view;dur={view * 1000:.1f}',
+            f'serialize;dur={serialize * 1000:.1f}',
+            f'render;dur={render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+        match = request.resolver_match
+        # Routes (not paths) keep the metric labels bounded
+        route = match.route if match else 'unmatched'
+        metrics.observe(request.method, route, response.status_code, total, recorder.count, recorder.duration)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 1),
+            'view_ms': round(view * 1000, 1),
+            'serialize_ms': round(serialize * 1000, 1),
+            'render_ms': round(render * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+        }
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(record))
+        if recorder.statements is not None and total * 1000 >= SLOW_REQUEST_MS:
+            logger.warning(json.dumps({
+                **record,
+                'event': 'slow_request',
+                'repeated_sql': recorder.repeated_statements(),
+            }))
+
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF renders the response; the callback runs
+        # once rendering is done
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._render_duration = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint for `Authorization: Bearer <METRICS_TOKEN>`
+    or a logged-in staff user; nobody else, and without a token only staff
+    """
+    authorized = (
+        bool(METRICS_TOKEN) and request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}'
+        or request.user.is_staff
+    )
+    if not authorized:
+        return HttpResponse(status=401 if METRICS_TOKEN else 403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
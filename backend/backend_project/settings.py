@@ -41,9 +41,12 @@ INSTALLED_APPS = [
     "apps.expenses.apps.ExpensesConfig",
     "apps.users.apps.UsersConfig",
     "apps.groups.apps.GroupsConfig",
+    "apps.sync.apps.SyncConfig",
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    "backend_project.instrumentation.InstrumentationMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -54,7 +57,11 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+from corsheaders.defaults import default_headers
+
 CORS_ALLOW_ALL_ORIGINS = True
+# Retried writes carry an Idempotency-Key (see apps.expenses.idempotency)
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 
 from datetime import timedelta
 
@@ -109,6 +116,15 @@ DATABASES = {
 }
 
 
+# Cache
+# Defaults to an in-process cache; set CACHE_URL to share it between workers
+# (e.g. filecache:///var/tmp/splitwise_cache). Dashboard entries are keyed by
+# per-user versions kept in the database, so a per-process cache never serves
+# stale data, it is only less effective.
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -177,14 +193,33 @@ LOGGING = {
         },
     },
     'loggers': {
+        'apps': {
+            'handlers': ['console'],
+            'level': env('APP_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
         'apps.users.services': {
             'handlers': ['console'],
             'level': 'INFO',
             'propagate': False,
         },
+        'backend_project.instrumentation': {
+            'handlers': ['console'],
+            # Per-request lines are DEBUG; slow requests are logged as warnings
+            'level': env('REQUEST_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
     },
 }
 
+# Request instrumentation (see backend_project.instrumentation)
+# Share of requests whose SQL is kept to report repeated statements; 0 turns it off
+INSTRUMENTATION_SQL_SAMPLE_RATE = env.float('INSTRUMENTATION_SQL_SAMPLE_RATE', default=0.0)
+INSTRUMENTATION_SLOW_REQUEST_MS = env.int('INSTRUMENTATION_SLOW_REQUEST_MS', default=500)
+# Scrapers of /api/_metrics send "Authorization: Bearer <token>"; when it is
+# empty only logged-in staff users can read the metrics
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
 # Email Configuration
 # For production/testing with real email (enabled):
 # EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
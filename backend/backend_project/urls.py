@@ -17,9 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('apps.users.urls')),
     path('api/groups/', include('apps.groups.urls')),
     path('api/expenses/', include('apps.expenses.urls')),
+    path('api/sync/', include('apps.sync.urls')),
+    path('api/_metrics', metrics_view, name='metrics'),
 ]